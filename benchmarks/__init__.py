@@ -0,0 +1 @@
+'''benchmarks of the app and of the preprocessing, see the module docstrings'''
@@ -0,0 +1,117 @@
+'''startup time of the app: cold start and warm reruns
+
+Each repeat starts a fresh interpreter (cold caches and imports), runs the
+entry point once with streamlit's ``AppTest`` and reruns it a few times in
+the same process (warm: the modules are imported and the cached loaders are
+filled). The medians are compared with a stored baseline; the script exits
+with status 1 when one of them is slower than the baseline by more than the
+tolerance, or when there is no baseline. Timings depend on the machine, so no
+baseline is versioned: it is saved with ``--save-baseline`` on the machine
+running the checks.
+
+Variables
+---------
+BASELINE_PATH : medians of the reference run
+TOLERANCE : allowed slowdown relative to the baseline
+
+Examples
+--------
+    $ python -m benchmarks.startup                      # compare with the baseline
+    $ python -m benchmarks.startup --save-baseline      # after an intended change
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baselines', 'startup.json')
+TOLERANCE = 0.25
+ENTRY_POINT = 'PT+Migros+Comp+Pop.py'
+
+# run in a fresh interpreter, prints one JSON line
+_PROBE = '''
+import json, sys, time
+t0 = time.perf_counter()
+import src.app
+t_import = time.perf_counter() - t0
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=float(sys.argv[3]))
+t0 = time.perf_counter()
+app.run()
+cold = time.perf_counter() - t0
+warm = []
+for _ in range(int(sys.argv[2])):
+    t0 = time.perf_counter()
+    app.run()
+    warm.append(time.perf_counter() - t0)
+print(json.dumps({'import_s': t_import, 'cold_s': cold, 'warm_s': warm, 'errors': [str(e.value) for e in app.exception]}))
+'''
+
+
+def measure(entry_point=ENTRY_POINT, reruns=5, timeout=300.0):
+    '''Timings of one fresh interpreter
+
+    Returns
+    -------
+    dict
+        ``import_s`` (import of ``src.app``), ``cold_s`` (first run),
+        ``warm_s`` (list, the reruns) and ``errors`` (exceptions of the app)
+    '''
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-c', _PROBE, entry_point, str(reruns), str(timeout)],
+                            cwd=root, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(runs):
+    '''dict: medians over the repeats of the import, cold and warm times'''
+    return {
+        'import_s': statistics.median(r['import_s'] for r in runs),
+        'cold_s': statistics.median(r['cold_s'] for r in runs),
+        'warm_s': statistics.median(t for r in runs for t in r['warm_s']),
+    }
+
+
+def regressions(summary, baseline, tolerance=TOLERANCE):
+    '''list of str: timings slower than the baseline by more than ``tolerance``'''
+    return ['%s: %.3f s (baseline %.3f s)' % (key, summary[key], baseline[key])
+            for key in summary if key in baseline and summary[key] > baseline[key] * (1 + tolerance)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cold-start and warm-rerun time of the app')
+    parser.add_argument('--entry-point', default=ENTRY_POINT)
+    parser.add_argument('--repeats', type=int, default=3, help='fresh interpreters')
+    parser.add_argument('--reruns', type=int, default=5, help='warm reruns per interpreter')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    args = parser.parse_args(argv)
+
+    runs = [measure(args.entry_point, args.reruns) for _ in range(args.repeats)]
+    errors = sorted({e for r in runs for e in r['errors']})
+    if errors:
+        print('the app raised: %s' % '; '.join(errors))
+        return 1
+    summary = summarize(runs)
+    print(json.dumps(summary))
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(summary, f, indent=1)
+        return 0
+    if not os.path.exists(args.baseline):
+        print('no baseline at %s, run with --save-baseline' % args.baseline)
+        return 1
+    with open(args.baseline) as f:
+        slower = regressions(summary, json.load(f), args.tolerance)
+    for line in slower:
+        print('slower than the baseline: ' + line)
+    return 1 if slower else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
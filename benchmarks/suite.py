@@ -0,0 +1,208 @@
+'''benchmark of the map and analysis paths on synthetic datasets
+
+For each size of ``benchmarks.synthetic.SIZES`` the stages of the app are
+timed on the synthetic zones and stores, with the functions the app uses:
+
+- ``load``: read the zones GeoPackage (``src.zones.load_zones``),
+- ``region_filter``: read only the zones of a bounding box (a quarter of the
+  country) through the spatial index of the GeoPackage,
+- ``reproject``: LV95 to WGS84,
+- ``stores``: read the store CSV, classify the brands and assign every store
+  to its zone (``src.spatial_index.ZoneIndex``),
+- ``features``: store proximity and suitability score of every zone,
+- ``payload``: write the GeoJSON payload of the zones for zoom 8
+  (``src.payloads.write_payload``, done once per region and zoom by the app),
+  whose file size is reported as ``payload_bytes``,
+- ``figure``: base map with the PT layer referencing the payload by URL
+  (``src.maps.PT_trace``), the competitor and Migros layers (``white-bg``
+  style: no map tiles, no network), as built by the app on every rerun,
+- ``serialize``: plotly JSON of the figure, whose size is reported as
+  ``figure_bytes``.
+
+``figure_embedded`` times the same figure with the geometry of the zones
+embedded in the PT trace (``src.maps.add_PT``), the way the app drew it before
+the payloads. It is reported for comparison only, not checked against the
+baseline.
+
+The results themselves are summed up in ``checksum``: a hash of the zone of
+every store and of the scores (rounded to ``CHECKSUM_DIGITS`` decimals), so
+that a change which makes a stage faster by computing something else is
+caught.
+
+Timings are the median of ``--repeats`` runs. They are compared with a
+stored baseline (per size and stage): the suite exits with status 1 if a
+stage is slower, or a payload larger, than the baseline by more than the
+tolerance, if the checksum differs, or if there is no baseline for a size.
+Timings depend on the machine, so no baseline is versioned: it is saved
+with ``--save-baseline`` on the machine running the checks.
+
+Variables
+---------
+BASELINE_PATH : results of the reference run
+TOLERANCE : allowed slowdown relative to the baseline
+STAGES : stages checked against the baseline
+REPORT_STAGES : stages reported only
+CHECKSUM_DIGITS : decimals of the scores hashed in the checksum
+
+Examples
+--------
+    $ python -m benchmarks.suite --sizes 10 1000 10000
+    $ python -m benchmarks.suite --save-baseline
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+from benchmarks.synthetic import CH_BBOX, DATA_DIR, SIZES, make_dataset
+from src.perf import Recorder
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baselines', 'suite.json')
+TOLERANCE = 0.25
+CHECKSUM_DIGITS = 6
+STAGES = ['load', 'region_filter', 'reproject', 'stores', 'features', 'payload', 'figure', 'serialize']
+REPORT_STAGES = ['figure_embedded']
+
+
+def run_stages(zones_path, stores_path, recorder, payload_dir):
+    '''Run every stage once, timed by ``recorder``
+
+    Parameters
+    ----------
+    zones_path, stores_path : str
+        synthetic dataset
+    recorder : src.perf.Recorder
+    payload_dir : str
+        directory the payload is written to
+
+    Returns
+    -------
+    dict
+        ``payload_bytes``, ``figure_bytes`` and ``checksum``
+    '''
+    import numpy as np
+    import pandas as pd
+
+    from src.maps import PT_trace, add_COMP, add_MIGROS, add_PT, create_base_map, finish_layout
+    from src.payloads import PAYLOAD_URL, write_payload
+    from src.proximity import zone_features
+    from src.scoring import SuitabilityScorer, feature_table
+    from src.spatial_index import ZoneIndex
+    from src.stores import classify_brands, split_brands
+    from src.zones import load_zones
+
+    with recorder.span('load') as counts:
+        zones = load_zones(zones_path)
+        counts['rows'] = len(zones)
+    (xmin, ymin, xmax, ymax) = CH_BBOX
+    with recorder.span('region_filter') as counts:
+        counts['rows'] = len(load_zones(zones_path, bbox=(xmin, ymin, (xmin + xmax) / 2, (ymin + ymax) / 2)))
+    with recorder.span('reproject'):
+        zones_wgs84 = zones.to_crs('EPSG:4326')
+    with recorder.span('stores') as counts:
+        stores = pd.read_csv(stores_path, dtype={'Place ID': str})
+        stores['Brand'] = classify_brands(stores['Name'])
+        stores['zone'] = ZoneIndex.from_zones(zones).zone_of(stores['Longitude'], stores['Latitude'])
+        (migros, comp) = split_brands(stores)
+        counts['rows'] = len(stores)
+    with recorder.span('features'):
+        table = feature_table(zones_wgs84, zone_features(zones_wgs84, migros, comp))
+        scores = SuitabilityScorer(table).score()
+    path = os.path.join(payload_dir, 'zones_z8.geojson')
+    with recorder.span('payload') as payload:
+        write_payload(path, zones_wgs84, 8)
+        payload['payload_bytes'] = os.path.getsize(path)
+    center = {'lat': float(zones_wgs84.total_bounds[[1, 3]].mean()), 'lon': float(zones_wgs84.total_bounds[[0, 2]].mean())}
+    with recorder.span('figure'):
+        figure = create_base_map(center, 7, style='white-bg')
+        figure.add_trace(PT_trace('%s/%s' % (PAYLOAD_URL, os.path.basename(path)), [str(i) for i in zones_wgs84.index],
+                                  zones_wgs84['OeV_Erreichb_EW']))
+        figure = finish_layout(add_MIGROS(add_COMP(figure, comp), migros))
+    with recorder.span('serialize') as counts:
+        counts['figure_bytes'] = len(figure.to_json())
+    with recorder.span('figure_embedded'):
+        finish_layout(add_MIGROS(add_COMP(add_PT(create_base_map(center, 7, style='white-bg'), zones_wgs84), comp), migros))
+    h = hashlib.sha256(np.ascontiguousarray(stores['zone'], dtype=np.int64).tobytes())
+    h.update(np.round(scores.to_numpy(dtype=np.float64), CHECKSUM_DIGITS).tobytes())
+    return {'payload_bytes': payload['payload_bytes'], 'figure_bytes': counts['figure_bytes'],
+            'checksum': h.hexdigest()[:16]}
+
+
+def run_size(n, repeats=3, data_dir=DATA_DIR):
+    '''Median time of every stage, and payload sizes, for one dataset size
+
+    Returns
+    -------
+    dict
+        seconds per stage (``STAGES`` and ``REPORT_STAGES``), ``payload_bytes``,
+        ``figure_bytes`` and ``checksum``
+    '''
+    (zones_path, stores_path) = make_dataset(n, data_dir=data_dir)
+    recorder = Recorder()
+    with tempfile.TemporaryDirectory() as payload_dir:
+        runs = [run_stages(zones_path, stores_path, recorder, payload_dir) for _ in range(repeats)]
+    seconds = {row['stage']: row['p50_s'] for row in recorder.summary()}
+    result = {stage: seconds[stage] for stage in STAGES + REPORT_STAGES}
+    result.update(runs[-1])
+    return result
+
+
+def regressions(results, baseline, tolerance=TOLERANCE):
+    '''list of str: (size, stage) slower or larger than the baseline by more than ``tolerance``,
+    sizes whose checksum differs from the baseline or which have no baseline (``REPORT_STAGES`` are not checked)'''
+    slower = []
+    for (size, result) in results.items():
+        if size not in baseline:
+            slower.append('%s zones: no baseline, run with --save-baseline' % size)
+            continue
+        for (key, value) in result.items():
+            if key in REPORT_STAGES:
+                continue
+            reference = baseline[size].get(key)
+            if key == 'checksum':
+                if value != reference:
+                    slower.append('%s zones: results differ, checksum %s (baseline %s)' % (size, value, reference))
+            elif reference is not None and value > reference * (1 + tolerance):
+                slower.append('%s zones, %s: %.4g (baseline %.4g)' % (size, key, value, reference))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark of the app stages on synthetic datasets')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for n in args.sizes:
+        results[str(n)] = run_size(n, args.repeats, args.data_dir)
+        print(json.dumps(dict(results[str(n)], size=n)))
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1)
+        return 0
+    if not os.path.exists(args.baseline):
+        print('no baseline at %s, run with --save-baseline' % args.baseline)
+        return 1
+    with open(args.baseline) as f:
+        slower = regressions(results, json.load(f), args.tolerance)
+    for line in slower:
+        print('regression: ' + line)
+    return 1 if slower else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
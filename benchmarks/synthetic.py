@@ -0,0 +1,116 @@
+'''synthetic national-scale datasets with the schemas of the real inputs
+
+- zones: a GeoPackage with the layer and CRS of ``erreichbarkeit-oev_2056.gpkg``
+  (``src.zones``): square zones in LV95 tiling the bounding box of
+  Switzerland, with an ``OeV_Erreichb_EW`` decreasing away from a few
+  "cities" plus noise;
+- stores: a CSV with the columns of the store exports (``Place ID``,
+  ``Name``, ``Latitude``, ``Longitude``, ``Address``), clustered around the
+  same cities, about one in six of them a Migros.
+
+Everything is drawn from a seeded generator: the same size and seed give the
+same files, so that timings and payload sizes can be compared between runs.
+
+Variables
+---------
+SIZES : numbers of zones / stores of the benchmark datasets
+CH_BBOX : bounding box of Switzerland in LV95
+DATA_DIR : where the datasets are written
+'''
+
+import math
+import os
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from pyproj import Transformer
+
+from src.zones import ZONES_CRS, ZONES_LAYER
+
+SIZES = [10, 1000, 10000, 100000]
+CH_BBOX = (2485000.0, 1075000.0, 2834000.0, 1296000.0)
+DATA_DIR = './data/benchmarks'
+
+_NAMES = ['Migros', 'Coop', 'Denner', 'SPAR', 'VOLG', 'Lidl', 'Aldi']
+_NAME_P = [0.16, 0.3, 0.2, 0.1, 0.12, 0.06, 0.06]
+
+
+def _cities(rng, n=12):
+    (xmin, ymin, xmax, ymax) = CH_BBOX
+    return np.column_stack([rng.uniform(xmin, xmax, n), rng.uniform(ymin, ymax, n)])
+
+
+def synthetic_zones(n, seed=0):
+    '''``n`` square zones tiling the bounding box of Switzerland
+
+    Returns
+    -------
+    geopandas.GeoDataFrame
+        ``OeV_Erreichb_EW`` and the square geometries, in LV95
+    '''
+    rng = np.random.default_rng(seed)
+    (xmin, ymin, xmax, ymax) = CH_BBOX
+    cols = max(1, int(math.ceil(math.sqrt(n * (xmax - xmin) / (ymax - ymin)))))
+    rows = int(math.ceil(n / cols))
+    (w, h) = ((xmax - xmin) / cols, (ymax - ymin) / rows)
+    i = np.arange(n)
+    (x0, y0) = (xmin + (i % cols) * w, ymin + (i // cols) * h)
+    geometry = shapely.box(x0, y0, x0 + w, y0 + h)
+    centres = np.column_stack([x0 + w / 2, y0 + h / 2])
+    d = np.min(np.hypot(*(centres[:, None, :] - _cities(rng)[None, :, :]).transpose(2, 0, 1)), axis=1)
+    access = 60000 * np.exp(-d / 15000.0) + rng.gamma(2.0, 500.0, n)
+    return gpd.GeoDataFrame({'OeV_Erreichb_EW': access.round(1)}, geometry=geometry, crs=ZONES_CRS)
+
+
+def synthetic_stores(n, seed=0):
+    '''``n`` stores clustered around the cities of ``synthetic_zones``
+
+    Returns
+    -------
+    pandas.DataFrame
+        ``Place ID``, ``Name``, ``Latitude``, ``Longitude``, ``Address``
+    '''
+    rng = np.random.default_rng(seed)
+    cities = _cities(rng)
+    rng = np.random.default_rng(seed + 1)
+    (xmin, ymin, xmax, ymax) = CH_BBOX
+    around = cities[rng.integers(0, len(cities), n)] + rng.normal(0, 8000.0, (n, 2))
+    x = np.clip(around[:, 0], xmin, xmax)
+    y = np.clip(around[:, 1], ymin, ymax)
+    (lon, lat) = Transformer.from_crs(ZONES_CRS, 'EPSG:4326', always_xy=True).transform(x, y)
+    brand = rng.choice(_NAMES, n, p=_NAME_P)
+    return pd.DataFrame({
+        'Place ID': ['SYN%08d' % k for k in range(n)],
+        'Name': ['%s Filiale %d' % (b, k) for (k, b) in enumerate(brand)],
+        'Latitude': lat,
+        'Longitude': lon,
+        'Address': ['Teststrasse %d' % (k % 200 + 1) for k in range(n)],
+    })
+
+
+def dataset_paths(n, seed=0, data_dir=DATA_DIR):
+    '''(str, str): paths of the zones GeoPackage and of the stores CSV of a size'''
+    stem = os.path.join(data_dir, 'synthetic_%d_s%d' % (n, seed))
+    return stem + '.gpkg', stem + '_stores.csv'
+
+
+def make_dataset(n, seed=0, data_dir=DATA_DIR):
+    '''Write the zones and stores of a size, unless they exist
+
+    Returns
+    -------
+    (str, str)
+        see ``dataset_paths``
+    '''
+    (zones_path, stores_path) = dataset_paths(n, seed, data_dir)
+    os.makedirs(data_dir, exist_ok=True)
+    if not os.path.exists(zones_path):
+        tmp = zones_path[:-len('.gpkg')] + '.tmp.gpkg'
+        synthetic_zones(n, seed).to_file(tmp, layer=ZONES_LAYER, driver='GPKG', engine='pyogrio')
+        os.replace(tmp, zones_path)
+    if not os.path.exists(stores_path):
+        synthetic_stores(n, seed).to_csv(stores_path + '.tmp', index=False)
+        os.replace(stores_path + '.tmp', stores_path)
+    return zones_path, stores_path
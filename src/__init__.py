@@ -0,0 +1,5 @@
+'''helper modules for the Migros store-placement app
+
+Functions and classes used by the streamlit entry points at the root of the
+repository (``PT+Migros+Comp+Pop.py``, ...).
+'''
@@ -0,0 +1,626 @@
+'''Streamlit app: where should the next Migros stores go?
+
+The scripts at the root of the repository are thin entry points calling
+``main``. Besides streamlit, only the artifact and payload helpers which
+every run needs (``src.preprocess``, ``src.payloads``, with geopandas) are
+imported with this module: the other heavy libraries (plotly, scikit-learn,
+SciPy, H3, the GTFS reader) are imported by the functions that need them, so
+that a layer which is not checked costs nothing, and the cached loaders keep
+the data of a region between the reruns and the sessions.
+
+Variables
+---------
+LAYERS : label of each layer in the sidebar
+DRAW_ORDER : order in which the checked layers are drawn
+LAYER_DATA : data sources of each layer, loaded concurrently before its trace is built
+LAYER_TIMEOUT : seconds after which a layer missing in the map is reported
+METRICS_FILE : Prometheus text of the stage timings, rewritten after every run
+
+Functions
+---------
+main : run the app
+
+Examples
+--------
+    $ streamlit run PT+Migros+Comp+Pop.py
+'''
+
+import datetime
+import os
+import threading
+import time
+from functools import partial
+
+import streamlit as st
+
+from src.payloads import grid_payload_path, grid_payload_url, payload_path, payload_url
+from src.perf import RECORDER, span, timed
+from src.preprocess import source_checksum
+
+LAYERS = {
+    'PT': 'Accessibility by public tranport',
+    'POP': 'Population density',
+    'COMP': 'Competitors',
+    'MIGROS': 'Migros stores',
+    'TOP': 'Best candidate zones',
+    'NEW': 'Proposed new stores',
+    'ISO': 'Stores reachable by public transport (5/10/15 min)',
+    'SHARE': 'Migros market share (Huff model)',
+}
+DRAW_ORDER = ['ISO', 'PT', 'POP', 'SHARE', 'COMP', 'MIGROS', 'TOP', 'NEW']
+LAYER_DATA = {'PT': ['zones', 'metadata'], 'POP': ['zones', 'metadata'], 'COMP': ['stores'], 'MIGROS': ['stores'],
+              'TOP': ['zones', 'stores'], 'NEW': ['zones', 'stores'], 'ISO': ['stores'], 'SHARE': ['zones', 'stores']}
+LAYER_TIMEOUT = 60.0
+METRICS_FILE = os.environ.get('MIGROS_METRICS_FILE')  # e.g. in the directory of the node exporter textfile collector
+
+
+# Data of a region, loaded once and shared read-only between the runs and sessions
+############################################
+@st.cache_resource
+def load_registry():
+    from src.regions import RegionRegistry
+    return RegionRegistry()  # zone ids per canton / district / municipality, built once and stored next to the GeoPackage
+
+@st.cache_resource
+def load_data(region):
+    from src.population import load_population
+    from src.preprocess import load_artifact
+    with span('load.zones') as counts:
+        df = load_artifact(region)  # preprocessed zones of the region, already simplified and in WGS84 (see src/preprocess.py)
+        counts['rows'] = len(df)
+    with span('load.population'):
+        population = load_population(region, df, source_checksum())  # zonal sum of the hectare grid, cached next to the artifact
+    if population is not None:
+        df['population'] = population
+        df['population_density'] = population / df.to_crs('EPSG:2056').area * 1e6  # inhabitants per km2
+    return df  # memory-mapped and shared read-only between the sessions: do not modify it in place
+
+# centre, bounds, fitted zoom and value ranges of the region, computed once with the artifact (src/metadata.py)
+@st.cache_resource
+def get_metadata(region):
+    from src.metadata import value_ranges
+    from src.preprocess import load_metadata
+    AREA = load_data(region)
+    meta = load_metadata(region)
+    meta['ranges'].update(value_ranges(AREA[[c for c in ['population', 'population_density'] if c in AREA.columns]]))
+    return meta
+
+# stores of the region and around it, from the store catalog (src/stores.py)
+@st.cache_data
+def load_store_data(region):
+    from src.stores import load_stores
+    with span('load.stores') as counts:
+        (MIGROS, COMP) = load_stores(region, load_data(region))
+        counts['rows'] = len(MIGROS) + len(COMP)
+    return MIGROS, COMP
+
+# spatial index of the zones and per-tile cache of the visible features (src/lod.py)
+@st.cache_resource
+def get_index(region):
+    from src.spatial_index import load_index
+    return load_index(region, load_data(region), source_checksum())
+
+# keyed by the dataset version: the tiles hold positions into the zone and store tables of that version
+@st.cache_resource
+def get_tile_cache(region, version):
+    from src.lod import TileCache
+    return TileCache()
+
+# processed tables and traces shared with the other processes and replicas (src/cache.py)
+@st.cache_resource
+def get_layer_cache():
+    from src.cache import LayerCache
+    return LayerCache()
+
+@st.cache_resource(ttl=60)
+def get_dataset_version():
+    from src.cache import dataset_version
+    from src.isochrones import GTFS_DIR, feed_files
+    from src.population import POPULATION_CSV, POPULATION_TIF
+    from src.routing import OSM_PATH
+    from src.stores import COMP_CSV, MIGROS_CSV, STORES_PATH
+    return dataset_version(inputs=[STORES_PATH, MIGROS_CSV, COMP_CSV, POPULATION_CSV, POPULATION_TIF, OSM_PATH]
+                           + feed_files(GTFS_DIR))
+
+# junction graph of the OSM extract, parsed once and stored next to it (src/routing.py)
+@st.cache_resource
+def get_road_graph():
+    from src.routing import load_graph
+    return load_graph()
+
+# Store proximity per zone, computed once per region and radius
+# travel: (mode, minutes) to count the stores by travel time on the road network instead, or None
+@st.cache_resource
+def load_features(region, radius_km, travel=None):
+    from src.proximity import zone_features
+    from src.routing import routed_features
+    (MIGROS, COMP) = load_store_data(region)
+    build = timed('transform.features')(zone_features)
+    features = get_layer_cache().get(get_dataset_version(), region, 'features', {'radius_km': radius_km},
+                                     lambda: build(load_data(region), MIGROS, COMP, radius_km))
+    if travel is None:
+        return features
+    (mode, minutes) = travel
+    route = timed('transform.routing')(routed_features)
+    routed = get_layer_cache().get(get_dataset_version(), region, 'routed', {'mode': mode, 'minutes': minutes},
+                                   lambda: route(region, load_data(region), MIGROS, COMP, mode, source_checksum(),
+                                                 minutes, get_road_graph()))
+    return features.assign(**{column: routed[column] for column in routed.columns})
+
+# the normalized features are kept, changing a weight only updates the score
+@st.cache_resource
+def get_scorer(region, radius_km, travel=None):
+    from src.scoring import SuitabilityScorer, feature_table
+    return SuitabilityScorer(feature_table(load_data(region), load_features(region, radius_km, travel)))
+
+# hexagonal grid: zone attributes interpolated by area and store proximity at the centres of the cells,
+# cached per region, resolution and radius (src/hexgrid.py)
+@st.cache_resource
+def load_grid(region, res, radius_km=2.0):
+    from src.hexgrid import cell_points, hex_features, hex_grid
+    def build():
+        grid = hex_grid(region, load_data(region), source_checksum(), res)
+        (lat, lon) = cell_points(grid.index).T
+        return grid.join(hex_features(grid, *load_store_data(region), radius_km)).assign(lat=lat, lon=lon)
+    return get_layer_cache().get(get_dataset_version(), region, 'grid', {'res': res, 'radius_km': radius_km},
+                                 timed('transform.grid')(build))
+
+# the cells of the grid scored like the zones, to rank sites inside the zones
+@st.cache_resource
+def get_grid_scorer(region, res, radius_km):
+    from src.scoring import SuitabilityScorer, feature_table
+    return SuitabilityScorer(feature_table(load_grid(region, res, radius_km)))
+
+@st.cache_data
+def load_placement(region, k, radius_km, mode):
+    from src.placement import place_stores
+    from src.proximity import store_points, zone_points
+    AREA = load_data(region)
+    (MIGROS, _) = load_store_data(region)
+    demand = AREA['population'] if 'population' in AREA.columns else AREA['OeV_Erreichb_EW']
+    return place_stores(zone_points(AREA), demand, store_points(MIGROS), k, radius_km, mode, index=AREA.index)
+
+# expected market share of Migros per zone and demand captured by every store (src/huff.py)
+@st.cache_resource
+def get_huff_model(region):
+    import pandas as pd
+    from src.huff import HuffModel
+    from src.proximity import zone_points
+    AREA = load_data(region)
+    (MIGROS, COMP) = load_store_data(region)
+    demand = AREA['population'] if 'population' in AREA.columns else AREA['OeV_Erreichb_EW']
+    stores = pd.concat([MIGROS, COMP], ignore_index=True)
+    with span('transform.huff', rows=len(AREA) * len(stores)):
+        return HuffModel(zone_points(AREA), stores, demand.fillna(0.0), index=AREA.index)
+
+# base features of the region, a scenario only recomputes the zones around its changed stores (src/scenarios.py)
+@st.cache_resource
+def get_scenario_engine(region, radius_km):
+    from src.scenarios import ScenarioEngine
+    AREA = load_data(region)
+    (MIGROS, COMP) = load_store_data(region)
+    demand = AREA['population'] if 'population' in AREA.columns else None
+    return ScenarioEngine(AREA, MIGROS, COMP, radius_km, demand, features=load_features(region, radius_km))
+
+
+# Layers: traces built from the data of a region (src/maps.py), at the level of detail of the view
+############################################
+# geometry, ids and values of a choropleth layer, for the visible zones or the hexagons
+# (for the zones, the color range is the one of the whole region so that it does not change with the view)
+# the geometry is not embedded: the browser loads the prebuilt GeoJSON (src/payloads.py) by URL,
+# simplified for the zoom bucket (zones) or one per resolution (hexagons); only the features of the
+# visible tiles (all the features with tiles None) get a value
+def choropleth_data(region, column, res, bucket, tiles):
+    import numpy as np
+    if res is None:
+        AREA = load_data(region)
+        ids = AREA.index.to_numpy() if tiles is None else \
+            get_tile_cache(region, get_dataset_version()).collect('zones', bucket, tiles, get_index(region).zones_within)
+        url = payload_url(region, AREA, source_checksum(), zoom=bucket)
+        # file_bytes: size of the payload file, fetched once per zoom bucket and then cached by the browser
+        RECORDER.add('payload.geojson', features=len(ids), file_bytes=os.path.getsize(payload_path(region, source_checksum(), bucket)))
+        return url, ids, AREA.loc[ids, column]
+    GRID = load_grid(region, res)
+    rows = np.arange(len(GRID)) if tiles is None else \
+        get_tile_cache(region, get_dataset_version()).collect(f'hex{res}', bucket, tiles,
+                                                              in_tile(GRID['lat'].to_numpy(), GRID['lon'].to_numpy()))
+    url = grid_payload_url(region, GRID, source_checksum(), res)
+    RECORDER.add('payload.hexagons', features=len(rows), file_bytes=os.path.getsize(grid_payload_path(region, source_checksum(), res)))
+    return url, GRID.index[rows], GRID[column].iloc[rows]
+
+# positions of the points in a tile, for TileCache.collect
+def in_tile(lat, lon):
+    import numpy as np
+    def rows(bounds):
+        return np.flatnonzero((lon >= bounds[0]) & (lon < bounds[2]) & (lat >= bounds[1]) & (lat < bounds[3]))
+    return rows
+
+def choropleth_range(region, column, res):
+    return get_metadata(region)['ranges'][column] if res is None else None
+
+def build_PT(region, res, bucket, tiles):
+    from src.maps import PT_trace
+    return PT_trace(*choropleth_data(region, 'OeV_Erreichb_EW', res, bucket, tiles),
+                    zrange=choropleth_range(region, 'OeV_Erreichb_EW', res))
+
+def build_POP(region, res, bucket, tiles):
+    from src.maps import POP_trace
+    return POP_trace(*choropleth_data(region, 'population_density', res, bucket, tiles),
+                     zrange=choropleth_range(region, 'population_density', res))
+
+# stores of the visible tiles (all of them with tiles None), clustered below CLUSTER_ZOOM: (lat, lon, text, marker size)
+def store_markers(region, layer, stores, bucket, tiles):
+    import numpy as np
+    from src.lod import CLUSTER_ZOOM, cluster_points
+    lat = stores['Latitude'].to_numpy()
+    lon = stores['Longitude'].to_numpy()
+    rows = np.arange(len(stores)) if tiles is None else \
+        get_tile_cache(region, get_dataset_version()).collect(layer, bucket, tiles, in_tile(lat, lon))
+    if bucket >= CLUSTER_ZOOM or len(rows) == 0:
+        return lat[rows], lon[rows], stores['Name'].to_numpy()[rows], 10
+    c_lat, c_lon, size, _ = cluster_points(lat[rows], lon[rows], bucket)
+    return c_lat, c_lon, [f'{n} stores' for n in size], 8 + 4 * np.sqrt(size)
+
+def build_COMP(region, bucket, tiles):
+    from src.maps import COMP_trace
+    return COMP_trace(*store_markers(region, 'COMP', load_store_data(region)[1], bucket, tiles))
+
+def build_MIGROS(region, bucket, tiles):
+    from src.maps import MIGROS_trace
+    return MIGROS_trace(*store_markers(region, 'MIGROS', load_store_data(region)[0], bucket, tiles))
+
+def build_TOP(region, weights, k, radius_km, travel=None):
+    from src.maps import TOP_trace
+    from src.proximity import zone_points
+    top = get_scorer(region, radius_km, travel).top_k(k, dict(weights))
+    return TOP_trace(zone_points(load_data(region).loc[top.index]), top)
+
+def build_NEW(region, k, radius_km, mode):
+    from src.maps import NEW_trace
+    return NEW_trace(load_placement(region, k, radius_km, mode))
+
+def build_ISO(region, departure, date):
+    import pandas as pd
+    from src.isochrones import store_catchments
+    from src.maps import ISO_trace
+    (MIGROS, COMP) = load_store_data(region)
+    return ISO_trace(store_catchments(pd.concat([MIGROS, COMP], ignore_index=True), departure, date))
+
+def build_SHARE(region, bucket, tiles):
+    from src.maps import SHARE_trace
+    share = get_huff_model(region).brand_share()
+    (geojson, ids, _) = choropleth_data(region, 'OeV_Erreichb_EW', None, bucket, tiles)
+    return SHARE_trace(geojson, ids, share.loc[ids])
+
+BUILDERS = {'PT': build_PT, 'POP': build_POP, 'COMP': build_COMP, 'MIGROS': build_MIGROS,
+            'TOP': build_TOP, 'NEW': build_NEW, 'ISO': build_ISO, 'SHARE': build_SHARE}
+
+# the traces are built once per region and shared between the runs and sessions,
+# the figure itself is rebuilt on every run from the checked layers only
+@st.cache_resource
+def get_compositor(region, version):
+    from src.layers import LayerCompositor
+    compositor = LayerCompositor(store=get_layer_cache(), version=version, region=region)
+    for (name, builder) in BUILDERS.items():
+        compositor.register(name, timed('build.' + name)(partial(builder, region)))
+    return compositor
+
+
+# Sections of the page
+############################################
+# optional component returning the relayout (pan / zoom) events of the map
+def mapbox_events():
+    try:
+        from streamlit_plotly_mapbox_events import plotly_mapbox_events
+    except ImportError:
+        return None
+    return plotly_mapbox_events
+
+# threads loading the data and building the layers of the runs, shared between the sessions (src/scheduler.py)
+@st.cache_resource
+def get_executor():
+    from concurrent.futures import ThreadPoolExecutor
+    from src.scheduler import MAX_WORKERS
+    return ThreadPoolExecutor(MAX_WORKERS, thread_name_prefix='layers')
+
+# the cached loaders and st.* calls of a worker thread need the context of the run
+def run_context():
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+    ctx = get_script_run_ctx()
+    def wrap(func):
+        def run():
+            add_script_run_ctx(threading.current_thread(), ctx)
+            return func()
+        return run
+    return wrap
+
+# loading tasks of the data sources, and building task of each layer depending on its sources (LAYER_DATA)
+def layer_tasks(region, layers, compositor):
+    from src.scheduler import TaskGraph
+    graph = TaskGraph(get_executor(), LAYER_TIMEOUT, wrap=run_context())
+    graph.add('zones', lambda: load_data(region))
+    graph.add('stores', lambda: load_store_data(region))
+    graph.add('metadata', lambda: get_metadata(region), depends=['zones'])
+    def build(name, params):
+        if name == 'POP' and 'population' not in load_data(region).columns:
+            raise LookupError('No population data: place a STATPOP hectare CSV or a population GeoTIFF in ./data')
+        return compositor.trace(name, **params)
+    for (name, params) in layers:
+        graph.add(name, partial(build, name, params), depends=LAYER_DATA[name])
+    return graph
+
+def show_map(region, checked, params, initial_view):
+    from src.maps import create_base_map, finish_layout
+    plotly_mapbox_events = mapbox_events()
+    def new_map():
+        return create_base_map(initial_view['center'], initial_view['zoom'],
+                               uirevision=f"{region}-{initial_view['zoom']}")  # keep the view of the user between the reruns
+    layers = []
+    for name in DRAW_ORDER:
+        if not checked.get(name):
+            continue
+        if name == 'ISO':
+            from src.isochrones import GTFS_DIR
+            if not os.path.isdir(GTFS_DIR):
+                st.sidebar.warning(f'No timetable: unzip a GTFS feed into {GTFS_DIR}')
+                continue
+        layers.append((name, params[name]))
+
+    # the data and the layers are loaded and built concurrently, the map is drawn again as each layer arrives
+    placeholder = st.empty()
+    compositor = get_compositor(region, get_dataset_version())
+    traces = {}
+    if not all(compositor.cached(name, **layer_params) for (name, layer_params) in layers):
+        for (name, trace, error) in layer_tasks(region, layers, compositor).run([name for (name, _) in layers]):
+            if error is not None:
+                st.sidebar.warning(str(error) if isinstance(error, LookupError) else f'{LAYERS.get(name, name)}: {error!r}')
+            elif name in LAYERS:
+                traces[name] = trace
+                if len(traces) < len(layers):
+                    partial_map = new_map()
+                    for (drawn, _) in layers:
+                        if drawn in traces:
+                            partial_map.add_trace(traces[drawn])
+                    placeholder.plotly_chart(finish_layout(partial_map), use_container_width=True)
+        layers = [(name, layer_params) for (name, layer_params) in layers if name in traces]
+    with span('render.compose', layers=len(layers)):
+        base_map = finish_layout(compositor.compose(new_map(), layers))
+    if st.session_state.get('perf_panel'):
+        RECORDER.add('payload.figure', bytes=len(base_map.to_json()))  # serialized once more: only with the panel open
+
+    if plotly_mapbox_events is None:
+        with span('render.plotly_chart'):
+            placeholder.plotly_chart(base_map, use_container_width=True)
+    else:
+        # events: [click, select, hover, relayout]; a new viewport reruns the script with its level of detail
+        with span('render.plotly_chart'), placeholder.container():
+            relayout = plotly_mapbox_events(base_map, relayout_event=True, key='map')[3]
+        if relayout and relayout[0] != st.session_state.get('map_relayout'):
+            st.session_state.map_relayout = relayout[0]
+            st.rerun()
+
+def show_candidates(region, weights, top_k, radius_km, new_k, new_radius_km, new_mode, travel=None, hex_res=None):
+    import pandas as pd
+    from src.scoring import feature_table
+    st.subheader('Best candidate zones')
+    top = get_scorer(region, radius_km, travel).top_k(top_k, weights)
+    st.dataframe(pd.concat([top, feature_table(load_data(region), load_features(region, radius_km, travel)).loc[top.index]], axis=1),
+                 use_container_width=True)
+    if hex_res is not None:
+        st.subheader(f'Best candidate hexagons (H3 resolution {hex_res})')
+        GRID = load_grid(region, hex_res, radius_km)
+        top = get_grid_scorer(region, hex_res, radius_km).top_k(top_k, weights)
+        st.dataframe(pd.concat([top, feature_table(GRID).loc[top.index], GRID.loc[top.index, ['lat', 'lon']]], axis=1),
+                     use_container_width=True)
+
+    st.subheader('Where should the next stores go?')
+    st.write('Zones covered by an existing Migros within the catchment radius are not counted again.')
+    placement = load_placement(region, new_k, new_radius_km, new_mode)
+    if len(placement) < new_k:
+        st.info(f'Only {len(placement)} new stores cover more demand: the other zones are already within reach of a store.')
+    st.dataframe(placement, use_container_width=True)
+
+    huff = get_huff_model(region)
+    st.subheader('Expected market share')
+    st.write(f'Share of the demand of the region expected to go to Migros (Huff model): {huff.market_share():.1%}')
+    (MIGROS, COMP) = load_store_data(region)
+    captured = huff.captured_demand()
+    stores = pd.concat([MIGROS, COMP], ignore_index=True).set_index('Place ID')[['Name']]
+    st.dataframe(stores.join(captured).sort_values('captured_demand', ascending=False), use_container_width=True)
+
+def scenario_map(region, score, scenario, view):
+    from src.maps import add_COMP, add_MIGROS, create_base_map, score_trace
+    AREA = load_data(region)
+    (MIGROS, COMP) = load_store_data(region)
+    scenario_map = create_base_map(view['center'], view['zoom'])
+    scenario_map.add_trace(score_trace(payload_url(region, AREA, source_checksum(), zoom=view['bucket']), score.index, score))
+    (migros, comp) = (MIGROS, COMP) if scenario is None else scenario.apply(MIGROS, COMP)
+    scenario_map = add_MIGROS(add_COMP(scenario_map, comp), migros)
+    scenario_map.update_layout(showlegend=False, margin=dict(l=0, r=0, t=0, b=0))
+    return scenario_map
+
+def show_scenarios(region, weights, radius_km, view):
+    import pandas as pd
+    from src.scenarios import Scenario, compare
+    st.subheader('What-if scenarios')
+    st.write('Add hypothetical stores or remove existing ones, and compare the coverage and the suitability with the current stores.')
+    (MIGROS, COMP) = load_store_data(region)
+    META = get_metadata(region)
+    SCENARIOS = st.session_state.setdefault('scenarios', {}).setdefault(region, {})
+    with st.form('scenario'):
+        scenario_name = st.text_input('Scenario', value=f'Scenario {len(SCENARIOS) + 1}')
+        col_lat, col_lon, col_brand = st.columns(3)
+        new_lat = col_lat.number_input('Latitude of a new store', value=META['center']['lat'], format='%.5f')
+        new_lon = col_lon.number_input('Longitude of a new store', value=META['center']['lon'], format='%.5f')
+        new_brand = col_brand.selectbox('Brand', ['Migros', 'Competitor'])
+        add_store = st.checkbox('Add this store')
+        STORES = pd.concat([MIGROS, COMP], ignore_index=True)
+        removed = st.multiselect('Remove stores', STORES['Place ID'],
+                                 format_func=dict(zip(STORES['Place ID'], STORES['Name'])).get)
+        if st.form_submit_button('Save scenario'):
+            scenario = SCENARIOS.get(scenario_name) or Scenario(scenario_name)
+            if add_store:
+                scenario.add_store(f'New {new_brand} ({scenario_name})', new_lat, new_lon, brand=new_brand)
+            for place_id in removed:
+                scenario.remove_store(place_id)
+            SCENARIOS[scenario_name] = scenario
+    if not SCENARIOS:
+        return
+
+    engine = get_scenario_engine(region, radius_km)
+    selected = st.selectbox('Compare with', list(SCENARIOS))
+    result = engine.evaluate(SCENARIOS[selected], weights)
+    base_score = engine.scorer.score(weights)
+    base = engine.metrics(engine.features, base_score)
+    col_base, col_scenario = st.columns(2)
+    col_base.markdown('**Current stores**')
+    col_base.plotly_chart(scenario_map(region, base_score, None, view), use_container_width=True)
+    col_scenario.markdown(f'**{selected}** ({len(result["affected"])} zones recomputed)')
+    col_scenario.plotly_chart(scenario_map(region, result['score'], SCENARIOS[selected], view), use_container_width=True)
+    metrics = result['metrics']
+    metric_columns = st.columns(4)
+    metric_columns[0].metric('Covered demand', f"{metrics['covered_demand']:,.0f}",
+                             f"{metrics['covered_demand'] - base['covered_demand']:+,.0f}")
+    metric_columns[1].metric('Covered share', f"{metrics['covered_share']:.1%}",
+                             f"{metrics['covered_share'] - base['covered_share']:+.1%}")
+    metric_columns[2].metric('Mean distance to a Migros (km)', f"{metrics['mean_dist_migros_km']:.2f}",
+                             f"{metrics['mean_dist_migros_km'] - base['mean_dist_migros_km']:+.2f}",
+                             delta_color='inverse')
+    metric_columns[3].metric('Competitors within the radius', f"{metrics['mean_competitors']:.2f}",
+                             f"{metrics['mean_competitors'] - base['mean_competitors']:+.2f}",
+                             delta_color='inverse')
+    with st.expander('All scenarios'):
+        st.dataframe(compare(engine, SCENARIOS.values(), weights), use_container_width=True)
+
+# per-stage timings of this process, and hit / miss counts of the shared cache (src/perf.py, src/cache.py)
+def show_perf_panel():
+    import pandas as pd
+    if not st.sidebar.checkbox('Performance panel', key='perf_panel'):
+        return
+    with st.sidebar.expander('Performance', expanded=True):
+        trace_memory = st.checkbox('Trace memory (slower)', value=RECORDER.trace_memory)
+        if trace_memory != RECORDER.trace_memory:
+            RECORDER.set_memory_tracing(trace_memory)
+        st.dataframe(pd.DataFrame(RECORDER.summary()), use_container_width=True)
+        st.write('Shared cache')
+        st.json(get_layer_cache().stats())
+        st.download_button('Export JSON lines', RECORDER.to_jsonl(), file_name='stages.jsonl')
+        st.download_button('Export Prometheus text', RECORDER.to_prometheus(), file_name='stages.prom')
+        if st.button('Reset'):
+            RECORDER.reset()
+
+def show_sources():
+    st.subheader('Data sources')
+    st.write('Accessibility per traffic zone in public transport depending on the public transport travel times from all zones in Switzerland to the traffic zone and the number of inhabitants and jobs in the traffic zone. Source: National Passenger Traffic Model (NPVM) of DETEC.:\n https://data.geo.admin.ch/browser/index.html#/collections/ch.are.erreichbarkeit-oev?.language=en')
+
+
+def main(regions=None, layers=tuple(LAYERS), analysis=True):
+    '''Run the app
+
+    Parameters
+    ----------
+    regions : list of str, optional
+        regions to choose from, all the cantons if not given (by abbreviation,
+        like the artifacts of ``src.batch``, 'AI' selected first)
+    layers : iterable of str, optional
+        layers offered in the sidebar (keys of ``LAYERS``)
+    analysis : bool, optional
+        show the suitability ranking, the placement of new stores and the
+        scenarios below the map
+    '''
+    from src.lod import parse_relayout, visible_tiles, zoom_bucket
+    from src.scoring import DEFAULT_WEIGHTS
+    start = time.perf_counter()
+
+    # the region index is built on the first run, from swissBOUNDARIES3D which is not in the repository
+    try:
+        REGISTRY = load_registry()
+    except FileNotFoundError as e:
+        st.error(str(e))
+        st.stop()
+
+    # select only one AREA
+    regions = REGISTRY.cantons() if regions is None else list(regions)
+    REGION = st.sidebar.selectbox('Region', regions, index=regions.index('AI') if 'AI' in regions else 0,
+                                  format_func=REGISTRY.name) if len(regions) > 1 else regions[0]
+    META = get_metadata(REGION)
+
+    # Viewport: from the last relayout event of the map, only the visible tiles are sent. Without the events
+    # component the app does not see the pans of the user: the whole region is sent, simplified for the sidebar zoom
+    INITIAL_VIEW = {'center': META['center'], 'zoom': META['zoom']}
+    if mapbox_events() is None:
+        INITIAL_VIEW['zoom'] = st.sidebar.slider('Map zoom', 6.0, 14.0, float(META['zoom']), step=0.25)
+    VIEW = parse_relayout(st.session_state.get('map_relayout'), INITIAL_VIEW)
+    BUCKET = zoom_bucket(VIEW['zoom'])
+    TILES = None if mapbox_events() is None else visible_tiles(VIEW['bounds'], BUCKET)
+
+    # Display in Streamlit
+    REGION_NAME = REGISTRY.name(REGION)
+    st.title(f'Migros locations in {REGION_NAME}')
+
+    st.write(f'This app aims at finding the best places to create new Migros stores. Following assumptions are made:\n - Area of interest is limited to {REGION_NAME}, \n - Scope is limited to supermarkets / groceries stores (no DIY stores e.g.)')
+    st.write('The analysis is based on: \n - the density of existing stores, \n - the presence of competitors,\n - the population density, \n - as well as the accessibility by public transport.')
+
+    # Layout: Checkboxes to choose which layer to display:
+    st.sidebar.subheader('Layers')
+    checked = {name: st.sidebar.checkbox(LAYERS[name]) for name in LAYERS if name in layers}
+    departure = st.sidebar.time_input('Departure time', datetime.time(8, 0), step=900) if 'ISO' in checked \
+        else datetime.time(8, 0)
+
+    # Spatial unit of the PT and population layers: traffic zones or hexagons
+    HEX_RES = None
+    if {'PT', 'POP'} & set(checked) and \
+            st.sidebar.radio('Spatial unit', ['Traffic zones', 'Hexagons'], horizontal=True) == 'Hexagons':
+        from src.hexgrid import RESOLUTIONS, zoom_to_resolution
+        HEX_RES = st.sidebar.select_slider('Hexagon resolution (H3)', RESOLUTIONS, value=zoom_to_resolution(VIEW['zoom']))
+
+    # Suitability: weights of the features, and placement of new stores
+    (radius_km, weights, top_k, travel) = (2.0, dict(DEFAULT_WEIGHTS), 5, None)
+    (new_k, new_radius_km, new_mode) = (3, 2.0, 'greedy')
+    if analysis or 'TOP' in checked or 'NEW' in checked:
+        st.sidebar.subheader('Suitability')
+        radius_km = st.sidebar.slider('Radius for the store counts (km)', min_value=0.5, max_value=10.0, value=2.0, step=0.5)
+        from src.routing import OSM_PATH
+        if os.path.exists(OSM_PATH):  # travel times on the road network of the OSM extract (src/routing.py)
+            mode = st.sidebar.radio('Store counts by', ['distance', 'drive', 'walk'], horizontal=True)
+            if mode != 'distance':
+                travel = (mode, st.sidebar.slider('Travel time for the store counts (min)', 5, 30, 10, step=5))
+        weights = {
+            'pt': st.sidebar.slider('Weight: public transport accessibility', 0.0, 1.0, DEFAULT_WEIGHTS['pt']),
+            'population': st.sidebar.slider('Weight: population', 0.0, 1.0, DEFAULT_WEIGHTS['population']),
+            'dist_migros': st.sidebar.slider('Weight: distance to the next Migros', 0.0, 1.0, DEFAULT_WEIGHTS['dist_migros']),
+            'competition': st.sidebar.slider('Weight: few competitors', 0.0, 1.0, DEFAULT_WEIGHTS['competition']),
+        }
+        if travel is not None:
+            weights['time_migros'] = st.sidebar.slider('Weight: travel time to the next Migros', 0.0, 1.0, 0.0)
+        top_k = st.sidebar.number_input('Number of candidate zones', min_value=1, max_value=50, value=5)
+
+        st.sidebar.subheader('New stores')
+        new_k = st.sidebar.number_input('Number of new stores', min_value=1, max_value=20, value=3)
+        new_radius_km = st.sidebar.slider('Catchment radius of a store (km)', min_value=0.5, max_value=10.0, value=2.0, step=0.5)
+        new_mode = st.sidebar.radio('Solver', ['greedy', 'milp'], horizontal=True)
+
+    # Add the layers to the base map, IF CHECKED:
+    params = {
+        'ISO': dict(departure=departure, date=datetime.date.today()),  # the timetable of the day
+        'PT': dict(res=HEX_RES, bucket=BUCKET, tiles=TILES),
+        'POP': dict(res=HEX_RES, bucket=BUCKET, tiles=TILES),
+        'COMP': dict(bucket=BUCKET, tiles=TILES),
+        'MIGROS': dict(bucket=BUCKET, tiles=TILES),
+        'SHARE': dict(bucket=BUCKET, tiles=TILES),
+        'TOP': dict(weights=tuple(sorted(weights.items())), k=top_k, radius_km=radius_km, travel=travel),
+        'NEW': dict(k=new_k, radius_km=new_radius_km, mode=new_mode),
+    }
+    show_map(REGION, checked, params, INITIAL_VIEW)
+
+    if analysis:
+        show_candidates(REGION, weights, top_k, radius_km, new_k, new_radius_km, new_mode, travel, HEX_RES)
+        show_scenarios(REGION, weights, radius_km, dict(INITIAL_VIEW, bucket=BUCKET))  # same radius as the base scores
+        with st.expander('Store proximity per traffic zone'):
+            st.dataframe(load_features(REGION, radius_km, travel), use_container_width=True)
+
+    show_sources()
+    RECORDER.record('run', time.perf_counter() - start)
+    if METRICS_FILE:
+        RECORDER.write(METRICS_FILE)
+    show_perf_panel()
@@ -0,0 +1,184 @@
+'''headless batch analysis of several regions
+
+Runs load -> region selection -> features -> score for a list of regions (or
+all the cantons) without streamlit, one region per worker process, and writes
+one Parquet table per region.
+
+Workers only receive the name of their region and file paths: each of them
+reads the preprocessed zone artifact of its region (``src.preprocess``)
+instead of receiving a pickled GeoDataFrame. The region registry is built
+once in the parent process and stored; the missing artifacts are then built
+in the pool, one region per worker, before the analyses. Each worker decodes
+the geometries of its own region: nothing is shared between the processes
+but the files.
+
+A region that fails does not stop the others: its error is recorded in the
+manifest of the output directory (with the table, the number of zones and
+the time of the regions that succeeded), and the run exits with status 1.
+
+Examples
+--------
+    $ python -m src.batch AI AR SG
+    $ python -m src.batch --all --workers 8 --out ./data/results
+'''
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.population import load_population
+from src.preprocess import ARTIFACT_DIR, artifact_path, build_artifact, load_artifact, region_slug, source_checksum
+from src.proximity import zone_features
+from src.regions import CANTONS, RegionRegistry
+from src.scoring import SuitabilityScorer, feature_table
+from src.stores import STORES_PATH, load_stores
+from src.zones import ZONES_PATH
+
+RESULTS_DIR = './data/results'
+MANIFEST = 'manifest.json'
+
+
+def analyse_region(region, radius_km=2.0, weights=None, zones_path=ZONES_PATH, stores_path=STORES_PATH):
+    '''Features and suitability index of the zones of a region, with the stores in and around it
+
+    Returns
+    -------
+    pandas.DataFrame
+        one row per zone (index: zone id) with the features, ``score`` and
+        ``rank`` (1 = most suitable)
+    '''
+    zones = load_artifact(region, zones_path)
+    population = load_population(region, zones, source_checksum(zones_path))
+    if population is not None:
+        zones['population'] = population
+    (migros, comp) = load_stores(region, zones, stores_path)
+    table = feature_table(zones, zone_features(zones, migros, comp, radius_km))
+    table['score'] = SuitabilityScorer(table).score(weights)
+    table['rank'] = table['score'].rank(ascending=False, method='first').astype(int)
+    return table.rename_axis('zone')
+
+
+def run_region(region, out_dir=RESULTS_DIR, radius_km=2.0, zones_path=ZONES_PATH, stores_path=STORES_PATH):
+    '''Analyse a region and write its table, executed in a worker process
+
+    Returns
+    -------
+    (str, str, int, float)
+        region, path of the Parquet file, number of zones, seconds
+    '''
+    start = time.perf_counter()
+    table = analyse_region(region, radius_km, zones_path=zones_path, stores_path=stores_path)
+    path = os.path.join(out_dir, region_slug(region) + '.parquet')
+    table.to_parquet(path)
+    return region, path, len(table), time.perf_counter() - start
+
+
+def build_region(region, zones_path=ZONES_PATH, checksum=None):
+    '''Build the zone artifact of a region from the stored registry, executed in a worker process
+
+    Returns
+    -------
+    str
+        path of the artifact
+    '''
+    return build_artifact(region, RegionRegistry(zones_path), checksum=checksum)
+
+
+def prepare(regions, pool, zones_path=ZONES_PATH):
+    '''Build the registry, then the missing zone artifacts in the pool
+
+    Parameters
+    ----------
+    regions : list of str
+    pool : concurrent.futures.Executor
+        runs ``build_region`` for the regions without an artifact
+    zones_path : str, optional
+
+    Returns
+    -------
+    dict
+        region -> error message, for the regions whose artifact failed
+    '''
+    RegionRegistry(zones_path)  # built and stored once: the workers only read the stored index
+    checksum = source_checksum(zones_path)
+    futures = {pool.submit(build_region, region, zones_path, checksum): region
+               for region in regions if not os.path.exists(artifact_path(region, checksum))}
+    failed = {}
+    for future in as_completed(futures):
+        try:
+            future.result()
+        except Exception as error:
+            failed[futures[future]] = ''.join(traceback.format_exception(error))
+    return failed
+
+
+def read_manifest(out_dir):
+    '''dict: region -> entry of the last run of the region in an output directory'''
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, out_dir):
+    '''Write the manifest of an output directory (atomically)'''
+    path = os.path.join(out_dir, MANIFEST)
+    (fd, tmp) = tempfile.mkstemp(dir=out_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Batch analysis of several regions')
+    parser.add_argument('regions', nargs='*', help='canton abbreviations or region names')
+    parser.add_argument('--all', action='store_true', help='all the cantons')
+    parser.add_argument('--out', default=RESULTS_DIR, help='output directory')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--radius-km', type=float, default=2.0)
+    parser.add_argument('--zones', default=ZONES_PATH)
+    parser.add_argument('--stores', default=STORES_PATH, help='store catalog (see src.stores)')
+    args = parser.parse_args(argv)
+
+    regions = list(CANTONS) if args.all else args.regions
+    if not regions:
+        parser.error('no region given')
+    os.makedirs(args.out, exist_ok=True)
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    manifest = read_manifest(args.out)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        failed = prepare(regions, pool, args.zones)
+        for (region, error) in failed.items():
+            manifest[region] = {'error': error, 'time': time.time()}
+            print('%-6s failed: %s' % (region, error.strip().splitlines()[-1]))
+        futures = {
+            pool.submit(run_region, region, args.out, args.radius_km, args.zones, args.stores): region
+            for region in regions if region not in failed
+        }
+        for future in as_completed(futures):
+            region = futures[future]
+            try:
+                (_, path, n, seconds) = future.result()
+            except Exception as error:
+                failed[region] = ''.join(traceback.format_exception(error))
+                manifest[region] = {'error': failed[region], 'time': time.time()}
+                print('%-6s failed: %r' % (region, error))
+            else:
+                manifest[region] = {'path': path, 'zones': n, 'seconds': seconds, 'time': time.time()}
+                print('%-6s %6d zones %7.2fs  %s' % (region, n, seconds, path))
+            write_manifest(manifest, args.out)  # after every region: an interrupted run keeps what is done
+    write_manifest(manifest, args.out)
+    print('%d regions in %.1fs, %d failed' % (len(regions), time.perf_counter() - start, len(failed)))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,257 @@
+'''two-tier cache of processed layers and traces, shared between sessions
+
+Streamlit caches live in one process: every replica behind the load balancer
+(and every worker process) rebuilds the same tables and traces. This cache
+adds a tier on disk, shared by all the processes that see the same cache
+directory, under an in-process LRU tier:
+
+- entries are keyed by (dataset version, region, layer, parameters), so a
+  new GeoPackage or store catalog never serves stale results;
+- values are stored on disk as bytes: Arrow IPC for tables, GeoParquet for
+  GeoDataFrames and plotly JSON for traces; files are written to a
+  temporary name and renamed, so readers never see a partial entry and
+  concurrent writers of the same key are harmless;
+- the in-process tier keeps the decoded objects (shared, do not modify them)
+  and evicts the least recently used ones above a size budget, measured as
+  the size of their encoded bytes; the disk tier is pruned the same way,
+  oldest files first;
+- hits per tier, misses and evictions are counted (``LayerCache.stats``).
+
+Variables
+---------
+CACHE_DIR : default directory of the disk tier
+FRAME, TRACE : (encode, decode) pairs of the stored value types
+
+Classes
+-------
+LayerCache : in-process LRU tier over a shared disk tier
+'''
+
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from src.preprocess import ARTIFACT_VERSION, source_checksum
+from src.zones import ZONES_PATH
+
+CACHE_DIR = './data/cache'
+
+
+def encode_frame(table):
+    '''bytes: GeoParquet of a GeoDataFrame, Arrow IPC (Feather) of a DataFrame'''
+    buffer = io.BytesIO()
+    if hasattr(table, 'geometry'):
+        table.to_parquet(buffer)
+        return b'GPQ0' + buffer.getvalue()
+    table.to_feather(buffer, compression='uncompressed')
+    return b'ARW0' + buffer.getvalue()
+
+
+def decode_frame(data):
+    '''Table stored by ``encode_frame``'''
+    buffer = io.BytesIO(data[4:])
+    if data[:4] == b'GPQ0':
+        import geopandas as gpd
+        return gpd.read_parquet(buffer)
+    import pandas as pd
+    return pd.read_feather(buffer)
+
+
+def encode_figure(figure):
+    '''bytes: plotly JSON of a figure'''
+    return figure.to_json().encode()
+
+
+def decode_figure(data):
+    '''Figure stored by ``encode_figure``'''
+    import plotly.io as pio
+    return pio.from_json(data.decode(), skip_invalid=True)
+
+
+def encode_trace(trace):
+    '''bytes: plotly JSON of a figure holding only the trace'''
+    import plotly.graph_objects as go
+    return encode_figure(go.Figure(trace))
+
+
+def decode_trace(data):
+    '''Trace stored by ``encode_trace``'''
+    return decode_figure(data).data[0]
+
+
+FRAME = (encode_frame, decode_frame)
+TRACE = (encode_trace, decode_trace)
+
+
+def dataset_version(zones_path=ZONES_PATH, inputs=()):
+    '''Version of the input data, part of every cache key
+
+    Parameters
+    ----------
+    zones_path : str, optional
+        zones GeoPackage, identified by its checksum
+    inputs : iterable of str, optional
+        further input files (store catalog, population), identified by size
+        and modification time; missing files are skipped
+
+    Returns
+    -------
+    str
+    '''
+    h = hashlib.sha256(('%d:%s' % (ARTIFACT_VERSION, source_checksum(zones_path))).encode())
+    for path in inputs:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            h.update(('%s:%d:%d' % (os.path.basename(path), stat.st_size, stat.st_mtime_ns)).encode())
+    return h.hexdigest()[:16]
+
+
+class LayerCache(object):
+    """In-process LRU tier over a disk tier shared between processes
+
+    Attributes
+    ----------
+    directory : str
+        directory of the disk tier
+    memory_bytes : int
+        budget of the in-process tier
+    disk_bytes : int
+        budget of the disk tier
+    """
+
+    def __init__(self, directory=CACHE_DIR, memory_bytes=256 << 20, disk_bytes=4 << 30):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._items = OrderedDict()     # key -> (value, size)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._written = 0
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'bytes_read': 0,
+                       'bytes_written': 0}
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(version, region, layer, params=None):
+        '''str: hex key of (dataset version, region, layer, parameters)'''
+        text = json.dumps([version, region, layer, params or {}], sort_keys=True, default=str)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.bin')
+
+    def _remember(self, key, value, size):
+        with self._lock:
+            if key in self._items:
+                self._size -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self._size += size
+            while self._size > self.memory_bytes and len(self._items) > 1:
+                (_, (_, dropped)) = self._items.popitem(last=False)
+                self._size -= dropped
+                self._stats['evictions'] += 1
+
+    def read(self, key):
+        '''bytes of a key in the disk tier, ``None`` if it is not there'''
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # recently used: pruned last
+        except FileNotFoundError:
+            return None
+        return data
+
+    def write(self, key, data):
+        '''Store bytes in the disk tier (atomically)'''
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._stats['bytes_written'] += len(data)
+            self._written += len(data)
+            prune = self._written > self.disk_bytes // 16
+            if prune:
+                self._written = 0
+        if prune:
+            self.prune()
+
+    def get(self, version, region, layer, params, build, codec=FRAME):
+        '''Cached ``build()``
+
+        Parameters
+        ----------
+        version : str
+            see ``dataset_version``
+        region, layer : str
+        params : dict
+            parameters of the layer (JSON-serializable, or with a stable ``str``)
+        build : callable
+            builds the value on a miss
+        codec : (callable, callable), optional
+            encode and decode functions of the value, e.g. ``FRAME`` or ``TRACE``
+
+        Returns
+        -------
+        object
+            the value, shared with the other users of the cache: do not modify it
+        '''
+        key = self.key(version, region, layer, params)
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return self._items[key][0]
+        (encode, decode) = codec
+        data = self.read(key)
+        if data is not None:
+            value = decode(data)
+            with self._lock:
+                self._stats['disk_hits'] += 1
+                self._stats['bytes_read'] += len(data)
+        else:
+            value = build()
+            data = encode(value)
+            self.write(key, data)
+            with self._lock:
+                self._stats['misses'] += 1
+        self._remember(key, value, len(data))
+        return value
+
+    def prune(self):
+        '''Remove the oldest files of the disk tier above ``disk_bytes``'''
+        files = []
+        for (root, _, names) in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.tmp'):
+                    continue  # being written by another process
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # removed by another process
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for (_, size, _) in files)
+        for (_, size, path) in sorted(files):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self):
+        '''dict: hits per tier, misses, evictions, bytes and entries of the in-process tier'''
+        with self._lock:
+            stats = dict(self._stats, memory_entries=len(self._items), memory_bytes=self._size)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
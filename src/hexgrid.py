@@ -0,0 +1,171 @@
+'''hexagonal grid (H3) for finer-than-zone analysis
+
+The traffic zones are too coarse to rank sites inside a zone, so the features
+are resampled on H3 hexagons:
+
+- the zone attributes are interpolated by area: the zones are intersected
+  once with the hexagons of the finest resolution (in LV95) and the areas of
+  the pieces are cached; any attribute is then a group-by over this table.
+  Extensive attributes (population) are split by area share of the zone,
+  intensive ones (``OeV_Erreichb_EW``) are area-weighted means;
+- coarser resolutions are rolled up from the finest one through the parents
+  of the cells, without intersecting geometries again;
+- store proximity is computed directly at the centres of the cells
+  (``hex_features``), so that the cells can be scored like the zones.
+
+Variables
+---------
+RESOLUTIONS : available H3 resolutions, coarse to fine
+EXTENSIVE, INTENSIVE : how the zone attributes are interpolated
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import h3
+from shapely.geometry import Polygon
+
+from src.preprocess import artifact_path
+from src.proximity import proximity_features
+
+RESOLUTIONS = [7, 8, 9]
+EXTENSIVE = ['population']
+INTENSIVE = ['OeV_Erreichb_EW', 'population_density']
+
+
+def zoom_to_resolution(zoom):
+    '''int: H3 resolution whose hexagons are a few pixels wide at a map zoom'''
+    if zoom < 9:
+        return RESOLUTIONS[0]
+    if zoom < 11:
+        return RESOLUTIONS[1]
+    return RESOLUTIONS[2]
+
+
+def cover_cells(zones, res):
+    '''H3 cells covering the zones
+
+    The union of the zones is buffered by one hexagon edge before the
+    polyfill, so that cells overlapping the border are included.
+
+    Parameters
+    ----------
+    zones : geopandas.GeoDataFrame
+    res : int
+
+    Returns
+    -------
+    list of str
+    '''
+    edge = h3.average_hexagon_edge_length(res, unit='m')
+    area = zones.to_crs('EPSG:2056').geometry.union_all().buffer(edge)
+    area = gpd.GeoSeries([area], crs='EPSG:2056').to_crs('EPSG:4326').iloc[0]
+    return sorted(h3.geo_to_cells(area, res))
+
+
+def cell_polygons(cells):
+    '''geopandas.GeoDataFrame: hexagons of H3 cells in EPSG:4326, indexed by cell'''
+    polygons = [Polygon([(lng, lat) for (lat, lng) in h3.cell_to_boundary(c)]) for c in cells]
+    return gpd.GeoDataFrame(geometry=polygons, index=pd.Index(cells, name='cell'), crs='EPSG:4326')
+
+
+def overlay_table(zones, res):
+    '''Areas of the intersections of the zones with the cells
+
+    Returns
+    -------
+    pandas.DataFrame
+        ``cell``, ``zone``, ``area`` (m2 of the piece) and ``zone_area``
+    '''
+    zones = gpd.GeoDataFrame({'zone': zones.index.to_numpy()}, geometry=zones.geometry.values, crs=zones.crs).to_crs('EPSG:2056')
+    zones['zone_area'] = zones.area
+    hexes = cell_polygons(cover_cells(zones, res)).reset_index().to_crs('EPSG:2056')
+    pieces = gpd.overlay(hexes, zones, how='intersection', keep_geom_type=True)
+    return pd.DataFrame({
+        'cell': pieces['cell'].to_numpy(),
+        'zone': pieces['zone'].to_numpy(),
+        'area': pieces.area.to_numpy(),
+        'zone_area': pieces['zone_area'].to_numpy(),
+    })
+
+
+def load_overlay(region, zones, checksum, res=RESOLUTIONS[-1]):
+    '''``overlay_table`` cached next to the zone artifact of the region'''
+    path = artifact_path(region, checksum, 'h3_r%d.feather' % res)
+    if os.path.exists(path):
+        return pd.read_feather(path)
+    table = overlay_table(zones, res)
+    table.to_feather(path)
+    return table
+
+
+def interpolate(overlay, zones):
+    '''Zone attributes interpolated on the cells of an overlay table
+
+    Returns
+    -------
+    pandas.DataFrame
+        indexed by cell: ``area`` (m2 of the cell covered by zones) and the
+        ``EXTENSIVE`` and ``INTENSIVE`` columns found in ``zones``
+    '''
+    table = overlay.join(pd.DataFrame(zones).drop(columns='geometry', errors='ignore'), on='zone')
+    result = {'area': table.groupby('cell')['area'].sum()}
+    for column in EXTENSIVE:
+        if column in table.columns:
+            result[column] = (table[column] * table['area'] / table['zone_area']).groupby(table['cell']).sum()
+    for column in INTENSIVE:
+        if column in table.columns:
+            result[column] = (table[column] * table['area']).groupby(table['cell']).sum() / result['area']
+    return pd.DataFrame(result)
+
+
+def roll_up(grid, res):
+    '''Aggregate a grid to a coarser resolution through the parents of its cells
+
+    Parameters
+    ----------
+    grid : pandas.DataFrame
+        result of ``interpolate`` (or of a previous ``roll_up``)
+    res : int
+        target resolution, coarser than the one of ``grid``
+
+    Returns
+    -------
+    pandas.DataFrame
+        same columns, indexed by the cells of resolution ``res``
+    '''
+    parent = pd.Index([h3.cell_to_parent(c, res) for c in grid.index], name='cell')
+    weighted = grid[[c for c in INTENSIVE if c in grid.columns]].multiply(grid['area'], axis=0)
+    result = grid[['area'] + [c for c in EXTENSIVE if c in grid.columns]].groupby(parent).sum()
+    result = result.join(weighted.groupby(parent).sum().divide(result['area'], axis=0))
+    return result[grid.columns]
+
+
+def hex_grid(region, zones, checksum, res):
+    '''Zone attributes on the hexagons of a resolution
+
+    The finest resolution is interpolated from the cached overlay, the coarser
+    ones are rolled up from it.
+
+    Returns
+    -------
+    geopandas.GeoDataFrame
+        hexagons (EPSG:4326) with the interpolated attributes, indexed by cell
+    '''
+    grid = interpolate(load_overlay(region, zones, checksum), zones)
+    if res != RESOLUTIONS[-1]:
+        grid = roll_up(grid, res)
+    grid = grid[grid['area'] > 0]
+    return cell_polygons(grid.index).join(grid)
+
+
+def cell_points(cells):
+    '''numpy.ndarray: (n, 2) array of the (lat, lon) of the centres of cells'''
+    return np.array([h3.cell_to_latlng(c) for c in cells], dtype=np.float64).reshape(-1, 2)
+
+
+def hex_features(grid, migros, comp, radius_km=2.0):
+    '''``src.proximity.proximity_features`` at the centres of the cells of a grid, indexed by cell'''
+    return proximity_features(cell_points(grid.index), migros, comp, radius_km, index=grid.index)
@@ -0,0 +1,194 @@
+'''market shares per zone with a Huff gravity model
+
+The probability that the demand of zone i goes to store j is
+
+    P_ij = A_j d_ij^-lambda / sum_k A_k d_ik^-lambda
+
+with A_j the attractiveness of the store (brand, optionally floor area) and
+d_ij the distance. Far stores have a negligible utility, so each zone only
+keeps its k nearest stores: the model is a zones x stores sparse matrix with
+k entries per row, stored as two (n, k) arrays (store positions and
+distances) and built with one k-nearest query in a BallTree.
+
+Adding a store changes only the zones for which it is nearer than their k-th
+nearest store (it replaces that one); removing a store changes only the zones
+that had it among their k nearest (their next nearest store is queried). All
+the other rows, and their sums, are kept.
+
+Variables
+---------
+BRAND_ATTRACTIVENESS : attractiveness of a store per brand
+DECAY : distance-decay exponent lambda
+K_NEAREST : stores kept per zone
+MIN_DISTANCE_KM : distances are clipped to this value (zone of the store)
+
+Classes
+-------
+HuffModel : capture probabilities of the zones by the stores
+'''
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.proximity import build_tree, nearest_km, store_points
+from src.stores import MIGROS_BRANDS, classify_brands
+
+BRAND_ATTRACTIVENESS = {
+    'Migros': 1.0,
+    'Coop': 1.0,
+    'Manor': 0.8,
+    'Lidl': 0.8,
+    'Aldi': 0.8,
+    'Denner': 0.6,
+    'SPAR': 0.5,
+    'VOLG': 0.4,
+    'Landi': 0.4,
+    'Migrolino': 0.3,
+    'Other': 0.5,
+}
+DECAY = 2.0
+K_NEAREST = 20
+MIN_DISTANCE_KM = 0.2
+
+
+def attractiveness(stores, area_column='Floor area', area_exponent=1.0):
+    '''Attractiveness of each store
+
+    Parameters
+    ----------
+    stores : pandas.DataFrame
+        store table with ``Brand`` (derived from ``Name`` if missing) and,
+        optionally, the floor area in m2
+    area_column : str, optional
+        column of the floor area; when present, the brand attractiveness is
+        multiplied by (area / median area) ** ``area_exponent``
+    area_exponent : float, optional
+
+    Returns
+    -------
+    numpy.ndarray
+    '''
+    brand = stores['Brand'] if 'Brand' in stores.columns else classify_brands(stores['Name'])
+    a = brand.map(BRAND_ATTRACTIVENESS).fillna(BRAND_ATTRACTIVENESS['Other']).to_numpy(dtype=np.float64)
+    if area_column in stores.columns:
+        area = stores[area_column].to_numpy(dtype=np.float64)
+        known = np.isfinite(area) & (area > 0)
+        if known.any():
+            a[known] *= (area[known] / np.median(area[known])) ** area_exponent
+    return a
+
+
+class HuffModel(object):
+    """Capture probabilities of the zones by their k nearest stores
+
+    Attributes
+    ----------
+    stores : pandas.DataFrame
+        all the stores ever added (removed ones stay, with ``active`` False),
+        with ``Brand`` and ``attractiveness``
+    demand : pandas.Series
+        demand per zone (e.g. population or ``OeV_Erreichb_EW``)
+    """
+
+    def __init__(self, points, stores, demand, decay=DECAY, k=K_NEAREST, index=None):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.index = pd.RangeIndex(len(self.points)) if index is None else pd.Index(index)
+        self.demand = pd.Series(np.asarray(demand, dtype=np.float64), index=self.index, name='demand')
+        self.decay = decay
+        self.k = k
+        stores = stores.reset_index(drop=True)
+        if 'Brand' not in stores.columns:
+            stores = stores.assign(Brand=classify_brands(stores['Name']))
+        self.stores = stores.assign(attractiveness=attractiveness(stores), active=True)
+        (dist, ind) = nearest_km(build_tree(store_points(self.stores)), self.points, k)
+        self._ind = ind
+        self._dist = dist
+        self._utility = self._utilities(ind, dist)
+        self._total = self._utility.sum(axis=1)
+
+    def _utilities(self, ind, dist):
+        a = np.where(ind >= 0, self.stores['attractiveness'].to_numpy()[np.maximum(ind, 0)], 0.0)
+        return a * np.maximum(dist, MIN_DISTANCE_KM) ** -self.decay
+
+    def _update_rows(self, rows, ind, dist):
+        self._ind[rows] = ind
+        self._dist[rows] = dist
+        self._utility[rows] = self._utilities(ind, dist)
+        self._total[rows] = self._utility[rows].sum(axis=1)
+
+    def probabilities(self):
+        '''scipy.sparse.csr_matrix: (zones, stores) capture probabilities'''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            p = np.where(self._total[:, None] > 0, self._utility / self._total[:, None], 0.0)
+        (n, k) = self._ind.shape
+        rows = np.repeat(np.arange(n), k)
+        keep = (self._ind.ravel() >= 0) & (p.ravel() > 0)
+        return sparse.csr_matrix((p.ravel()[keep], (rows[keep], self._ind.ravel()[keep])),
+                                 shape=(n, len(self.stores)))
+
+    def captured_demand(self):
+        '''pandas.Series: expected demand of every active store, indexed by ``Place ID``'''
+        captured = self.probabilities().T @ self.demand.to_numpy()
+        active = self.stores['active'].to_numpy()
+        return pd.Series(captured[active], index=self.stores.loc[active, 'Place ID'], name='captured_demand')
+
+    def brand_share(self, brands=MIGROS_BRANDS):
+        '''pandas.Series: probability that the demand of each zone goes to ``brands``'''
+        mask = self.stores['Brand'].isin(brands).to_numpy() & self.stores['active'].to_numpy()
+        return pd.Series(self.probabilities() @ mask.astype(np.float64), index=self.index, name='share')
+
+    def market_share(self, brands=MIGROS_BRANDS):
+        '''float: share of the total demand going to ``brands``'''
+        total = self.demand.sum()
+        return float((self.brand_share(brands) * self.demand).sum() / total) if total > 0 else 0.0
+
+    def add_store(self, store):
+        '''Add a store and update the zones for which it is among the k nearest
+
+        Parameters
+        ----------
+        store : dict or pandas.Series
+            ``Place ID``, ``Name``, ``Latitude``, ``Longitude`` and optionally
+            ``Brand`` and the floor area
+
+        Returns
+        -------
+        numpy.ndarray
+            positions of the updated zones
+        '''
+        row = pd.DataFrame([dict(store)])
+        if 'Brand' not in row.columns:
+            row['Brand'] = classify_brands(row['Name'])
+        row['attractiveness'] = attractiveness(row)
+        row['active'] = True
+        position = len(self.stores)
+        self.stores = pd.concat([self.stores, row], ignore_index=True)
+        d = nearest_km(build_tree(store_points(row)), self.points)[0][:, 0]
+        farthest = np.argmax(np.where(self._ind >= 0, self._dist, np.inf), axis=1)
+        rows = np.flatnonzero(d < self._dist[np.arange(len(d)), farthest])
+        ind = self._ind[rows].copy()
+        dist = self._dist[rows].copy()
+        ind[np.arange(len(rows)), farthest[rows]] = position
+        dist[np.arange(len(rows)), farthest[rows]] = d[rows]
+        self._update_rows(rows, ind, dist)
+        return rows
+
+    def remove_store(self, place_id):
+        '''Remove a store and update the zones that had it among their k nearest
+
+        Returns
+        -------
+        numpy.ndarray
+            positions of the updated zones
+        '''
+        positions = np.flatnonzero((self.stores['Place ID'] == place_id).to_numpy() & self.stores['active'].to_numpy())
+        if len(positions) == 0:
+            raise KeyError(place_id)
+        self.stores.loc[positions, 'active'] = False
+        rows = np.flatnonzero(np.isin(self._ind, positions).any(axis=1))
+        if len(rows):
+            active = np.flatnonzero(self.stores['active'].to_numpy())
+            (dist, ind) = nearest_km(build_tree(store_points(self.stores.iloc[active])), self.points[rows], self.k)
+            self._update_rows(rows, np.where(ind >= 0, active[np.maximum(ind, 0)], -1), dist)
+        return rows
@@ -0,0 +1,382 @@
+'''public transport isochrones of the stores from a local GTFS feed
+
+The timetable of one day is turned into a connection table: one row per
+vehicle movement between two consecutive stops of a trip, stored as NumPy
+arrays sorted by departure time. Earliest arrival times are computed with the
+Connection Scan Algorithm (CSA), for all the stores at once: the arrival
+times are a (stops x stores) matrix and every connection is scanned a single
+time for the whole batch.
+
+The catchment of a store within T minutes is the union of the circles that
+can still be walked from every reached stop (and from the store itself) in
+the remaining time. Results are cached on disk per store set, feed (names,
+sizes and modification times of its files), day and departure time window;
+the files of other feeds are removed, and at most ``MAX_CACHED`` are kept.
+
+The day is checked against calendar.txt / calendar_dates.txt: a day the feed
+does not cover (e.g. today, with an expired feed) is an error rather than
+isochrones made of walking circles only.
+
+Variables
+---------
+GTFS_DIR : directory of the unzipped GTFS feed
+WALKING_SPEED_M_PER_MIN : walking speed to and from the stops
+MAX_WALK_M : largest walking distance to the first stop
+THRESHOLDS : isochrone limits in minutes
+MAX_CACHED : cached isochrone and connection files kept in ARTIFACT_DIR
+
+Classes
+-------
+ConnectionTable : array-backed connections of one service day
+'''
+
+import datetime
+import glob
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from src.preprocess import ARTIFACT_DIR
+from src.proximity import EARTH_RADIUS_KM, build_tree
+
+GTFS_DIR = './data/gtfs'
+WALKING_SPEED_M_PER_MIN = 80.0
+MAX_WALK_M = 800.0
+THRESHOLDS = [5, 10, 15]
+MAX_CACHED = 64
+
+
+def gtfs_seconds(times):
+    '''Seconds after midnight of GTFS ``HH:MM:SS`` times (hours may exceed 24)'''
+    parts = times.str.split(':', expand=True).astype(np.int32)
+    return (parts[0] * 3600 + parts[1] * 60 + parts[2]).to_numpy(dtype=np.int32)
+
+
+def feed_files(path=GTFS_DIR):
+    '''list of str: the files of a feed, none if there is no feed'''
+    if not os.path.isdir(path):
+        return []
+    return sorted(entry.path for entry in os.scandir(path) if entry.is_file())
+
+
+def feed_signature(path):
+    '''str: hash of the names, sizes and modification times of the files of a feed'''
+    h = hashlib.sha1()
+    for name in feed_files(path):
+        stat = os.stat(name)
+        h.update(repr((os.path.basename(name), stat.st_size, stat.st_mtime_ns)).encode())
+    return h.hexdigest()[:12]
+
+
+def prune_cache(signature, keep=MAX_CACHED, directory=None):
+    '''Remove the cached isochrones and connections of other feeds, and the oldest above ``keep``
+
+    Returns
+    -------
+    list of str
+        removed paths
+    '''
+    directory = directory or ARTIFACT_DIR
+    files = []
+    for path in glob.glob(os.path.join(directory, 'isochrones_*')) + glob.glob(os.path.join(directory, 'connections_*')):
+        try:
+            files.append((os.path.basename(path).split('_')[1] == signature, os.path.getmtime(path), path))
+        except FileNotFoundError:
+            continue  # removed by another session
+    files.sort(reverse=True)  # current feed first, then the most recent
+    removed = []
+    for (i, (current, _, path)) in enumerate(files):
+        if current and i < keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        removed.append(path)
+    return removed
+
+
+def _replace(path, write):
+    '''Write a file through a temporary file of its own, then rename it'''
+    (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def feed_dates(path):
+    '''(datetime.date, datetime.date): first and last day of calendar.txt and calendar_dates.txt, or None'''
+    days = []
+    calendar = os.path.join(path, 'calendar.txt')
+    if os.path.exists(calendar):
+        days.extend(pd.read_csv(calendar, usecols=['start_date', 'end_date']).to_numpy().ravel())
+    dates = os.path.join(path, 'calendar_dates.txt')
+    if os.path.exists(dates):
+        days.extend(pd.read_csv(dates, usecols=['date'])['date'])
+    if not days:
+        return None
+    return tuple(datetime.datetime.strptime(str(day), '%Y%m%d').date() for day in (min(days), max(days)))
+
+
+def service_date(path, date=None):
+    '''The service day of a request, today by default
+
+    Raises
+    ------
+    LookupError
+        if no service of the feed runs on that day
+    '''
+    date = date or datetime.date.today()
+    if not active_services(path, date):
+        covered = feed_dates(path)
+        raise LookupError('the timetable in %s has no service on %s%s' % (
+            path, date.isoformat(), ' (it covers %s to %s)' % tuple(d.isoformat() for d in covered) if covered else ''))
+    return date
+
+
+def active_services(path, date):
+    '''Service ids running on a date, from calendar.txt and calendar_dates.txt'''
+    day = int(date.strftime('%Y%m%d'))
+    services = set()
+    calendar = os.path.join(path, 'calendar.txt')
+    if os.path.exists(calendar):
+        c = pd.read_csv(calendar, dtype={'service_id': str})
+        weekday = date.strftime('%A').lower()
+        c = c[(c['start_date'] <= day) & (c['end_date'] >= day) & (c[weekday] == 1)]
+        services.update(c['service_id'])
+    dates = os.path.join(path, 'calendar_dates.txt')
+    if os.path.exists(dates):
+        d = pd.read_csv(dates, dtype={'service_id': str})
+        d = d[d['date'] == day]
+        services.update(d.loc[d['exception_type'] == 1, 'service_id'])
+        services.difference_update(d.loc[d['exception_type'] == 2, 'service_id'])
+    return services
+
+
+class ConnectionTable(object):
+    """Connections of one service day, sorted by departure time
+
+    Attributes
+    ----------
+    stop_ids : numpy.ndarray of str
+        GTFS id of each stop index
+    stop_lat, stop_lon : numpy.ndarray
+        coordinates of the stops
+    dep_stop, arr_stop, dep_time, arr_time, trip : numpy.ndarray
+        one entry per connection; stops and trips are indices, times are
+        seconds after midnight
+    """
+
+    _ARRAYS = ['stop_ids', 'stop_lat', 'stop_lon', 'dep_stop', 'arr_stop', 'dep_time', 'arr_time', 'trip']
+
+    def __init__(self, **arrays):
+        for name in self._ARRAYS:
+            setattr(self, name, arrays[name])
+        self.n_trips = int(self.trip.max()) + 1 if len(self.trip) else 0
+
+    @classmethod
+    def from_gtfs(cls, path=GTFS_DIR, date=None, bbox=None):
+        '''Build the table of a day from the text files of a GTFS feed
+
+        Parameters
+        ----------
+        path : str
+            directory with stops.txt, trips.txt, stop_times.txt and
+            calendar.txt and/or calendar_dates.txt
+        date : datetime.date, optional
+            service day, today by default
+        bbox : tuple of float, optional
+            (lon_min, lat_min, lon_max, lat_max): only the stops in the box
+            are kept, a trip leaving the box connects its last stop before
+            and its first stop after
+
+        Raises
+        ------
+        LookupError
+            if no service runs on ``date`` (see ``service_date``)
+        '''
+        date = service_date(path, date)
+        stops = pd.read_csv(os.path.join(path, 'stops.txt'), usecols=['stop_id', 'stop_lat', 'stop_lon'], dtype={'stop_id': str})
+        if bbox is not None:
+            (x0, y0, x1, y1) = bbox
+            stops = stops[stops['stop_lon'].between(x0, x1) & stops['stop_lat'].between(y0, y1)]
+        stops = stops.reset_index(drop=True)
+        stop_index = pd.Series(np.arange(len(stops)), index=stops['stop_id'])
+
+        trips = pd.read_csv(os.path.join(path, 'trips.txt'), usecols=['trip_id', 'service_id'], dtype=str)
+        trips = trips[trips['service_id'].isin(active_services(path, date))]
+        trip_index = pd.Series(np.arange(len(trips)), index=trips['trip_id'])
+
+        # the national stop times of the day are only read: each chunk is cut to the trips and stops kept
+        parts = []
+        for st in pd.read_csv(os.path.join(path, 'stop_times.txt'),
+                              usecols=['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence'],
+                              dtype={'trip_id': str, 'stop_id': str, 'arrival_time': str, 'departure_time': str},
+                              chunksize=1000000):
+            parts.append(st[st['trip_id'].isin(trip_index.index) & st['stop_id'].isin(stop_index.index)])
+        st = pd.concat(parts, ignore_index=True).sort_values(['trip_id', 'stop_sequence'], kind='stable')
+
+        trip = trip_index.reindex(st['trip_id']).to_numpy()
+        stop = stop_index.reindex(st['stop_id']).to_numpy()
+        arr = gtfs_seconds(st['arrival_time'])
+        dep = gtfs_seconds(st['departure_time'])
+        # consecutive stop times of the same trip
+        same = trip[1:] == trip[:-1]
+        order = np.argsort(dep[:-1][same], kind='stable')
+        return cls(
+            stop_ids=stops['stop_id'].to_numpy(dtype=str),
+            stop_lat=stops['stop_lat'].to_numpy(dtype=np.float64),
+            stop_lon=stops['stop_lon'].to_numpy(dtype=np.float64),
+            dep_stop=stop[:-1][same][order].astype(np.int32),
+            arr_stop=stop[1:][same][order].astype(np.int32),
+            dep_time=dep[:-1][same][order],
+            arr_time=arr[1:][same][order],
+            trip=trip[:-1][same][order].astype(np.int32),
+        )
+
+    def save(self, path):
+        '''Write the arrays to an .npz file'''
+        with open(path, 'wb') as f:
+            np.savez(f, **{name: getattr(self, name) for name in self._ARRAYS})
+
+    @classmethod
+    def load(cls, path):
+        '''Read a table written by ``save``'''
+        with np.load(path) as f:
+            return cls(**{name: f[name] for name in cls._ARRAYS})
+
+    def earliest_arrival(self, sources, departure, max_minutes):
+        '''Earliest arrival at every stop from several sources (batched CSA)
+
+        Parameters
+        ----------
+        sources : numpy.ndarray
+            (s, 2) array of (lat, lon) of the sources (e.g. stores)
+        departure : int
+            departure time at the sources, seconds after midnight
+        max_minutes : float
+            connections arriving later than ``departure + max_minutes`` are
+            not scanned
+
+        Returns
+        -------
+        numpy.ndarray
+            (stops, s) arrival times in seconds, ``inf`` if not reached
+        '''
+        n_stops = len(self.stop_ids)
+        arrival = np.full((n_stops, len(sources)), np.inf)
+        tree = build_tree(np.column_stack([self.stop_lat, self.stop_lon]))
+        if tree is None or len(sources) == 0:
+            return arrival
+        # walk from each source to the stops around it
+        (stops, dist) = tree.query_radius(np.radians(sources), r=MAX_WALK_M / 1000.0 / EARTH_RADIUS_KM, return_distance=True)
+        for (s, (i, d)) in enumerate(zip(stops, dist)):
+            arrival[i, s] = departure + d * EARTH_RADIUS_KM * 1000.0 / WALKING_SPEED_M_PER_MIN * 60.0
+
+        end = departure + max_minutes * 60
+        (first, last) = np.searchsorted(self.dep_time, [departure, end], side='left')
+        window = slice(first, last)
+        reached = np.zeros((self.n_trips, len(sources)), dtype=bool)
+        for (a, b, t_dep, t_arr, trip) in zip(self.dep_stop[window], self.arr_stop[window],
+                                              self.dep_time[window], self.arr_time[window], self.trip[window]):
+            if t_arr > end:
+                continue
+            on = reached[trip] | (arrival[a] <= t_dep)
+            if on.any():
+                reached[trip] = on
+                arrival[b] = np.minimum(arrival[b], np.where(on, t_arr, np.inf))
+        return arrival
+
+
+def catchments(table, sources, departure, thresholds=THRESHOLDS):
+    '''Isochrone polygons of the sources
+
+    Parameters
+    ----------
+    table : ConnectionTable
+    sources : numpy.ndarray
+        (s, 2) array of (lat, lon)
+    departure : int
+        seconds after midnight
+    thresholds : list of int, optional
+        limits in minutes
+
+    Returns
+    -------
+    geopandas.GeoDataFrame
+        one row per source and threshold: ``source`` (position in
+        ``sources``), ``minutes`` and the polygon (EPSG:4326)
+    '''
+    arrival = table.earliest_arrival(sources, departure, max(thresholds))
+    stops = gpd.GeoSeries(gpd.points_from_xy(table.stop_lon, table.stop_lat), crs='EPSG:4326').to_crs('EPSG:2056')
+    origins = gpd.GeoSeries(gpd.points_from_xy(sources[:, 1], sources[:, 0]), crs='EPSG:4326').to_crs('EPSG:2056')
+    stop_geoms = np.asarray(stops, dtype=object)
+    rows = []
+    for s in range(len(sources)):
+        for minutes in thresholds:
+            left = (departure + minutes * 60 - arrival[:, s]) / 60.0 * WALKING_SPEED_M_PER_MIN
+            ok = left > 0
+            circles = shapely.buffer(stop_geoms[ok], np.minimum(left[ok], MAX_WALK_M), quad_segs=4)
+            walk = shapely.buffer(origins.iloc[s], minutes * WALKING_SPEED_M_PER_MIN, quad_segs=4)
+            rows.append((s, minutes, shapely.union_all(np.append(circles, walk))))
+    result = gpd.GeoDataFrame(rows, columns=['source', 'minutes', 'geometry'], crs='EPSG:2056')
+    return result.to_crs('EPSG:4326')
+
+
+def store_catchments(stores, departure, date=None, path=GTFS_DIR, thresholds=THRESHOLDS, window_minutes=15):
+    '''Cached ``catchments`` of a store table
+
+    The departure is rounded down to a window of ``window_minutes``: all the
+    requests within the same window share the same result on disk.
+
+    Parameters
+    ----------
+    stores : pandas.DataFrame
+        store table with ``Name``, ``Latitude`` and ``Longitude``
+    departure : datetime.time
+    date : datetime.date, optional
+
+    Returns
+    -------
+    geopandas.GeoDataFrame
+        see ``catchments``, with the ``Name`` of the store
+
+    Raises
+    ------
+    LookupError
+        if no service runs on ``date`` (see ``service_date``)
+    '''
+    date = service_date(path, date)
+    seconds = departure.hour * 3600 + departure.minute * 60
+    seconds -= seconds % (window_minutes * 60)
+    points = stores[['Latitude', 'Longitude']].to_numpy(dtype=np.float64)
+    signature = feed_signature(path)
+    key = hashlib.sha1(points.tobytes() + repr(sorted(thresholds)).encode()).hexdigest()[:12]
+    cache = os.path.join(ARTIFACT_DIR, 'isochrones_%s_%s_%s_%05d.feather' % (signature, key, date.strftime('%Y%m%d'), seconds))
+    if os.path.exists(cache):
+        return gpd.read_feather(cache)
+
+    (lat0, lat1) = points[:, 0].min(), points[:, 0].max()
+    (lon0, lon1) = points[:, 1].min(), points[:, 1].max()
+    margin = 0.35  # degrees, far more than 15 minutes of public transport around the stores
+    table_path = os.path.join(ARTIFACT_DIR, 'connections_%s_%s_%s.npz' % (signature, key, date.strftime('%Y%m%d')))
+    if os.path.exists(table_path):
+        table = ConnectionTable.load(table_path)
+    else:
+        table = ConnectionTable.from_gtfs(path, date, bbox=(lon0 - margin, lat0 - margin, lon1 + margin, lat1 + margin))
+        os.makedirs(ARTIFACT_DIR, exist_ok=True)
+        _replace(table_path, table.save)
+    result = catchments(table, points, seconds, thresholds)
+    result['Name'] = stores['Name'].to_numpy()[result['source'].to_numpy()]
+    _replace(cache, result.to_feather)
+    prune_cache(signature)
+    return result
@@ -0,0 +1,113 @@
+'''map layers: cached traces assembled into a figure on every run
+
+Streamlit reruns the whole script on every interaction. Adding traces to a
+figure kept in ``st.session_state`` makes it grow with each rerun, so the
+figure is instead rebuilt on every run from the layers that are checked, and
+only the (expensive) traces of the layers are kept between runs. With a
+shared ``src.cache.LayerCache``, a trace missing in the compositor is looked
+up there before it is built, so that other processes and replicas reuse it.
+Traces of the visible tiles only (with a ``tiles`` parameter) change with
+every pan: they are kept in the compositor but not written to the shared
+cache.
+Traces may be requested from several threads (see ``src.scheduler``).
+
+Classes
+-------
+LayerCompositor : registry of layer builders and cache of their traces
+'''
+
+import threading
+from collections import OrderedDict
+
+
+class LayerCompositor(object):
+    """Build each layer trace once and assemble figures from them
+
+    Builders are functions returning a plotly trace. Their result is cached by
+    layer name and parameters; the least recently used traces are dropped
+    when more than ``maxsize`` are cached.
+
+    Attributes
+    ----------
+    maxsize : int
+        maximum number of cached traces
+    store : src.cache.LayerCache or None
+        shared cache of the traces, keyed by ``version`` and ``region``
+    transient : tuple of str
+        parameters of the layers depending on the viewport: traces built with
+        one of them are not stored in ``store``
+    """
+
+    def __init__(self, maxsize=32, store=None, version=None, region=None, transient=('tiles',)):
+        self.maxsize = maxsize
+        self.transient = transient
+        self.store = store
+        self.version = version
+        self.region = region
+        self._builders = {}
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, name, builder):
+        '''Register the function building the trace of a layer
+
+        Parameters
+        ----------
+        name : str
+            layer name
+        builder : callable
+            called with the layer parameters as keyword arguments, returns a
+            plotly trace
+        '''
+        with self._lock:
+            self._builders[name] = builder
+            for key in [k for k in self._traces if k[0] == name]:
+                del self._traces[key]
+
+    def trace(self, name, **params):
+        '''Cached trace of a layer
+
+        The returned trace is shared: add it to a figure (which copies it)
+        but do not modify it.
+        '''
+        key = (name, tuple(sorted(params.items())))
+        with self._lock:
+            if key in self._traces:
+                self._traces.move_to_end(key)
+                return self._traces[key]
+        # built outside of the lock: other layers are built meanwhile
+        if self.store is None or any(params.get(p) is not None for p in self.transient):
+            trace = self._builders[name](**params)
+        else:
+            from src.cache import TRACE
+            trace = self.store.get(self.version, self.region, name, params, lambda: self._builders[name](**params), TRACE)
+        with self._lock:
+            self._traces[key] = trace
+            if len(self._traces) > self.maxsize:
+                self._traces.popitem(last=False)
+        return trace
+
+    def cached(self, name, **params):
+        '''bool: whether the trace of a layer is in the compositor'''
+        with self._lock:
+            return (name, tuple(sorted(params.items()))) in self._traces
+
+    def compose(self, base_map, layers):
+        '''Add the traces of the given layers to a new figure
+
+        Parameters
+        ----------
+        base_map : plotly.graph_objects.Figure
+            empty figure created for this run
+        layers : list of str or list of (str, dict)
+            layer names, or layer names with their parameters, in drawing order
+
+        Returns
+        -------
+        plotly.graph_objects.Figure
+            ``base_map`` with one trace per layer
+        '''
+        for layer in layers:
+            (name, params) = (layer, {}) if isinstance(layer, str) else layer
+            base_map.add_trace(self.trace(name, **params))
+        return base_map
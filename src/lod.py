@@ -0,0 +1,192 @@
+'''level of detail of the map layers from the current viewport
+
+The viewport (centre, zoom, bounds) is read from the relayout events of the
+plotly map (optional ``streamlit-plotly-mapbox-events`` component: without
+it, the app does not see the pans and sends the whole region). It is reduced to a zoom bucket (the zoom levels of the prebuilt
+payloads, ``src.payloads.ZOOM_LEVELS``) and to the web-mercator tiles of that
+bucket covering the viewport. Layers then only send the features of these
+tiles, and at low zoom they send clustered markers and coarser polygons. The
+features of each (layer, zoom bucket, tile) are cached, so panning only
+computes the tiles that were not visible before.
+
+Variables
+---------
+CLUSTER_ZOOM : below this zoom, store markers are clustered
+CLUSTER_PX : size of a cluster cell in screen pixels
+
+Classes
+-------
+TileCache : LRU cache of per-tile payloads
+'''
+
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from src.metadata import MAP_SIZE_PX
+from src.payloads import payload_zoom
+
+CLUSTER_ZOOM = 11
+CLUSTER_PX = 48
+
+
+def estimate_bounds(center, zoom, size_px=MAP_SIZE_PX):
+    '''(lon_min, lat_min, lon_max, lat_max) seen around a centre at a zoom'''
+    degrees_per_px = 360.0 / (256 * 2 ** zoom)
+    half_w = size_px[0] / 2 * degrees_per_px
+    half_h = size_px[1] / 2 * degrees_per_px * math.cos(math.radians(center['lat']))
+    return (center['lon'] - half_w, center['lat'] - half_h, center['lon'] + half_w, center['lat'] + half_h)
+
+
+def parse_relayout(relayout, default):
+    '''Viewport from a plotly relayout event of a mapbox figure
+
+    Parameters
+    ----------
+    relayout : dict or None
+        event data, with ``mapbox.center``, ``mapbox.zoom`` and possibly
+        ``mapbox._derived`` (corners of the map)
+    default : dict
+        viewport used for the missing values: ``center`` ({'lat', 'lon'})
+        and ``zoom``
+
+    Returns
+    -------
+    dict
+        ``center``, ``zoom`` and ``bounds`` (lon_min, lat_min, lon_max, lat_max)
+    '''
+    relayout = relayout or {}
+    center = relayout.get('mapbox.center', default['center'])
+    zoom = float(relayout.get('mapbox.zoom', default['zoom']))
+    corners = (relayout.get('mapbox._derived') or {}).get('coordinates')
+    if corners:
+        corners = np.asarray(corners, dtype=np.float64)
+        bounds = (corners[:, 0].min(), corners[:, 1].min(), corners[:, 0].max(), corners[:, 1].max())
+    else:
+        bounds = estimate_bounds(center, zoom)
+    return {'center': center, 'zoom': zoom, 'bounds': bounds}
+
+
+def zoom_bucket(zoom):
+    '''int: prebuilt zoom level used for a map zoom'''
+    return payload_zoom(zoom)
+
+
+def tile_of(lon, lat, z):
+    '''Web-mercator tile (x, y) of points at zoom ``z``, vectorized'''
+    n = 2 ** z
+    lat = np.clip(np.radians(lat), -1.4844, 1.4844)
+    x = np.floor((np.asarray(lon) + 180.0) / 360.0 * n).astype(np.int64)
+    y = np.floor((1.0 - np.arcsinh(np.tan(lat)) / math.pi) / 2.0 * n).astype(np.int64)
+    return np.clip(x, 0, n - 1), np.clip(y, 0, n - 1)
+
+
+def tile_bounds(x, y, z):
+    '''(lon_min, lat_min, lon_max, lat_max) of a tile'''
+    n = 2 ** z
+
+    def lat(t):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * t / n))))
+
+    return (x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y))
+
+
+def visible_tiles(bounds, z):
+    '''tuple of (x, y): tiles of zoom ``z`` covering the bounds'''
+    (lon0, lat0, lon1, lat1) = bounds
+    (x0, y1) = tile_of(lon0, lat0, z)
+    (x1, y0) = tile_of(lon1, lat1, z)
+    return tuple((int(x), int(y)) for x in range(int(x0), int(x1) + 1) for y in range(int(y0), int(y1) + 1))
+
+
+def cluster_points(lat, lon, zoom, cell_px=CLUSTER_PX):
+    '''Group points falling in the same screen cell at a zoom
+
+    Parameters
+    ----------
+    lat, lon : array_like
+    zoom : float
+    cell_px : int, optional
+        size of a cluster cell in pixels
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        mean latitude, mean longitude and size of each cluster, and the
+        cluster of each input point
+    '''
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    scale = 256 * 2 ** zoom / cell_px
+    x = np.floor((lon + 180.0) / 360.0 * scale)
+    y = np.floor((1.0 - np.arcsinh(np.tan(np.radians(lat))) / math.pi) / 2.0 * scale)
+    (_, cluster) = np.unique(np.column_stack([x, y]), axis=0, return_inverse=True)
+    cluster = cluster.ravel()
+    size = np.bincount(cluster)
+    return np.bincount(cluster, weights=lat) / size, np.bincount(cluster, weights=lon) / size, size, cluster
+
+
+class TileCache(object):
+    """LRU cache of the payloads of (layer, zoom bucket, tile)
+
+    Safe to share between threads: the layers built concurrently (see
+    ``src.scheduler``) collect the same tiles. A tile is built once, outside
+    of the lock; the other threads asking for it meanwhile wait for it.
+
+    Attributes
+    ----------
+    maxsize : int
+        maximum number of cached tiles
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        '''Cached ``build()`` for a key'''
+        while True:
+            with self._lock:
+                if key in self._items:
+                    self._items.move_to_end(key)
+                    return self._items[key]
+                building = self._building.get(key)
+                if building is None:
+                    building = self._building[key] = threading.Event()
+                    break
+            building.wait()  # built by another thread: read it, or build it if that failed
+        try:
+            value = build()
+            with self._lock:
+                self._items[key] = value
+                if len(self._items) > self.maxsize:
+                    self._items.popitem(last=False)
+            return value
+        finally:
+            with self._lock:
+                del self._building[key]
+            building.set()
+
+    def collect(self, layer, bucket, tiles, build):
+        '''Union of the per-tile payloads of a layer
+
+        Parameters
+        ----------
+        layer : str
+        bucket : int
+        tiles : iterable of (int, int)
+        build : callable
+            ``build(bounds)`` returns the ids (array) of the features of a tile
+
+        Returns
+        -------
+        numpy.ndarray
+            sorted unique ids of the features of all the tiles
+        '''
+        parts = [self.get((layer, bucket, tile), lambda tile=tile: build(tile_bounds(tile[0], tile[1], bucket)))
+                 for tile in tiles]
+        return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
@@ -0,0 +1,251 @@
+'''plotly traces of the map layers
+
+The builders take the data they draw as arguments and do not use streamlit,
+so that the same maps are drawn by the app (``src.app``, which adds the level
+of detail and the caching) and rendered without it.
+
+Functions
+---------
+create_base_map : empty map figure
+add_PT, add_POP, add_COMP, add_MIGROS : add a layer of a whole table to a map
+'''
+
+import plotly.graph_objects as go
+
+
+# EMPTY BASE map:
+#################################################
+def create_base_map(center, zoom, uirevision=None, style='open-street-map'):
+    '''Empty mapbox figure
+
+    Parameters
+    ----------
+    center : dict
+        {'lat', 'lon'} of the centre of the map
+    zoom : float
+    uirevision : str, optional
+        plotly keeps the view of the user between updates with the same value
+    style : str, optional
+        mapbox style, 'white-bg' draws no background tiles
+    '''
+    base_map = go.Figure(go.Scattermapbox())
+    base_map.update_layout(
+        mapbox_style=style,
+        mapbox_zoom=zoom,
+        mapbox_center=center,
+        uirevision=uirevision,
+    )
+    return base_map
+
+
+def finish_layout(base_map):
+    '''Legend in the upper left corner, set once all the layers are added'''
+    base_map.update_layout(legend=dict(yanchor='top', y=0.99, xanchor='left', x=0.01))
+    return base_map
+
+
+# Layer Public transport
+############################################
+def PT_trace(geojson, locations, z, zrange=None):
+    '''Choropleth of the public transport accessibility
+
+    Parameters
+    ----------
+    geojson : dict or str
+        features with an ``id``, or the URL of a GeoJSON file
+    locations : array_like
+        ids of the features drawn
+    z : array_like
+        accessibility of these features
+    zrange : tuple of float, optional
+        (min, max) of the color scale, the range of ``z`` if not given
+    '''
+    return go.Choroplethmapbox(
+        geojson=geojson,
+        locations=locations,
+        z=z,
+        featureidkey='id',
+        marker_opacity=0.5,
+        marker_line_width=0,
+        colorbar=dict(title='Public Transport Accessibility'),
+        **_range(zrange),
+        hovertemplate='Public Transport Accessibility: %{z}<extra></extra>',
+        showlegend=True,
+        name='Public Transport Accessibility'
+    )
+
+
+# Layer POPULATION DENSITY
+############################################
+def POP_trace(geojson, locations, z, zrange=None):
+    '''Choropleth of the population density (inhabitants per km2), see ``PT_trace``'''
+    return go.Choroplethmapbox(
+        geojson=geojson,
+        locations=locations,
+        z=z,
+        featureidkey='id',
+        colorscale='Blues',
+        marker_opacity=0.5,
+        marker_line_width=0,
+        colorbar=dict(title='Inhabitants per km2', x=1.1),
+        **_range(zrange),
+        hovertemplate='Population density: %{z:.0f} / km2<extra></extra>',
+        showlegend=True,
+        name='Population density'
+    )
+
+
+# Layer SUITABILITY
+############################################
+def score_trace(geojson, locations, z):
+    '''Choropleth of the suitability index, on a fixed [0, 1] scale'''
+    return go.Choroplethmapbox(
+        geojson=geojson,
+        locations=locations,
+        z=z,
+        featureidkey='id',
+        colorscale='RdYlGn',
+        zmin=0, zmax=1,
+        marker_opacity=0.5,
+        marker_line_width=0,
+        hovertemplate='Suitability: %{z:.2f}<extra></extra>',
+        name='Suitability'
+    )
+
+
+# Layer MARKET SHARE
+############################################
+def SHARE_trace(geojson, locations, z):
+    '''Choropleth of the expected Migros market share (Huff model), on a fixed [0, 1] scale'''
+    return go.Choroplethmapbox(
+        geojson=geojson,
+        locations=locations,
+        z=z,
+        featureidkey='id',
+        colorscale='Oranges',
+        zmin=0, zmax=1,
+        marker_opacity=0.5,
+        marker_line_width=0,
+        colorbar=dict(title='Migros market share', x=1.3),
+        hovertemplate='Migros market share: %{z:.0%}<extra></extra>',
+        showlegend=True,
+        name='Migros market share'
+    )
+
+
+# Layers COMPETITORS and MIGROS
+############################################
+def COMP_trace(lat, lon, text, size=10):
+    '''Markers of the competitors (or of clusters of them)'''
+    return go.Scattermapbox(
+        lat=lat,
+        lon=lon,
+        mode='markers',
+        marker=dict(size=size, color='red', opacity=0.7),
+        text=text,
+        hoverinfo='text',
+        name='Competitors'
+    )
+
+
+def MIGROS_trace(lat, lon, text, size=10):
+    '''Markers of the Migros stores (or of clusters of them)'''
+    return go.Scattermapbox(
+        lat=lat,
+        lon=lon,
+        mode='markers',
+        marker=dict(size=size, color='green', opacity=0.7),
+        text=text,
+        hoverinfo='text',
+        name='Migros'
+    )
+
+
+# Layer BEST CANDIDATE ZONES
+############################################
+def TOP_trace(points, top):
+    '''Ranked markers of the best zones
+
+    Parameters
+    ----------
+    points : numpy.ndarray
+        (k, 2) (lat, lon) of the zones
+    top : pandas.Series
+        score of the zones, best first (see ``SuitabilityScorer.top_k``)
+    '''
+    return go.Scattermapbox(
+        lat=points[:, 0],
+        lon=points[:, 1],
+        mode='markers+text',
+        marker=dict(size=16, color='gold', opacity=0.9),
+        text=[str(rank) for rank in range(1, len(top) + 1)],
+        hovertext=[f'#{rank} zone {zone}: score {score:.2f}' for (rank, (zone, score)) in enumerate(top.items(), 1)],
+        hoverinfo='text',
+        name='Best candidate zones'
+    )
+
+
+# Layer PROPOSED NEW STORES
+############################################
+def NEW_trace(placement):
+    '''Ranked markers of the proposed stores (see ``src.placement.place_stores``)'''
+    return go.Scattermapbox(
+        lat=placement['lat'],
+        lon=placement['lon'],
+        mode='markers+text',
+        marker=dict(size=16, color='orange', opacity=0.9),
+        text=[str(rank) for rank in range(1, len(placement) + 1)],
+        hovertext=[f'new store #{rank}: +{gain:,.0f} covered' for (rank, gain) in enumerate(placement['marginal_coverage'], 1)],
+        hoverinfo='text',
+        name='Proposed new stores'
+    )
+
+
+# Layer PUBLIC TRANSPORT CATCHMENTS OF THE STORES
+############################################
+def ISO_trace(catchments):
+    '''Catchments of the stores (see ``src.isochrones.store_catchments``), largest first'''
+    catchments = catchments.sort_values('minutes', ascending=False)  # 5 min on top
+    return go.Choroplethmapbox(
+        geojson=catchments.geometry.__geo_interface__,
+        locations=[str(i) for i in catchments.index],
+        z=catchments['minutes'],
+        colorscale='Viridis_r',
+        marker_opacity=0.3,
+        marker_line_width=0,
+        colorbar=dict(title='Minutes by public transport', x=1.2),
+        text=catchments['Name'],
+        hovertemplate='%{text}: %{z} min<extra></extra>',
+        showlegend=True,
+        name='Public transport catchments'
+    )
+
+
+def add_PT(base_map, zones, zrange=None):
+    '''Add the accessibility of all the zones (in EPSG:4326) to a map'''
+    base_map.add_trace(PT_trace(zones.geometry.__geo_interface__, [str(i) for i in zones.index],
+                                zones['OeV_Erreichb_EW'], zrange))
+    return base_map
+
+
+def add_POP(base_map, zones, zrange=None):
+    '''Add the population density of all the zones (in EPSG:4326) to a map'''
+    base_map.add_trace(POP_trace(zones.geometry.__geo_interface__, [str(i) for i in zones.index],
+                                 zones['population_density'], zrange))
+    return base_map
+
+
+def add_COMP(base_map, comp):
+    '''Add all the competitors of a store table to a map'''
+    base_map.add_trace(COMP_trace(comp['Latitude'], comp['Longitude'], comp['Name']))
+    return base_map
+
+
+def add_MIGROS(base_map, migros):
+    '''Add all the Migros stores of a store table to a map'''
+    base_map.add_trace(MIGROS_trace(migros['Latitude'], migros['Longitude'], migros['Name']))
+    return base_map
+
+
+def _range(zrange):
+    return {} if zrange is None else dict(zip(['zmin', 'zmax'], zrange))
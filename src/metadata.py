@@ -0,0 +1,94 @@
+'''region metadata: centre, bounds, fitted zoom and value ranges
+
+Computed once per region when the zone artifact is built (in LV95, where
+centroids and areas are meaningful), and stored as a small JSON file next to
+it. The map builders read the centre, the zoom and the color ranges from here
+instead of computing centroids of all the zones on every rerun.
+
+Variables
+---------
+MAP_SIZE_PX : size of the map the zoom is fitted to
+'''
+
+import json
+import math
+
+import numpy as np
+from pyproj import Transformer
+
+MAP_SIZE_PX = (900, 500)
+
+
+def fit_zoom(bounds, size_px=MAP_SIZE_PX, padding=0.05):
+    '''Largest web-mercator zoom showing the bounds in a map of ``size_px``
+
+    Parameters
+    ----------
+    bounds : tuple of float
+        (lon_min, lat_min, lon_max, lat_max)
+
+    Returns
+    -------
+    float
+        zoom, rounded down to a quarter
+    '''
+    (lon0, lat0, lon1, lat1) = bounds
+
+    def merc(lat):
+        return math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+    width = max(lon1 - lon0, 1e-6) / 360.0
+    height = max(merc(lat1) - merc(lat0), 1e-6) / (2 * math.pi)
+    zoom = min(math.log2(size_px[0] / 256.0 / width), math.log2(size_px[1] / 256.0 / height))
+    zoom -= math.log2(1 + 2 * padding)
+    return math.floor(zoom * 4) / 4
+
+
+def region_metadata(zones):
+    '''Metadata of the zones of a region
+
+    Parameters
+    ----------
+    zones : geopandas.GeoDataFrame
+        zones in LV95 (EPSG:2056)
+
+    Returns
+    -------
+    dict
+        ``center`` ({'lat', 'lon'}, centroid of the region), ``bounds``
+        (WGS84) and ``bounds_lv95``, ``zoom``, ``n_zones`` and ``ranges``
+        ([min, max] of every numeric column)
+    '''
+    area = zones.area.to_numpy()
+    centroids = zones.centroid
+    (x, y) = (np.average(centroids.x, weights=area), np.average(centroids.y, weights=area)) if area.sum() > 0 \
+        else (centroids.x.mean(), centroids.y.mean())
+    to_wgs84 = Transformer.from_crs(zones.crs, 'EPSG:4326', always_xy=True)
+    (lon, lat) = to_wgs84.transform(x, y)
+    (xmin, ymin, xmax, ymax) = zones.total_bounds
+    (lons, lats) = to_wgs84.transform([xmin, xmax, xmax, xmin], [ymin, ymin, ymax, ymax])
+    bounds = (min(lons), min(lats), max(lons), max(lats))
+    return {
+        'center': {'lat': float(lat), 'lon': float(lon)},
+        'bounds': [float(b) for b in bounds],
+        'bounds_lv95': [float(b) for b in (xmin, ymin, xmax, ymax)],
+        'zoom': fit_zoom(bounds),
+        'n_zones': int(len(zones)),
+        'ranges': value_ranges(zones),
+    }
+
+
+def value_ranges(table):
+    '''dict: [min, max] of the numeric columns of a table, for color scales'''
+    numeric = table.select_dtypes('number')
+    return {c: [float(numeric[c].min()), float(numeric[c].max())] for c in numeric.columns if numeric[c].notna().any()}
+
+
+def save_metadata(meta, path):
+    with open(path, 'w') as f:
+        json.dump(meta, f, indent=1)
+
+
+def read_metadata(path):
+    with open(path) as f:
+        return json.load(f)
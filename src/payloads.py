@@ -0,0 +1,165 @@
+'''prebuilt GeoJSON payloads of the zones, per region and zoom level
+
+``px.choropleth_mapbox(AREA, geojson=AREA.geometry, ...)`` serializes the full
+geometry of the zones into the figure on every rerun, and this GeoJSON is then
+sent to the browser inside the figure. Instead, the zones are written once per
+region and zoom level as small GeoJSON files (simplified to the zoom level and
+with coordinates rounded to the pixel size) served as static files by
+streamlit. The choropleth trace only holds the URL of the payload, the ids of
+the zones and their values; the browser fetches (and caches) the geometry.
+The hexagons of the H3 grid (``src.hexgrid``) are served the same way, one
+payload per resolution.
+
+Streamlit serves ``./static`` under ``app/static`` when ``enableStaticServing``
+is set (see ``.streamlit/config.toml``).
+
+Variables
+---------
+PAYLOAD_DIR : directory of the GeoJSON files, served by streamlit
+PAYLOAD_URL : URL of ``PAYLOAD_DIR`` seen from the browser
+ZOOM_LEVELS : zoom levels a payload is built for
+'''
+
+import json
+import math
+import os
+import tempfile
+
+import numpy as np
+import shapely
+from shapely.geometry import mapping
+
+from src.perf import span
+from src.preprocess import ARTIFACT_VERSION, region_slug, simplify_tolerance
+
+PAYLOAD_DIR = './static/geojson'
+PAYLOAD_URL = 'app/static/geojson'
+ZOOM_LEVELS = [6, 8, 10, 12]
+
+
+def payload_zoom(zoom):
+    '''int: smallest prebuilt zoom level not coarser than ``zoom``'''
+    for level in ZOOM_LEVELS:
+        if level >= zoom:
+            return level
+    return ZOOM_LEVELS[-1]
+
+
+def payload_name(region, checksum, zoom):
+    '''str: file name of the payload of a region at a (prebuilt) zoom level'''
+    return '%s_v%d_%s_z%d.geojson' % (region_slug(region), ARTIFACT_VERSION, checksum[:12], zoom)
+
+
+def to_geojson(zones, zoom):
+    '''Simplified and quantized GeoJSON of zones in EPSG:4326
+
+    Parameters
+    ----------
+    zones : geopandas.GeoDataFrame
+        zones in EPSG:4326, the index is written as feature ``id``
+    zoom : int
+        zoom level: geometries are simplified to half a pixel and coordinates
+        rounded to a tenth of a pixel at this zoom
+
+    Returns
+    -------
+    str
+        compact GeoJSON FeatureCollection without properties; recorded as a
+        ``serialize.geojson`` span with its features, vertices and bytes
+    '''
+    with span('serialize.geojson', features=len(zones)) as counts:
+        lat = float(np.mean(zones.total_bounds[[1, 3]]))
+        meters = simplify_tolerance(zoom, lat)
+        degrees = meters / 111320.0
+        decimals = max(0, int(math.ceil(-math.log10(degrees / 5))))
+        geoms = shapely.simplify(np.asarray(zones.geometry, dtype=object), degrees, preserve_topology=True)
+        geoms = shapely.transform(geoms, lambda coords: np.round(coords, decimals))
+        counts['vertices'] = int(shapely.get_num_coordinates(geoms).sum())
+        # integer zone ids, H3 cells as strings (64-bit integers do not survive JavaScript)
+        features = [
+            {'type': 'Feature', 'id': int(fid) if isinstance(fid, (int, np.integer)) else str(fid), 'geometry': mapping(geom)}
+            for (fid, geom) in zip(zones.index, geoms)
+        ]
+        text = json.dumps({'type': 'FeatureCollection', 'features': features}, separators=(',', ':'))
+        counts['bytes'] = len(text)
+    return text
+
+
+def build_payloads(region, zones, checksum, zoom_levels=ZOOM_LEVELS):
+    '''Write the payloads of a region for all the zoom levels
+
+    Returns
+    -------
+    list of str
+        paths of the written files
+    '''
+    paths = []
+    for zoom in zoom_levels:
+        path = os.path.join(PAYLOAD_DIR, payload_name(region, checksum, zoom))
+        write_payload(path, zones, zoom)
+        paths.append(path)
+    return paths
+
+
+def write_payload(path, zones, zoom):
+    '''Write the GeoJSON of ``to_geojson`` (atomically)'''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')  # one per writer: layers are built concurrently
+    with os.fdopen(fd, 'w') as f:
+        f.write(to_geojson(zones, zoom))
+    os.replace(tmp, path)
+
+
+def payload_path(region, checksum, zoom):
+    '''str: file of the payload of a region for a map zoom'''
+    return os.path.join(PAYLOAD_DIR, payload_name(region, checksum, payload_zoom(zoom)))
+
+
+def payload_url(region, zones, checksum, zoom):
+    '''URL of the payload of a region for a map zoom, built if missing
+
+    Parameters
+    ----------
+    region : str
+    zones : geopandas.GeoDataFrame
+        preprocessed zones of the region (used only if the payload is missing)
+    checksum : str
+        checksum of the source GeoPackage
+    zoom : float
+        zoom of the map
+
+    Returns
+    -------
+    str
+        URL to give as ``geojson`` to a choropleth trace
+    '''
+    path = payload_path(region, checksum, zoom)
+    if not os.path.exists(path):
+        build_payloads(region, zones, checksum)
+    return '%s/%s' % (PAYLOAD_URL, os.path.basename(path))
+
+
+def grid_payload_path(region, checksum, res):
+    '''str: file of the payload of the hexagons of a resolution'''
+    name = '%s_v%d_%s_h%d.geojson' % (region_slug(region), ARTIFACT_VERSION, checksum[:12], res)
+    return os.path.join(PAYLOAD_DIR, name)
+
+
+def grid_payload_url(region, grid, checksum, res):
+    '''URL of the payload of the hexagons of a resolution, built if missing
+
+    Parameters
+    ----------
+    grid : geopandas.GeoDataFrame
+        hexagons of the resolution, indexed by cell (see ``src.hexgrid.hex_grid``)
+    res : int
+        H3 resolution
+
+    Returns
+    -------
+    str
+    '''
+    path = grid_payload_path(region, checksum, res)
+    if not os.path.exists(path):
+        write_payload(path, grid, ZOOM_LEVELS[-1])
+    return '%s/%s' % (PAYLOAD_URL, os.path.basename(path))
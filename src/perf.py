@@ -0,0 +1,206 @@
+'''timing and memory spans of the load, transform and render stages
+
+Every stage of a run (reading the artifact, computing features, building a
+trace, serializing the figure, ...) is wrapped in a span. A span records its
+wall time and, when memory tracing is on, the memory it allocated (peak, via
+``tracemalloc``), plus counts set by the stage itself: rows decoded,
+vertices serialized, bytes sent to the browser.
+
+The peak of ``tracemalloc`` is global to the process: it is only reset and
+read by one span at a time, a top-level span (nested spans are counted in
+their parent and have no ``memory_bytes``). It is approximate when other
+threads allocate during that span, their allocations are counted too. Spans are aggregated per
+stage over the life of the process (all the sessions), with quantiles over
+the most recent ones, which is what latency objectives are set on.
+
+The aggregates are exported as JSON lines (one line per stage) or as
+Prometheus text, e.g. written periodically to the directory of the node
+exporter textfile collector.
+
+Variables
+---------
+RECORDER : recorder of the process, used by ``span`` and ``timed``
+
+Classes
+-------
+Recorder : spans and per-stage aggregates
+'''
+
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+import numpy as np
+
+
+class Recorder(object):
+    """Spans of the stages and their aggregates
+
+    Attributes
+    ----------
+    window : int
+        number of recent durations kept per stage for the quantiles
+    trace_memory : bool
+        record allocated memory (``tracemalloc`` slows Python down: off by
+        default)
+    """
+
+    def __init__(self, window=1024, trace_memory=False):
+        self.window = window
+        self.trace_memory = trace_memory
+        self._stages = {}
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._memory = threading.Lock()  # held by the span owning the peak of tracemalloc
+        self._local = threading.local()
+
+    def set_memory_tracing(self, enabled):
+        '''Start or stop the memory tracing of the spans'''
+        self.trace_memory = enabled
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextmanager
+    def span(self, stage, **counts):
+        '''Time a block as a stage
+
+        Parameters
+        ----------
+        stage : str
+            e.g. 'load.zones', 'build.PT', 'render.figure'
+        **counts : int
+            initial counts of the span
+
+        Yields
+        ------
+        dict
+            counts of the span, to be updated by the block (e.g. ``rows``,
+            ``vertices``, ``bytes``)
+        '''
+        counts = dict(counts)
+        depth = getattr(self._local, 'depth', 0)
+        memory = (self.trace_memory and depth == 0 and tracemalloc.is_tracing()
+                  and self._memory.acquire(blocking=False))
+        if memory:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            seconds = time.perf_counter() - start
+            self._local.depth = depth
+            if memory:
+                counts['memory_bytes'] = max(0, tracemalloc.get_traced_memory()[1] - before)
+                self._memory.release()
+            self.record(stage, seconds, **counts)
+
+    def record(self, stage, seconds, **counts):
+        '''Add a finished span'''
+        with self._lock:
+            agg = self._stages.get(stage)
+            if agg is None:
+                agg = self._stages[stage] = {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'counts': {},
+                                             'recent': deque(maxlen=self.window)}
+            agg['count'] += 1
+            agg['seconds'] += seconds
+            agg['max_seconds'] = max(agg['max_seconds'], seconds)
+            agg['recent'].append(seconds)
+            for (name, value) in counts.items():
+                agg['counts'][name] = agg['counts'].get(name, 0) + value
+            self._recent.append(dict(counts, stage=stage, time=time.time(), seconds=seconds))
+
+    def add(self, stage, **counts):
+        '''Add counts to a stage without timing anything'''
+        self.record(stage, 0.0, **counts)
+
+    def summary(self):
+        '''list of dict: per stage ``count``, ``seconds`` (total), ``mean_s``,
+        ``p50_s``, ``p95_s``, ``max_s`` and the summed counts, slowest first'''
+        with self._lock:
+            stages = [(stage, dict(agg, recent=np.array(agg['recent']), counts=dict(agg['counts'])))
+                      for (stage, agg) in self._stages.items()]
+        rows = []
+        for (stage, agg) in stages:
+            (p50, p95) = np.percentile(agg['recent'], [50, 95]) if len(agg['recent']) else (0.0, 0.0)
+            rows.append(dict({
+                'stage': stage,
+                'count': agg['count'],
+                'seconds': agg['seconds'],
+                'mean_s': agg['seconds'] / agg['count'],
+                'p50_s': float(p50),
+                'p95_s': float(p95),
+                'max_s': agg['max_seconds'],
+            }, **agg['counts']))
+        return sorted(rows, key=lambda row: -row['seconds'])
+
+    def recent(self):
+        '''list of dict: the last spans, oldest first'''
+        with self._lock:
+            return list(self._recent)
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._recent.clear()
+
+    def to_jsonl(self):
+        '''str: ``summary`` as JSON lines'''
+        return ''.join(json.dumps(row) + '\n' for row in self.summary())
+
+    def to_prometheus(self, prefix='migros'):
+        '''str: ``summary`` in the Prometheus text exposition format'''
+        lines = [
+            '# HELP %s_stage_seconds Wall time of the stages of the app.' % prefix,
+            '# TYPE %s_stage_seconds summary' % prefix,
+        ]
+        counters = {}
+        for row in self.summary():
+            label = 'stage="%s"' % row['stage'].replace('\\', '\\\\').replace('"', '\\"')
+            lines.append('%s_stage_seconds{%s,quantile="0.5"} %.6f' % (prefix, label, row['p50_s']))
+            lines.append('%s_stage_seconds{%s,quantile="0.95"} %.6f' % (prefix, label, row['p95_s']))
+            lines.append('%s_stage_seconds_sum{%s} %.6f' % (prefix, label, row['seconds']))
+            lines.append('%s_stage_seconds_count{%s} %d' % (prefix, label, row['count']))
+            for name in sorted(set(row) - {'stage', 'count', 'seconds', 'mean_s', 'p50_s', 'p95_s', 'max_s'}):
+                counters.setdefault(name, []).append('%s_stage_%s_total{%s} %d' % (prefix, name, label, row[name]))
+        for (name, values) in sorted(counters.items()):
+            lines.append('# TYPE %s_stage_%s_total counter' % (prefix, name))
+            lines.extend(values)
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, fmt='prometheus'):
+        '''Write ``to_prometheus`` or ``to_jsonl`` (``fmt='jsonl'``) to a file, atomically'''
+        text = self.to_jsonl() if fmt == 'jsonl' else self.to_prometheus()
+        # one temporary file per writer: every session writes the file after its runs
+        (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+
+RECORDER = Recorder()
+
+
+def span(stage, **counts):
+    '''``RECORDER.span``'''
+    return RECORDER.span(stage, **counts)
+
+
+def timed(stage):
+    '''Decorator recording every call of a function as a span of ``stage``'''
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with RECORDER.span(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,190 @@
+'''placement of k new stores: maximal coverage location problem
+
+Every candidate site (a zone) covers the demand of the zones within a radius.
+Demand already covered by an existing Migros is not counted again, so a new
+store next to an existing one has little value (cannibalization). The k sites
+covering the largest additional demand are chosen either with a lazy greedy
+algorithm (submodular objective: priorities in a heap are only recomputed when
+they reach its top) or exactly with a MILP solved by HiGHS through SciPy.
+
+Coverage is stored as a sparse candidates x zones matrix, built from radius
+queries in a BallTree: its size grows with the number of zones in the radius,
+not with the square of the number of zones.
+
+Functions
+---------
+coverage_matrix : sparse coverage of the zones by the candidate sites
+greedy_placement : lazy greedy solution
+milp_placement : exact solution
+place_stores : table of the chosen sites with their marginal coverage
+'''
+
+import heapq
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.optimize import Bounds, LinearConstraint, milp
+
+from src.proximity import EARTH_RADIUS_KM, build_tree
+
+
+def coverage_matrix(candidates, demand_points, radius_km):
+    '''Sparse matrix of the demand points within ``radius_km`` of each candidate
+
+    Parameters
+    ----------
+    candidates : numpy.ndarray
+        (m, 2) array of (lat, lon) of the candidate sites
+    demand_points : numpy.ndarray
+        (n, 2) array of (lat, lon) of the demand (zones)
+    radius_km : float
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+        (m, n) boolean matrix
+    '''
+    tree = build_tree(demand_points)
+    if tree is None or len(candidates) == 0:
+        return sparse.csr_matrix((len(candidates), len(demand_points)), dtype=bool)
+    rows = tree.query_radius(np.radians(candidates), r=radius_km / EARTH_RADIUS_KM)
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(r) for r in rows], out=indptr[1:])
+    indices = np.concatenate(rows).astype(np.int64)
+    data = np.ones(len(indices), dtype=bool)
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(candidates), len(demand_points)))
+
+
+def covered_by(stores, demand_points, radius_km):
+    '''numpy.ndarray of bool: demand points within ``radius_km`` of any store'''
+    if len(stores) == 0:
+        return np.zeros(len(demand_points), dtype=bool)
+    return np.asarray(coverage_matrix(stores, demand_points, radius_km).sum(axis=0)).ravel() > 0
+
+
+def greedy_placement(coverage, demand, k, covered=None):
+    '''Lazy greedy maximal coverage
+
+    Parameters
+    ----------
+    coverage : scipy.sparse.csr_matrix
+        (m, n) coverage of the demand by the candidates
+    demand : numpy.ndarray
+        (n,) demand of each zone
+    k : int
+        number of stores to place
+    covered : numpy.ndarray of bool, optional
+        (n,) demand already covered by existing stores
+
+    Returns
+    -------
+    (list of int, list of float)
+        chosen candidates in order and their marginal coverage, which is
+        positive: fewer than ``k`` if the rest of the demand is covered
+    '''
+    coverage = sparse.csr_matrix(coverage)
+    covered = np.zeros(coverage.shape[1], dtype=bool) if covered is None else covered.copy()
+    weight = np.where(covered, 0.0, demand)
+    gains = coverage.astype(np.float64) @ weight
+    heap = [(-g, j, 0) for (j, g) in enumerate(gains)]
+    heapq.heapify(heap)
+    chosen, marginal = [], []
+    while heap and len(chosen) < k:
+        (neg_gain, j, stamp) = heapq.heappop(heap)
+        if stamp == len(chosen):
+            if neg_gain >= 0:
+                break   # the largest gain is up to date: no candidate covers any more demand
+            chosen.append(j)
+            marginal.append(-neg_gain)
+            cols = coverage.indices[coverage.indptr[j]:coverage.indptr[j + 1]]
+            weight[cols] = 0.0
+            continue
+        # the gain can only have decreased since it was computed (submodularity)
+        cols = coverage.indices[coverage.indptr[j]:coverage.indptr[j + 1]]
+        heapq.heappush(heap, (-weight[cols].sum(), j, len(chosen)))
+    return chosen, marginal
+
+
+def milp_placement(coverage, demand, k, covered=None, time_limit=60):
+    '''Exact maximal coverage with a mixed integer program (HiGHS)
+
+    Variables are x_j (candidate j is chosen) and y_i (zone i is covered by a
+    new store), maximize sum(demand_i y_i) subject to y_i <= sum_j a_ji x_j
+    and sum(x_j) <= k. Zones already covered are left out.
+
+    Returns
+    -------
+    (list of int, list of float)
+        chosen candidates, ordered by marginal coverage as in
+        ``greedy_placement``, and their marginal coverage; the candidates
+        which add no coverage are left out
+    '''
+    coverage = sparse.csr_matrix(coverage)
+    (m, n) = coverage.shape
+    covered = np.zeros(n, dtype=bool) if covered is None else covered
+    open_zones = np.flatnonzero(~covered & (demand > 0))
+    a = coverage[:, open_zones].T.tocsr().astype(np.float64)   # zones x candidates
+    n_open = len(open_zones)
+    c = np.concatenate([np.zeros(m), -demand[open_zones]])
+    cover = sparse.hstack([-a, sparse.identity(n_open, format='csr')], format='csr')
+    count = sparse.csr_matrix(np.concatenate([np.ones(m), np.zeros(n_open)]))
+    constraints = [
+        LinearConstraint(cover, -np.inf, 0.0),
+        LinearConstraint(count, 0, min(k, m)),
+    ]
+    result = milp(c, constraints=constraints, integrality=np.ones(m + n_open),
+                  bounds=Bounds(0, 1), options={'time_limit': time_limit})
+    if result.x is None:
+        raise RuntimeError('MILP placement failed: %s' % result.message)
+    selected = np.flatnonzero(result.x[:m] > 0.5)
+    if len(selected) == 0:
+        return [], []
+    # order the selected sites greedily to report their marginal coverage
+    (order, marginal) = greedy_placement(coverage[selected], demand, len(selected), covered)
+    return [int(selected[j]) for j in order], marginal
+
+
+def place_stores(zones_points, demand, existing, k, radius_km, mode='greedy', index=None):
+    '''Choose ``k`` zones for new stores
+
+    Parameters
+    ----------
+    zones_points : numpy.ndarray
+        (n, 2) array of (lat, lon) of the zones, both candidates and demand
+    demand : array_like
+        (n,) demand per zone (population or ``OeV_Erreichb_EW``)
+    existing : numpy.ndarray
+        (s, 2) array of (lat, lon) of the existing Migros stores
+    k : int
+    radius_km : float
+        coverage radius of a store
+    mode : {'greedy', 'milp'}
+    index : array_like, optional
+        zone ids, by default 0..n-1
+
+    Returns
+    -------
+    pandas.DataFrame
+        one row per new store, in order: ``zone``, ``lat``, ``lon``,
+        ``marginal_coverage`` and ``cumulative_coverage``; fewer than ``k``
+        rows when the other stores would cover no more demand
+    '''
+    demand = np.nan_to_num(np.asarray(demand, dtype=np.float64))
+    index = np.arange(len(demand)) if index is None else np.asarray(index)
+    coverage = coverage_matrix(zones_points, zones_points, radius_km)
+    covered = covered_by(existing, zones_points, radius_km)
+    if mode == 'greedy':
+        (chosen, marginal) = greedy_placement(coverage, demand, k, covered)
+    elif mode == 'milp':
+        (chosen, marginal) = milp_placement(coverage, demand, k, covered)
+    else:
+        raise ValueError('unknown mode: %s' % mode)
+    chosen = np.asarray(chosen, dtype=np.int64)
+    return pd.DataFrame({
+        'zone': index[chosen],
+        'lat': zones_points[chosen, 0],
+        'lon': zones_points[chosen, 1],
+        'marginal_coverage': marginal,
+        'cumulative_coverage': np.cumsum(marginal),
+    })
@@ -0,0 +1,172 @@
+'''population per traffic zone from a hectare grid or a raster
+
+The population comes either from a STATPOP-style hectare CSV (one row per
+inhabited hectare, with the LV95 coordinates of its corner and the number of
+inhabitants) or from a GeoTIFF. National grids are large: the CSV is read in
+chunks and only the rows inside the bounding box of the region are kept, the
+GeoTIFF is read through a window covering the region only. The cells are then
+assigned to the zones and summed with ``np.bincount`` (zonal sum).
+
+The result is cached as a small Feather file next to the zone artifact.
+
+Variables
+---------
+POPULATION_CSV : hectare grid (STATPOP) in ./data
+POPULATION_TIF : population raster in ./data
+STATPOP_COLUMNS : coordinate and population columns of the hectare grid
+'''
+
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from src.preprocess import artifact_path
+from src.spatial_index import ZoneIndex
+
+POPULATION_CSV = './data/STATPOP_hectare.csv'
+POPULATION_TIF = './data/population.tif'
+STATPOP_COLUMNS = {'x': 'E_KOORD', 'y': 'N_KOORD', 'population': 'BBTOT'}
+HECTARE = 100.0
+
+
+def read_hectares(path, bbox, columns=STATPOP_COLUMNS, chunksize=500000, sep=None):
+    '''Hectare cells of a STATPOP-style CSV within a bounding box
+
+    Parameters
+    ----------
+    path : str
+        CSV (``;`` or ``,`` separated) with the LV95 coordinates of the
+        south-west corner of each hectare and its population
+    bbox : tuple of float
+        (xmin, ymin, xmax, ymax) in LV95
+    columns : dict, optional
+        names of the ``x``, ``y`` and ``population`` columns
+    chunksize : int, optional
+        number of rows read at once
+
+    Returns
+    -------
+    pandas.DataFrame
+        ``x``, ``y`` (center of the hectare) and ``population``
+    '''
+    if sep is None:
+        with open(path) as f:
+            sep = ';' if ';' in f.readline() else ','
+    rename = {v: k for (k, v) in columns.items()}
+    parts = []
+    (xmin, ymin, xmax, ymax) = bbox
+    for chunk in pd.read_csv(path, sep=sep, usecols=list(rename), chunksize=chunksize):
+        chunk = chunk.rename(columns=rename)
+        x = chunk['x'].to_numpy(dtype=np.float64) + HECTARE / 2
+        y = chunk['y'].to_numpy(dtype=np.float64) + HECTARE / 2
+        keep = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+        if keep.any():
+            parts.append(pd.DataFrame({'x': x[keep], 'y': y[keep], 'population': chunk['population'].to_numpy()[keep]}))
+    if not parts:
+        return pd.DataFrame({'x': [], 'y': [], 'population': []})
+    return pd.concat(parts, ignore_index=True)
+
+
+def hectares_per_zone(cells, zones):
+    '''Sum of the population of the cells whose center lies in each zone
+
+    Parameters
+    ----------
+    cells : pandas.DataFrame
+        ``x``, ``y`` in the CRS of ``zones`` and ``population``
+    zones : geopandas.GeoDataFrame or ZoneIndex
+        zones or their spatial index
+
+    Returns
+    -------
+    pandas.Series
+        population per zone, indexed by zone id
+    '''
+    index = zones if isinstance(zones, ZoneIndex) else ZoneIndex.from_zones(zones)
+    zone = index.zone_of(cells['x'].to_numpy(), cells['y'].to_numpy(), crs='EPSG:2056')
+    population = cells['population'].groupby(zone).sum()
+    return population.reindex(index.ids, fill_value=0).astype(np.float64).rename_axis(None).rename('population')
+
+
+def raster_per_zone(path, zones, band=1):
+    '''Zonal sum of a population raster, read through the window of the zones
+
+    The zones are rasterized on the grid of the window (label = position of
+    the zone + 1) and the pixels summed per label with ``np.bincount``.
+
+    Parameters
+    ----------
+    path : str
+        GeoTIFF with inhabitants per pixel
+    zones : geopandas.GeoDataFrame
+        zones (reprojected to the CRS of the raster if needed)
+
+    Returns
+    -------
+    pandas.Series
+        population per zone, indexed like ``zones``
+    '''
+    import rasterio
+    from rasterio import features, windows
+
+    with rasterio.open(path) as src:
+        zones = zones.to_crs(src.crs) if zones.crs != src.crs else zones
+        window = windows.from_bounds(*zones.total_bounds, transform=src.transform)
+        window = window.round_offsets().round_lengths().intersection(windows.Window(0, 0, src.width, src.height))
+        data = src.read(band, window=window, masked=True).filled(0).astype(np.float64)
+        transform = src.window_transform(window)
+    labels = features.rasterize(
+        ((geom, i + 1) for (i, geom) in enumerate(zones.geometry)),
+        out_shape=data.shape, transform=transform, fill=0, dtype='int32',
+    )
+    values = np.bincount(labels.ravel(), weights=data.ravel(), minlength=len(zones) + 1)[1:]
+    return pd.Series(values, index=zones.index, name='population')
+
+
+def zone_population(zones, csv_path=POPULATION_CSV, tif_path=POPULATION_TIF):
+    '''Population per zone from the hectare CSV, or else from the raster
+
+    Parameters
+    ----------
+    zones : geopandas.GeoDataFrame
+        zones of a region (any CRS)
+
+    Returns
+    -------
+    pandas.Series or None
+        population per zone, ``None`` if there is no population data
+    '''
+    if os.path.exists(csv_path):
+        index = ZoneIndex.from_zones(zones)
+        bbox = tuple(shapely.total_bounds(index.geometries))
+        return hectares_per_zone(read_hectares(csv_path, bbox), index)
+    if os.path.exists(tif_path):
+        return raster_per_zone(tif_path, zones)
+    return None
+
+
+def load_population(region, zones, checksum, csv_path=POPULATION_CSV, tif_path=POPULATION_TIF):
+    '''Cached ``zone_population`` of a region
+
+    The column is stored next to the zone artifact of the region and rebuilt
+    when the zones or the population file change.
+
+    Returns
+    -------
+    pandas.Series or None
+        population per zone
+    '''
+    source = csv_path if os.path.exists(csv_path) else tif_path
+    if not os.path.exists(source):
+        return None
+    path = artifact_path(region, checksum, 'population_%d.feather' % int(os.path.getmtime(source)))
+    if os.path.exists(path):
+        return pd.read_feather(path).set_index('zone')['population']
+    population = zone_population(zones, csv_path, tif_path)
+    for old in glob.glob(artifact_path(region, checksum, 'population_*.feather')):
+        os.remove(old)
+    population.rename_axis('zone').reset_index().to_feather(path)
+    return population
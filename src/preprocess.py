@@ -0,0 +1,213 @@
+'''offline preprocessing of the traffic zones into per-region artifacts
+
+The zones of a region are read from the national GeoPackage, simplified in
+LV95 to the tolerance needed at the largest zoom level of the map, reprojected
+to WGS84 once, and written as an uncompressed Feather (Arrow IPC) file, with
+the metadata of the region (``src.metadata``) in a JSON file. The app reads
+this file memory-mapped at startup instead of filtering and reprojecting the
+GeoPackage on every rerun; the attribute columns are not copied, but the
+geometries are still decoded from WKB.
+
+Artifacts are versioned by ``ARTIFACT_VERSION`` and by the checksum of the
+source GeoPackage: when the GeoPackage changes, the file name changes and the
+artifact is rebuilt. The files of the region built from other checksums or
+versions (zones, metadata, spatial index, population, ...) are then removed.
+
+Examples
+--------
+    $ python -m src.preprocess AI ZH
+    $ python -m src.preprocess --all --max-zoom 13
+
+The spatial index of the zones (``src.spatial_index``) and the GeoJSON payloads
+of the map (``src.payloads``) are built at the same time.
+'''
+
+import argparse
+import glob
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+
+import geopandas as gpd
+
+from src.metadata import read_metadata, region_metadata, save_metadata
+from src.regions import CANTONS, RegionRegistry
+from src.zones import ZONES_PATH, ZONES_LAYER
+
+ARTIFACT_DIR = './data/artifacts'
+ARTIFACT_VERSION = 1
+"""int: version of the artifact format, to increase when ``build_artifact`` changes"""
+
+MAX_ZOOM = 13
+"""int: largest zoom level at which the zones are displayed without visible simplification"""
+
+
+def source_checksum(path=ZONES_PATH):
+    '''SHA-256 of a file, cached in a side file as long as size and mtime do not change
+
+    Parameters
+    ----------
+    path : str
+        file to hash (e.g. the zones GeoPackage)
+
+    Returns
+    -------
+    str
+        hex digest
+    '''
+    stat = os.stat(path)
+    key = {'size': stat.st_size, 'mtime': stat.st_mtime}
+    side = path + '.sha256.json'
+    if os.path.exists(side):
+        with open(side) as f:
+            cached = json.load(f)
+        if cached.get('size') == key['size'] and cached.get('mtime') == key['mtime']:
+            return cached['sha256']
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    key['sha256'] = h.hexdigest()
+    with open(side, 'w') as f:
+        json.dump(key, f)
+    return key['sha256']
+
+
+def simplify_tolerance(zoom, lat=46.8):
+    '''Half of the size of a screen pixel at a zoom level, in meters
+
+    Simplifying with this tolerance does not change the rendering at ``zoom``
+    and below.
+    '''
+    return 156543.03 * math.cos(math.radians(lat)) / 2 ** zoom / 2
+
+
+def region_slug(region):
+    '''str: region name usable in a file name'''
+    return re.sub(r'[^0-9A-Za-z]+', '_', region).strip('_')
+
+
+def artifact_path(region, checksum, suffix='zones.feather'):
+    '''Path of the artifact of a region for a given source checksum'''
+    return os.path.join(ARTIFACT_DIR, '%s_v%d_%s_%s' % (region_slug(region), ARTIFACT_VERSION, checksum[:12], suffix))
+
+
+def remove_stale_artifacts(region, checksum):
+    '''Remove the artifacts of a region built from another checksum or version
+
+    Returns
+    -------
+    list of str
+        removed paths
+    '''
+    current = os.path.basename(artifact_path(region, checksum, ''))
+    pattern = re.compile(r'%s_v\d+_[0-9a-f]{12}_' % re.escape(region_slug(region)))
+    removed = []
+    for path in glob.glob(os.path.join(ARTIFACT_DIR, region_slug(region) + '_v*')):
+        name = os.path.basename(path)
+        if pattern.match(name) and not name.startswith(current):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue  # removed by another process
+            removed.append(path)
+    return removed
+
+
+def build_artifact(region, registry=None, max_zoom=MAX_ZOOM, checksum=None):
+    '''Preprocess the zones of a region and write the artifact
+
+    Parameters
+    ----------
+    region : str
+        name understood by ``RegionRegistry.zone_ids``
+    registry : RegionRegistry, optional
+    max_zoom : int, optional
+        zoom level the simplification tolerance is computed for
+    checksum : str, optional
+        checksum of the source GeoPackage, computed if not given
+
+    Returns
+    -------
+    str
+        path of the written artifact
+    '''
+    registry = registry or RegionRegistry()
+    checksum = checksum or source_checksum(registry.zones_path)
+    zones = registry.load(region)
+    zones['geometry'] = zones.geometry.simplify(simplify_tolerance(max_zoom), preserve_topology=True)
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    save_metadata(region_metadata(zones), artifact_path(region, checksum, 'meta.json'))
+    zones = zones.to_crs('EPSG:4326')
+    path = artifact_path(region, checksum)
+    remove_stale_artifacts(region, checksum)
+    (fd, tmp) = tempfile.mkstemp(dir=ARTIFACT_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        zones.to_feather(f, compression='uncompressed')
+    os.replace(tmp, path)
+    return path
+
+
+def load_artifact(region, zones_path=ZONES_PATH):
+    '''Read the zones of a region (memory-mapped), building the artifact if needed
+
+    Returns
+    -------
+    geopandas.GeoDataFrame
+        zones in EPSG:4326, indexed by feature id
+    '''
+    checksum = source_checksum(zones_path)
+    path = artifact_path(region, checksum)
+    if not os.path.exists(path):
+        path = build_artifact(region, RegionRegistry(zones_path), checksum=checksum)
+    return gpd.read_feather(path, memory_map=True)
+
+
+def load_metadata(region, zones_path=ZONES_PATH):
+    '''Metadata of a region stored with its artifact (see ``src.metadata``)
+
+    Returns
+    -------
+    dict
+        centre, bounds, fitted zoom, number of zones and value ranges
+    '''
+    checksum = source_checksum(zones_path)
+    path = artifact_path(region, checksum, 'meta.json')
+    if not os.path.exists(path):
+        # artifact built before the metadata existed
+        zones = load_artifact(region, zones_path).to_crs('EPSG:2056')
+        save_metadata(region_metadata(zones), path)
+    return read_metadata(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Preprocess the traffic zones into per-region artifacts')
+    parser.add_argument('regions', nargs='*', help='canton abbreviations or region names')
+    parser.add_argument('--all', action='store_true', help='all the cantons')
+    parser.add_argument('--max-zoom', type=int, default=MAX_ZOOM)
+    parser.add_argument('--zones', default=ZONES_PATH)
+    parser.add_argument('--layer', default=ZONES_LAYER)
+    parser.add_argument('--no-payloads', action='store_true', help='do not build the GeoJSON payloads of the map')
+    args = parser.parse_args(argv)
+
+    regions = list(CANTONS) if args.all else args.regions
+    if not regions:
+        parser.error('no region given')
+    registry = RegionRegistry(args.zones, args.layer)
+    checksum = source_checksum(args.zones)
+    for region in regions:
+        path = build_artifact(region, registry, args.max_zoom, checksum)
+        print(path)
+        from src.spatial_index import load_index
+        load_index(region, gpd.read_feather(path), checksum)
+        if not args.no_payloads:
+            from src.payloads import build_payloads
+            for payload in build_payloads(region, gpd.read_feather(path), checksum):
+                print(payload)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+'''store proximity features per traffic zone
+
+For every zone (or any set of points, e.g. grid cells) the distance to the
+nearest Migros, the distance to the nearest competitor and the number of
+stores within a radius are computed from the ``Latitude``/``Longitude``
+columns of the store tables. Nearest neighbours and radius counts use a
+BallTree with the haversine metric, distances between arrays of points use
+NumPy broadcasting: there is no loop over zones or stores.
+
+Variables
+---------
+EARTH_RADIUS_KM : mean radius of the earth
+'''
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    '''Great-circle distance in km, broadcast over the inputs
+
+    Parameters
+    ----------
+    lat1, lon1, lat2, lon2 : array_like
+        coordinates in degrees, e.g. ``lat1[:, None]`` and ``lat2[None, :]``
+        for the full distance matrix between two sets of points
+
+    Returns
+    -------
+    numpy.ndarray
+        distances in km
+    '''
+    (lat1, lon1, lat2, lon2) = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def zone_points(zones):
+    '''Point on the surface of each zone
+
+    Parameters
+    ----------
+    zones : geopandas.GeoDataFrame
+        zones in EPSG:4326
+
+    Returns
+    -------
+    numpy.ndarray
+        (n, 2) array of (lat, lon) in degrees
+    '''
+    points = zones.geometry.representative_point()
+    return np.column_stack([points.y.to_numpy(), points.x.to_numpy()])
+
+
+def store_points(stores):
+    '''numpy.ndarray: (n, 2) array of the (lat, lon) of a store table'''
+    return stores[['Latitude', 'Longitude']].to_numpy(dtype=np.float64)
+
+
+def build_tree(points):
+    '''BallTree with the haversine metric over (lat, lon) points in degrees, ``None`` if there is no point'''
+    if len(points) == 0:
+        return None
+    return BallTree(np.radians(points), metric='haversine')
+
+
+def nearest_km(tree, points, k=1):
+    '''Distance in km from each point to its ``k`` nearest points of ``tree``
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray)
+        distances (n, k) in km and indices (n, k) into the points of the tree;
+        if the tree holds fewer than ``k`` points the missing columns are
+        ``inf`` and -1
+    '''
+    n = 0 if tree is None else tree.data.shape[0]
+    dist = np.full((len(points), k), np.inf)
+    ind = np.full((len(points), k), -1, dtype=np.int64)
+    if n and len(points):
+        (d, i) = tree.query(np.radians(points), k=min(k, n))
+        dist[:, :d.shape[1]] = d * EARTH_RADIUS_KM
+        ind[:, :i.shape[1]] = i
+    return dist, ind
+
+
+def count_within(tree, points, radius_km):
+    '''numpy.ndarray: number of points of ``tree`` within ``radius_km`` of each point'''
+    if tree is None or len(points) == 0:
+        return np.zeros(len(points), dtype=np.int64)
+    return tree.query_radius(np.radians(points), r=radius_km / EARTH_RADIUS_KM, count_only=True)
+
+
+def proximity_features(points, migros, comp, radius_km=2.0, index=None):
+    '''Distances to the nearest stores and number of stores within a radius
+
+    Parameters
+    ----------
+    points : numpy.ndarray
+        (n, 2) array of (lat, lon), see ``zone_points``
+    migros, comp : pandas.DataFrame
+        store tables with ``Latitude`` and ``Longitude``
+    radius_km : float, optional
+        radius of the store counts
+    index : array_like, optional
+        index of the result (e.g. the zone ids)
+
+    Returns
+    -------
+    pandas.DataFrame
+        ``dist_migros_km``, ``dist_comp_km`` (``inf`` when there is no
+        store), ``n_migros``, ``n_comp`` and ``n_stores`` within the radius
+    '''
+    migros_tree = build_tree(store_points(migros))
+    comp_tree = build_tree(store_points(comp))
+    n_migros = count_within(migros_tree, points, radius_km)
+    n_comp = count_within(comp_tree, points, radius_km)
+    return pd.DataFrame({
+        'dist_migros_km': nearest_km(migros_tree, points)[0][:, 0],
+        'dist_comp_km': nearest_km(comp_tree, points)[0][:, 0],
+        'n_migros': n_migros,
+        'n_comp': n_comp,
+        'n_stores': n_migros + n_comp,
+    }, index=index)
+
+
+def zone_features(zones, migros, comp, radius_km=2.0):
+    '''``proximity_features`` of the traffic zones, indexed like ``zones``'''
+    return proximity_features(zone_points(zones), migros, comp, radius_km, index=zones.index)
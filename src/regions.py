@@ -0,0 +1,211 @@
+'''region registry: traffic zones per canton, district and municipality
+
+The traffic zones of the GeoPackage are assigned once to the boundaries of
+swissBOUNDARIES3D (a point on the surface of each zone is joined to the
+cantons, districts and municipalities). The result is stored as a compact
+index of feature ids next to the GeoPackage, so that selecting the zones of a
+region is a dictionary lookup followed by a read of these features only.
+
+swissBOUNDARIES3D is only read to build the index: download the GeoPackage
+from swisstopo (https://www.swisstopo.admin.ch/en/landscape-model-swissboundaries3d)
+to ``BOUNDARIES_PATH`` before the first run, or after the zones change.
+
+Variables
+---------
+BOUNDARIES_PATH : swissBOUNDARIES3D GeoPackage (LV95)
+BOUNDARY_LAYERS : layer of the GeoPackage per region level
+CANTONS : official number of the cantons per abbreviation
+LEVELS : region levels, in the order they are searched by name
+
+Classes
+-------
+RegionRegistry : lookup of the zone ids of a region
+'''
+
+import os
+
+import numpy as np
+import geopandas as gpd
+
+from src.zones import ZONES_PATH, ZONES_LAYER, load_zones
+
+BOUNDARIES_PATH = './data/swissBOUNDARIES3D_1_5_LV95_LN02.gpkg'
+BOUNDARY_LAYERS = {
+    'canton': 'tlm_kantonsgebiet',
+    'district': 'tlm_bezirksgebiet',
+    'municipality': 'tlm_hoheitsgebiet',
+}
+LEVELS = ['canton', 'district', 'municipality']
+
+CANTONS = {
+    'ZH': 1, 'BE': 2, 'LU': 3, 'UR': 4, 'SZ': 5, 'OW': 6, 'NW': 7, 'GL': 8, 'ZG': 9,
+    'FR': 10, 'SO': 11, 'BS': 12, 'BL': 13, 'SH': 14, 'AR': 15, 'AI': 16, 'SG': 17,
+    'GR': 18, 'AG': 19, 'TG': 20, 'TI': 21, 'VD': 22, 'VS': 23, 'NE': 24, 'GE': 25, 'JU': 26,
+}
+
+
+def registry_path(zones_path=ZONES_PATH):
+    '''Path of the region index stored next to the zones GeoPackage'''
+    return os.path.splitext(zones_path)[0] + '.regions.npz'
+
+
+def build_registry(zones_path=ZONES_PATH, zones_layer=ZONES_LAYER, boundaries_path=BOUNDARIES_PATH):
+    '''Assign every traffic zone to its canton, district and municipality
+
+    Each zone is represented by a point on its surface, so that it belongs to
+    exactly one region per level even if it crosses a border. Only the
+    geometries of the zones are read.
+
+    Parameters
+    ----------
+    zones_path, zones_layer : str
+        national traffic zones
+    boundaries_path : str
+        swissBOUNDARIES3D GeoPackage
+
+    Returns
+    -------
+    dict of numpy.ndarray
+        the arrays stored by ``save_registry``: ``levels`` and ``names`` of
+        the regions, ``offsets`` into ``fids`` (zone ids of region i are
+        ``fids[offsets[i]:offsets[i+1]]``), ``bounds`` of the regions (LV95)
+        and the canton ``numbers`` (0 for the other levels)
+
+    Raises
+    ------
+    FileNotFoundError
+        if the swissBOUNDARIES3D GeoPackage is missing
+    '''
+    if not os.path.exists(boundaries_path):
+        raise FileNotFoundError('the region index of the zones has to be built from swissBOUNDARIES3D, '
+                                'which is missing: download the GeoPackage from swisstopo to %s' % boundaries_path)
+    zones = load_zones(zones_path, zones_layer, columns=[])
+    points = gpd.GeoDataFrame(geometry=zones.geometry.representative_point(), crs=zones.crs)
+    bounds = zones.bounds
+
+    levels, names, numbers, offsets, fids, region_bounds = [], [], [], [0], [], []
+    for level in LEVELS:
+        columns = ['name', 'kantonsnummer'] if level == 'canton' else ['name']
+        boundaries = gpd.read_file(boundaries_path, layer=BOUNDARY_LAYERS[level], columns=columns, engine='pyogrio')
+        joined = gpd.sjoin(points, boundaries.to_crs(zones.crs), predicate='within', how='inner')
+        joined = joined[~joined.index.duplicated(keep='first')]
+        for (name, group) in joined.groupby('name', sort=True):
+            ids = np.sort(group.index.to_numpy(dtype=np.int64))
+            levels.append(level)
+            names.append(name)
+            numbers.append(int(group['kantonsnummer'].iloc[0]) if level == 'canton' else 0)
+            fids.append(ids)
+            offsets.append(offsets[-1] + len(ids))
+            b = bounds.loc[ids]
+            region_bounds.append((b.minx.min(), b.miny.min(), b.maxx.max(), b.maxy.max()))
+
+    return {
+        'levels': np.array(levels),
+        'names': np.array(names),
+        'numbers': np.array(numbers, dtype=np.int16),
+        'offsets': np.array(offsets, dtype=np.int64),
+        'fids': np.concatenate(fids) if fids else np.empty(0, dtype=np.int64),
+        'bounds': np.array(region_bounds, dtype=np.float64).reshape(-1, 4),
+        'source_mtime': np.array(os.path.getmtime(zones_path)),
+    }
+
+
+def save_registry(arrays, path):
+    '''Write the arrays of ``build_registry`` to a compressed .npz file'''
+    np.savez_compressed(path, **arrays)
+
+
+class RegionRegistry(object):
+    """Lookup of the traffic zones of a canton, district or municipality
+
+    The registry is built on first use and cached next to the GeoPackage. It
+    is rebuilt when the GeoPackage is newer than the cached index, from the
+    boundaries of swissBOUNDARIES3D (``FileNotFoundError`` if they are missing).
+
+    Attributes
+    ----------
+    zones_path : str
+        GeoPackage the zone ids refer to
+    """
+
+    def __init__(self, zones_path=ZONES_PATH, zones_layer=ZONES_LAYER, boundaries_path=BOUNDARIES_PATH):
+        self.zones_path = zones_path
+        self.zones_layer = zones_layer
+        path = registry_path(zones_path)
+        arrays = None
+        if os.path.exists(path):
+            with np.load(path) as f:
+                arrays = {k: f[k] for k in f.files}
+            if float(arrays['source_mtime']) != os.path.getmtime(zones_path):
+                arrays = None
+        if arrays is None:
+            arrays = build_registry(zones_path, zones_layer, boundaries_path)
+            save_registry(arrays, path)
+        self._fids = arrays['fids']
+        self._offsets = arrays['offsets']
+        self._bounds = arrays['bounds']
+        self._levels = arrays['levels']
+        self._names = arrays['names']
+        self._cantons = []
+        self._lookup = {}
+        for (i, (level, name)) in enumerate(zip(self._levels, self._names)):
+            self._lookup[(str(level), str(name).lower())] = i
+        for (abbreviation, number) in CANTONS.items():
+            rows = np.flatnonzero((self._levels == 'canton') & (arrays['numbers'] == number))
+            if len(rows):
+                self._lookup[('canton', abbreviation.lower())] = int(rows[0])
+                self._cantons.append(abbreviation)
+
+    def names(self, level='canton'):
+        '''list of str: names of the regions of a level'''
+        return [str(n) for (l, n) in zip(self._levels, self._names) if l == level]
+
+    def cantons(self):
+        '''list of str: abbreviations of the cantons with zones, in the order of their number'''
+        return list(self._cantons)
+
+    def name(self, name, level=None):
+        '''Full name of a region given by abbreviation or name ('AI' -> 'Appenzell Innerrhoden')'''
+        if name.upper() == 'CH':
+            return 'Switzerland'
+        return str(self._names[self._row(name, level)])
+
+    def _row(self, name, level=None):
+        levels = LEVELS if level is None else [level]
+        for level in levels:
+            row = self._lookup.get((level, name.lower()))
+            if row is not None:
+                return row
+        raise KeyError('unknown region: %s' % name)
+
+    def zone_ids(self, name, level=None):
+        '''Feature ids of the zones of a region
+
+        Parameters
+        ----------
+        name : str
+            canton abbreviation ('AI'), or name of a canton, district or
+            municipality; 'CH' returns all the zones of the country
+        level : str, optional
+            one of ``LEVELS``, by default the levels are searched in order
+
+        Returns
+        -------
+        numpy.ndarray of int
+            sorted feature ids
+        '''
+        if name.upper() == 'CH':
+            return np.unique(self._fids[:self._offsets[np.sum(self._levels == 'canton')]])
+        row = self._row(name, level)
+        return self._fids[self._offsets[row]:self._offsets[row + 1]]
+
+    def bounds(self, name, level=None):
+        '''tuple of float: (xmin, ymin, xmax, ymax) of the zones of a region, in LV95'''
+        if name.upper() == 'CH':
+            b = self._bounds[self._levels == 'canton']
+            return (b[:, 0].min(), b[:, 1].min(), b[:, 2].max(), b[:, 3].max())
+        return tuple(self._bounds[self._row(name, level)])
+
+    def load(self, name, level=None, **kwargs):
+        '''Read the zones of a region only, see ``src.zones.load_zones``'''
+        return load_zones(self.zones_path, self.zones_layer, fids=self.zone_ids(name, level), **kwargs)
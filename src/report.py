@@ -0,0 +1,215 @@
+'''headless report: static maps and ranking tables per region
+
+For every region, without streamlit:
+
+- a map of the public transport accessibility, the competitors, the Migros
+  stores and the best candidate zones, drawn with the builders of the app
+  (``src.maps``) on the ``white-bg`` style: no tile server is needed, the
+  zones themselves are the background. It is written as PNG and / or PDF
+  by plotly's local renderer (kaleido);
+- the ranking of the zones (``src.batch.analyse_region``) as a CSV table,
+  best zone first.
+
+Regions are rendered in a process pool, one region per task. A manifest in
+the output directory keeps, for every region, a key of its inputs (zones
+GeoPackage, store catalog, population, parameters) and the files written:
+a region whose key has not changed since the last run, and whose files are
+still there, is skipped. A region that fails is recorded with its error
+(and rendered again by the next run); the others go on, and the run exits
+with status 1.
+
+Variables
+---------
+REPORT_DIR : default output directory
+REPORT_VERSION : part of the input key, to be increased when the layout changes
+FORMATS : image formats written by default
+IMAGE_SCALE : pixel ratio of the PNG images
+
+Examples
+--------
+    $ python -m src.report --all
+    $ python -m src.report AI AR --formats png --top-k 20
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.batch import analyse_region, prepare, read_manifest, write_manifest
+from src.metadata import MAP_SIZE_PX
+from src.population import POPULATION_CSV, POPULATION_TIF
+from src.preprocess import ARTIFACT_DIR, ARTIFACT_VERSION, load_artifact, load_metadata, region_slug, source_checksum
+from src.regions import CANTONS
+from src.stores import STORES_PATH, load_stores, store_files
+from src.zones import ZONES_PATH
+
+REPORT_DIR = './data/reports'
+REPORT_VERSION = 1
+FORMATS = ['png', 'pdf']
+IMAGE_SCALE = 2
+
+
+def input_key(region, params, zones_path=ZONES_PATH, stores_path=STORES_PATH,
+              population_paths=(POPULATION_CSV, POPULATION_TIF)):
+    '''Key of everything the report of a region is made from
+
+    The files are identified by their SHA-256 (cached next to them, see
+    ``src.preprocess.source_checksum``): the zones, the store files the
+    region is read from (the catalog, or the CSVs without it, see
+    ``src.stores.store_files``) and the population; missing optional files
+    are skipped.
+
+    Returns
+    -------
+    str
+    '''
+    h = hashlib.sha256(json.dumps([REPORT_VERSION, ARTIFACT_VERSION, region, params], sort_keys=True).encode())
+    for path in [zones_path] + store_files(region, stores_path) + list(population_paths):
+        if os.path.exists(path):
+            h.update(('%s:%s' % (os.path.basename(path), source_checksum(path))).encode())
+    return h.hexdigest()[:16]
+
+
+def stale_regions(regions, manifest, keys, force=False):
+    '''Regions to render: new inputs, failed or missing files in the last run
+
+    Parameters
+    ----------
+    regions : list of str
+    manifest : dict
+        region -> entry of the last run (see ``src.batch.read_manifest``)
+    keys : dict
+        region -> ``input_key`` of this run
+    force : bool, optional
+        all the regions
+
+    Returns
+    -------
+    list of str
+        in the order of ``regions``
+    '''
+    def unchanged(region):
+        entry = manifest.get(region, {})
+        return entry.get('key') == keys[region] and all(os.path.exists(path) for path in entry['files'])
+
+    return [region for region in regions if force or not unchanged(region)]
+
+
+def region_map(region, zones, table, migros, comp, top_k=10, zones_path=ZONES_PATH):
+    '''Static map of a region
+
+    Parameters
+    ----------
+    zones : geopandas.GeoDataFrame
+        zones of the region in EPSG:4326
+    table : pandas.DataFrame
+        ranking of the zones (see ``src.batch.analyse_region``)
+    migros, comp : pandas.DataFrame
+        store tables
+
+    Returns
+    -------
+    plotly.graph_objects.Figure
+    '''
+    from src.maps import TOP_trace, add_COMP, add_MIGROS, add_PT, create_base_map, finish_layout
+    from src.proximity import zone_points
+
+    meta = load_metadata(region, zones_path)
+    figure = create_base_map(meta['center'], meta['zoom'], style='white-bg')
+    add_PT(figure, zones, meta['ranges'].get('OeV_Erreichb_EW'))
+    add_MIGROS(add_COMP(figure, comp), migros)
+    top = table['score'].nlargest(top_k)
+    figure.add_trace(TOP_trace(zone_points(zones.loc[top.index]), top))
+    finish_layout(figure)
+    figure.update_layout(title=f'{region}: best candidate zones', width=MAP_SIZE_PX[0], height=MAP_SIZE_PX[1],
+                         margin=dict(l=0, r=0, t=40, b=0))
+    return figure
+
+
+def render_region(region, out_dir=REPORT_DIR, radius_km=2.0, top_k=10, formats=FORMATS,
+                  zones_path=ZONES_PATH, stores_path=STORES_PATH):
+    '''Write the map images and the ranking table of a region, executed in a worker process
+
+    Returns
+    -------
+    (str, list of str, float)
+        region, paths of the files written, seconds
+    '''
+    start = time.perf_counter()
+    table = analyse_region(region, radius_km, zones_path=zones_path, stores_path=stores_path).sort_values('rank')
+    zones = load_artifact(region, zones_path)
+    (migros, comp) = load_stores(region, zones, stores_path)
+    stem = os.path.join(out_dir, region_slug(region))
+    files = [stem + '_ranking.csv']
+    table.to_csv(files[0])
+    figure = region_map(region, zones, table, migros, comp, top_k, zones_path)
+    for fmt in formats:
+        path = '%s_map.%s' % (stem, fmt)
+        figure.write_image(path, format=fmt, scale=IMAGE_SCALE if fmt == 'png' else 1)
+        files.append(path)
+    return region, files, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Static maps and ranking tables per region')
+    parser.add_argument('regions', nargs='*', help='canton abbreviations or region names')
+    parser.add_argument('--all', action='store_true', help='all the cantons')
+    parser.add_argument('--out', default=REPORT_DIR, help='output directory')
+    parser.add_argument('--formats', nargs='+', default=FORMATS, choices=['png', 'pdf', 'svg'])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--radius-km', type=float, default=2.0)
+    parser.add_argument('--top-k', type=int, default=10, help='candidate zones marked on the maps')
+    parser.add_argument('--zones', default=ZONES_PATH)
+    parser.add_argument('--stores', default=STORES_PATH, help='store catalog (see src.stores)')
+    parser.add_argument('--force', action='store_true', help='render the regions whose inputs did not change too')
+    args = parser.parse_args(argv)
+
+    regions = list(CANTONS) if args.all else args.regions
+    if not regions:
+        parser.error('no region given')
+    os.makedirs(args.out, exist_ok=True)
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    manifest = read_manifest(args.out)
+    params = {'radius_km': args.radius_km, 'top_k': args.top_k, 'formats': sorted(args.formats)}
+    keys = {region: input_key(region, params, args.zones, args.stores) for region in regions}
+    todo = stale_regions(regions, manifest, keys, args.force)
+    for region in sorted(set(regions) - set(todo)):
+        print('%-6s unchanged' % region)
+    if not todo:
+        return 0
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        failed = prepare(todo, pool, args.zones)
+        for (region, error) in failed.items():
+            manifest[region] = {'error': error, 'time': time.time()}
+            print('%-6s failed: %s' % (region, error.strip().splitlines()[-1]))
+        futures = {
+            pool.submit(render_region, region, args.out, args.radius_km, args.top_k, args.formats,
+                        args.zones, args.stores): region
+            for region in todo if region not in failed
+        }
+        for future in as_completed(futures):
+            region = futures[future]
+            try:
+                (_, files, seconds) = future.result()
+            except Exception as error:
+                failed[region] = ''.join(traceback.format_exception(error))
+                manifest[region] = {'error': failed[region], 'time': time.time()}
+                print('%-6s failed: %r' % (region, error))
+            else:
+                manifest[region] = {'key': keys[region], 'files': files, 'time': time.time()}
+                print('%-6s %7.2fs  %s' % (region, seconds, ', '.join(files)))
+            write_manifest(manifest, args.out)  # after every region: an interrupted run keeps what is done
+    write_manifest(manifest, args.out)
+    print('%d regions rendered in %.1fs, %d failed' % (len(todo), time.perf_counter() - start, len(failed)))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,486 @@
+'''drive and walk travel times on the road network of a local OSM extract
+
+The ways of an OSM PBF extract (read with pyosmium) are turned into a graph
+whose vertices are only the junctions: the nodes shared by several ways and
+the ends of the ways. The nodes in between (degree 2) are contracted away at
+parse time, their lengths are summed into the edge, which typically leaves a
+tenth of the nodes. The graph is stored as CSR arrays (one per mode, with the
+travel time in seconds of each edge) in an .npz file next to the extract.
+
+Travel times between points (zone centres and stores) are answered in batch:
+the points are snapped to their nearest junction (the snapping distance is
+walked, or driven at a low access speed), and Dijkstra searches of
+``scipy.sparse.csgraph`` run from the side with fewer distinct junctions,
+bounded by a maximum travel time. The searches are restricted to the part of
+the network that can be reached within that time, in two steps:
+
+- locality: no path leaves a circle of radius limit x top speed of the mode,
+  so the origins are grouped by area and each group only takes the junctions
+  within that circle;
+- landmarks (ALT): the travel times from and to ``LANDMARKS`` junctions spread
+  over the network are computed once with the graph. By the triangle
+  inequality, they give a lower bound of the time from the origins of a group
+  to every junction; the junctions whose bound exceeds the limit are dropped
+  (on a fast road, the circle is far larger than what the time limit allows
+  on the slow roads around it).
+
+Every junction of a path within the limit is itself within the limit, so the
+searches on the remaining subgraph are exact. Contraction hierarchies would
+answer single queries faster, but need a custom search: scipy's Dijkstra runs
+on a subgraph unchanged. The distance matrices of scipy are dense (origins x
+junctions of the subgraph), the groups are split to keep them under
+``MAX_CELLS``. Matrices are cached on disk per region, mode and point sets, the
+``MAX_CACHED`` most recent per region.
+
+Variables
+---------
+OSM_PATH : the OSM extract
+MODES : speed (km/h) per highway type, per mode
+ACCESS_SPEED_KMH : speed on the snapping distance, per mode
+MAX_CELLS : largest distance matrix of one Dijkstra call (origins x junctions)
+LANDMARKS : junctions whose travel times bound the searches, per mode
+GRAPH_VERSION : format of the stored graph, part of its file name
+NEAREST_FACTOR : nearest stores are searched up to this multiple of the catchment time
+MAX_CACHED : travel time matrices kept per region
+
+Classes
+-------
+RoadGraph : junction graph of an extract, with batched travel-time queries
+'''
+
+import glob
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from src.preprocess import artifact_path, source_checksum
+from src.proximity import EARTH_RADIUS_KM, build_tree, haversine, nearest_km, store_points, zone_points
+
+OSM_PATH = './data/switzerland-latest.osm.pbf'
+
+MODES = {
+    'drive': {
+        'motorway': 110, 'motorway_link': 60, 'trunk': 80, 'trunk_link': 50, 'primary': 70, 'primary_link': 40,
+        'secondary': 60, 'secondary_link': 40, 'tertiary': 50, 'tertiary_link': 30, 'unclassified': 40,
+        'residential': 30, 'living_street': 10, 'service': 20, 'road': 30,
+    },
+    'walk': {
+        highway: 4.8 for highway in [
+            'primary', 'primary_link', 'secondary', 'secondary_link', 'tertiary', 'tertiary_link', 'unclassified',
+            'residential', 'living_street', 'service', 'road', 'pedestrian', 'footway', 'path', 'steps', 'track',
+            'cycleway', 'bridleway',
+        ]
+    },
+}
+ACCESS_SPEED_KMH = {'drive': 15.0, 'walk': 4.8}
+MAX_CELLS = 2 ** 24   # 128 MB of float64
+LANDMARKS = 8
+GRAPH_VERSION = 2
+NEAREST_FACTOR = 2.0
+MAX_CACHED = 16
+
+
+class _Buffer(object):
+    """Growable numpy array, filled in place (no Python list of every node)"""
+
+    def __init__(self, dtype, capacity=1 << 16):
+        self.array = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values):
+        end = self.size + len(values)
+        if end > len(self.array):
+            self.array = np.resize(self.array, max(end, 2 * len(self.array)))
+        self.array[self.size:end] = values
+        self.size = end
+
+    def values(self):
+        return self.array[:self.size].copy()
+
+
+def read_ways(path=OSM_PATH, highways=None):
+    '''Highway ways of an OSM extract
+
+    Parameters
+    ----------
+    path : str
+        .osm.pbf file
+    highways : list of str, optional
+        highway types kept, all the types of ``MODES`` if not given
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, list of str)
+        node ids of all the ways concatenated, their (lat, lon), the offset
+        of every way in these arrays (n_ways + 1), the oneway flag of every
+        way (1 forward, -1 backward, 0 both), the highway type of every way
+        as a position in the last item, the list of the highway types
+    '''
+    import osmium
+
+    highways = sorted(highways or set().union(*MODES.values()))
+    codes = {highway: code for (code, highway) in enumerate(highways)}
+
+    class Handler(osmium.SimpleHandler):
+        def __init__(self):
+            super().__init__()
+            (self.ids, self.lat, self.lon) = (_Buffer(np.int64), _Buffer(np.float64), _Buffer(np.float64))
+            (self.offsets, self.oneway, self.highway) = (_Buffer(np.int64), _Buffer(np.int8), _Buffer(np.int16))
+            self.offsets.extend([0])
+
+        def way(self, w):
+            code = codes.get(w.tags.get('highway'))
+            n = len(w.nodes)
+            if code is None or n < 2:
+                return
+            locations = [node.location for node in w.nodes]
+            if not all(location.valid() for location in locations):
+                return
+            self.ids.extend(np.fromiter((node.ref for node in w.nodes), np.int64, n))
+            self.lat.extend(np.fromiter((location.lat for location in locations), np.float64, n))
+            self.lon.extend(np.fromiter((location.lon for location in locations), np.float64, n))
+            self.offsets.extend([self.ids.size])
+            oneway = w.tags.get('oneway', 'no')
+            self.oneway.extend([1 if oneway in ('yes', 'true', '1') or highways[code].startswith('motorway')
+                                else -1 if oneway == '-1' else 0])
+            self.highway.extend([code])
+
+    handler = Handler()
+    handler.apply_file(path, locations=True)
+    return (handler.ids.values(), np.column_stack([handler.lat.values(), handler.lon.values()]),
+            handler.offsets.values(), handler.oneway.values(), handler.highway.values(), highways)
+
+
+class RoadGraph(object):
+    """Junction graph of the road network, one CSR matrix of travel times per mode
+
+    Attributes
+    ----------
+    points : numpy.ndarray
+        (n, 2) (lat, lon) of the junctions
+    graphs : dict
+        mode -> scipy.sparse.csr_matrix (n, n) of travel times in seconds
+    landmarks : dict
+        mode -> ((k, n), (k, n)) float32 travel times in seconds from and to
+        the landmarks of the mode (see ``landmark_times``), computed when
+        first needed if not given
+    """
+
+    def __init__(self, points, graphs, landmarks=None):
+        self.points = points
+        self.graphs = graphs
+        self.landmarks = dict(landmarks or {})
+        self._trees = {}
+
+    @classmethod
+    def from_osm(cls, path=OSM_PATH, modes=tuple(MODES)):
+        '''Build the graph of an extract (see ``read_ways``)'''
+        (ids, coords, offsets, oneway, highway, highways) = read_ways(path)
+        way = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        # junctions: ends of the ways and nodes used more than once
+        (unique, counts) = np.unique(ids, return_counts=True)
+        junction = np.zeros(len(ids), dtype=bool)
+        junction[offsets[:-1]] = junction[offsets[1:] - 1] = True
+        junction |= np.isin(ids, unique[counts > 1])
+        # length along the ways, summed from one junction to the next of the same way
+        seg = np.append(haversine(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1]), 0.0)
+        seg[offsets[1:] - 1] = 0.0  # no segment from the end of a way to the start of the next
+        cum = np.concatenate([[0.0], np.cumsum(seg)[:-1]])
+        j = np.flatnonzero(junction)
+        same_way = way[j[:-1]] == way[j[1:]]
+        (u, v) = (j[:-1][same_way], j[1:][same_way])
+        length_km = cum[v] - cum[u]
+        edge_way = way[u]
+        (vertices, first) = np.unique(ids[j], return_index=True)
+        points = coords[j[first]]
+        (a, b) = (np.searchsorted(vertices, ids[u]), np.searchsorted(vertices, ids[v]))
+        graphs = {}
+        for mode in modes:
+            speed = np.array([MODES[mode].get(h, np.nan) for h in highways], dtype=np.float64)[highway[edge_way]]
+            ok = np.isfinite(speed)
+            seconds = length_km[ok] / speed[ok] * 3600.0
+            direction = oneway[edge_way][ok] if mode == 'drive' else np.zeros(ok.sum(), dtype=np.int8)
+            (src, dst) = (a[ok], b[ok])
+            forward = direction >= 0
+            backward = direction <= 0
+            graphs[mode] = _csr(np.concatenate([src[forward], dst[backward]]),
+                                np.concatenate([dst[forward], src[backward]]),
+                                np.concatenate([seconds[forward], seconds[backward]]), len(points))
+        return cls(points, graphs, {mode: landmark_times(graph) for (mode, graph) in graphs.items()})
+
+    def save(self, path):
+        '''Write the junctions, the CSR arrays and the landmark times of every mode to an .npz file'''
+        arrays = {'points': self.points}
+        for (mode, graph) in self.graphs.items():
+            arrays.update({mode + '_indptr': graph.indptr, mode + '_indices': graph.indices, mode + '_data': graph.data})
+            (times_from, times_to) = self.landmark_times(mode)
+            arrays[mode + '_landmarks_from'] = times_from
+            if times_to is not times_from:   # same array on an undirected graph (walk)
+                arrays[mode + '_landmarks_to'] = times_to
+        (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        '''Read a graph written by ``save``'''
+        with np.load(path) as f:
+            points = f['points']
+            n = len(points)
+            modes = [name[:-len('_indptr')] for name in f.files if name.endswith('_indptr')]
+            graphs = {mode: sparse.csr_matrix((f[mode + '_data'], f[mode + '_indices'], f[mode + '_indptr']), shape=(n, n))
+                      for mode in modes}
+            landmarks = {}
+            for mode in modes:
+                if mode + '_landmarks_from' in f.files:
+                    times_from = f[mode + '_landmarks_from']
+                    times_to = f[mode + '_landmarks_to'] if mode + '_landmarks_to' in f.files else times_from
+                    landmarks[mode] = (times_from, times_to)
+        return cls(points, graphs, landmarks)
+
+    def landmark_times(self, mode):
+        '''Travel times from and to the landmarks of a mode, see ``landmark_times``'''
+        if mode not in self.landmarks:
+            self.landmarks[mode] = landmark_times(self.graphs[mode])
+        return self.landmarks[mode]
+
+    def snap(self, points, mode):
+        '''Nearest junction of each point reachable in ``mode``, and the access time in seconds'''
+        if mode not in self._trees:
+            graph = self.graphs[mode]
+            used = np.flatnonzero(np.diff(graph.indptr) > 0)
+            used = np.union1d(used, np.unique(graph.indices))
+            self._trees[mode] = (build_tree(self.points[used]), used)
+        (tree, used) = self._trees[mode]
+        (dist, ind) = nearest_km(tree, points)
+        return used[ind[:, 0]], dist[:, 0] / ACCESS_SPEED_KMH[mode] * 3600.0
+
+    def travel_times(self, sources, targets, mode='drive', max_minutes=60.0, group=256):
+        '''Travel times from every source to every target
+
+        Parameters
+        ----------
+        sources, targets : numpy.ndarray
+            (n, 2) and (m, 2) arrays of (lat, lon)
+        mode : str
+            key of ``MODES``
+        max_minutes : float
+            searches stop at this time, farther targets are ``inf``
+        group : int
+            origins searching the same subgraph (split further to keep
+            every distance matrix under ``MAX_CELLS``)
+
+        Returns
+        -------
+        numpy.ndarray
+            (n, m) travel times in minutes, access times included
+        '''
+        (src, src_access) = self.snap(sources, mode)
+        (dst, dst_access) = self.snap(targets, mode)
+        graph = self.graphs[mode]
+        reverse = len(np.unique(dst)) < len(np.unique(src))
+        if reverse:   # search from the targets on the reversed graph
+            (src, dst, graph) = (dst, src, graph.T.tocsr())
+        (times_from, times_to) = self.landmark_times(mode)
+        if reverse:   # from a landmark on the reversed graph is to it on the graph
+            (times_from, times_to) = (times_to, times_from)
+        (origins, inverse) = np.unique(src, return_inverse=True)
+        limit = max_minutes * 60.0
+        reach_km = limit / 3600.0 * max(MODES[mode].values())
+        (tree, used) = self._trees[mode]
+        times = np.full((len(origins), len(dst)), np.inf)
+        for rows in _groups(self.points[origins], reach_km, group):
+            points = self.points[origins[rows]]
+            center = points.mean(axis=0)
+            radius = haversine(center[0], center[1], points[:, 0], points[:, 1]).max()
+            # every junction reached within the limit is in this circle, and so is every path to it
+            local = np.sort(used[tree.query_radius(np.radians(center[None, :]),
+                                                   r=(radius + reach_km) / EARTH_RADIUS_KM)[0]])
+            # and it is within the limit of the origins by the landmark bounds (1 s of slack for the float32 times)
+            local = local[_lower_bounds(times_from, times_to, origins[rows], local) <= limit + 1.0]
+            subgraph = graph[local][:, local]
+            position = np.searchsorted(local, dst)
+            inside = (position < len(local)) & (local[np.minimum(position, len(local) - 1)] == dst)
+            starts = np.searchsorted(local, origins[rows])
+            step = max(1, MAX_CELLS // max(len(local), 1))
+            for start in range(0, len(rows), step):
+                d = csgraph.dijkstra(subgraph, directed=True, indices=starts[start:start + step], limit=limit)
+                times[rows[start:start + step][:, None], np.flatnonzero(inside)[None, :]] = d[:, position[inside]]
+        times = times[inverse]
+        if reverse:
+            times = times.T
+        return _minutes(times + src_access[:, None] + dst_access[None, :], limit)
+
+
+def landmark_times(graph, count=LANDMARKS):
+    '''Travel times from and to landmarks spread over a graph
+
+    The landmarks are chosen farthest first: each one is the junction
+    farthest (in travel time) from the landmarks already chosen.
+
+    Parameters
+    ----------
+    graph : scipy.sparse.csr_matrix
+        (n, n) travel times in seconds
+    count : int, optional
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray)
+        (k, n) float32 travel times in seconds from every landmark to the
+        junctions and from the junctions to every landmark, ``inf`` where
+        there is no path; the same array twice if the graph is undirected
+    '''
+    n = graph.shape[0]
+    symmetric = (graph != graph.T).nnz == 0
+    reverse = graph if symmetric else graph.T.tocsr()
+    degree = np.diff(graph.indptr)
+    if n == 0 or not degree.any():
+        empty = np.empty((0, n), dtype=np.float32)
+        return empty, empty
+    start = csgraph.dijkstra(graph, indices=int(np.argmax(degree)))
+    closest = np.where(np.isfinite(start), start, -1.0)   # unreachable junctions are never chosen
+    (times_from, times_to) = ([], [])
+    for _ in range(count):
+        landmark = int(np.argmax(closest))
+        if closest[landmark] <= 0 and times_from:
+            break   # every reachable junction is a landmark
+        forward = csgraph.dijkstra(graph, indices=landmark)
+        times_from.append(forward)
+        times_to.append(forward if symmetric else csgraph.dijkstra(reverse, indices=landmark))
+        closest = np.minimum(closest, forward)
+    times_from = np.array(times_from, dtype=np.float32)
+    return times_from, times_from if symmetric else np.array(times_to, dtype=np.float32)
+
+
+def _lower_bounds(times_from, times_to, origins, vertices):
+    '''Lower bound of the travel time from the nearest of ``origins`` to each of ``vertices``
+
+    d(s, v) >= d(L, v) - d(L, s) and d(s, v) >= d(s, L) - d(v, L) for every
+    landmark L; undefined differences (inf - inf) bound nothing.
+    '''
+    if len(times_from) == 0:
+        return np.zeros(len(vertices))
+    with np.errstate(invalid='ignore'):
+        bounds = np.fmax(times_from[:, vertices] - times_from[:, origins].max(axis=1)[:, None],
+                         times_to[:, origins].min(axis=1)[:, None] - times_to[:, vertices])
+    bounds[np.isnan(bounds)] = -np.inf
+    return bounds.max(axis=0)
+
+
+def _groups(points, reach_km, size):
+    '''Positions of the points, in groups of at most ``size`` points of the same cell of about ``reach_km``'''
+    cell = max(reach_km, 1.0) / 111.0   # degrees
+    (_, cells) = np.unique(np.floor(points / cell).astype(np.int64), axis=0, return_inverse=True)
+    order = np.argsort(cells.ravel(), kind='stable')
+    bounds = np.flatnonzero(np.diff(cells.ravel()[order])) + 1
+    return [rows[start:start + size] for rows in np.split(order, bounds) for start in range(0, len(rows), size)]
+
+
+def _csr(src, dst, seconds, n):
+    '''CSR matrix keeping the fastest of parallel edges'''
+    order = np.lexsort((seconds, dst, src))
+    (src, dst, seconds) = (src[order], dst[order], seconds[order])
+    first = np.ones(len(src), dtype=bool)
+    first[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+    loop = src == dst
+    keep = first & ~loop
+    # explicit zeros would be dropped by csgraph: give zero-length edges a tiny time
+    return sparse.csr_matrix((np.maximum(seconds[keep], 1e-3), (src[keep], dst[keep])), shape=(n, n))
+
+
+def _minutes(seconds, limit):
+    minutes = seconds / 60.0
+    minutes[~(seconds <= limit)] = np.inf
+    return minutes
+
+
+def load_graph(path=OSM_PATH):
+    '''``RoadGraph`` of an extract, built once and stored next to it'''
+    graph_path = '%s.%s.v%d.graph.npz' % (path, source_checksum(path)[:12], GRAPH_VERSION)
+    if os.path.exists(graph_path):
+        return RoadGraph.load(graph_path)
+    graph = RoadGraph.from_osm(path)
+    graph.save(graph_path)
+    return graph
+
+
+def travel_time_matrix(region, zones, stores, mode, checksum, graph=None, max_minutes=60.0, path=OSM_PATH):
+    '''Cached travel times from the zones of a region to a set of stores
+
+    Parameters
+    ----------
+    region : str
+    zones : geopandas.GeoDataFrame
+        zones of the region in EPSG:4326
+    stores : pandas.DataFrame
+        store table with ``Latitude`` and ``Longitude``
+    mode : str
+        'drive' or 'walk'
+    checksum : str
+        checksum of the zones GeoPackage (see ``src.preprocess``)
+    graph : RoadGraph, optional
+        loaded with ``load_graph(path)`` if not given and not cached
+
+    Returns
+    -------
+    numpy.ndarray
+        (zones, stores) travel times in minutes, ``inf`` beyond ``max_minutes``
+    '''
+    targets = store_points(stores)
+    key = hashlib.sha1(targets.tobytes() + repr((mode, max_minutes, source_checksum(path))).encode()).hexdigest()[:12]
+    cache = artifact_path(region, checksum, 'times_%s_%s.npy' % (mode, key))
+    if os.path.exists(cache):
+        os.utime(cache)  # recently used: pruned last
+        return np.load(cache, mmap_mode='r')
+    times = (graph or load_graph(path)).travel_times(zone_points(zones), targets, mode, max_minutes)
+    (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(cache), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, times)
+    os.replace(tmp, cache)
+    # the oldest matrices of the region above MAX_CACHED (other store sets, modes, limits)
+    cached = sorted(glob.glob(artifact_path(region, checksum, 'times_*.npy')), key=_mtime, reverse=True)
+    for old in cached[MAX_CACHED:]:
+        try:
+            os.remove(old)
+        except FileNotFoundError:
+            pass  # removed by another process
+    return times
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0.0
+
+
+def routed_features(region, zones, migros, comp, mode, checksum, max_minutes=15.0, graph=None, path=OSM_PATH):
+    '''Travel time to the nearest stores and number of stores within a time
+
+    The searches are bounded by ``NEAREST_FACTOR`` x ``max_minutes``: the
+    catchment time chosen for the mode bounds the cost of the searches.
+
+    Returns
+    -------
+    pandas.DataFrame
+        indexed like ``zones``: ``time_migros_min``, ``time_comp_min``
+        (``inf`` beyond ``NEAREST_FACTOR`` x ``max_minutes``), ``n_migros``,
+        ``n_comp`` and ``n_stores`` reachable within ``max_minutes``
+    '''
+    result = {}
+    for (name, stores) in [('migros', migros), ('comp', comp)]:
+        if len(stores) == 0:
+            times = np.full((len(zones), 1), np.inf)
+        else:
+            times = travel_time_matrix(region, zones, stores, mode, checksum, graph, NEAREST_FACTOR * max_minutes, path)
+        result['time_%s_min' % name] = times.min(axis=1)
+        result['n_%s' % name] = (times <= max_minutes).sum(axis=1)
+    result['n_stores'] = result['n_migros'] + result['n_comp']
+    return pd.DataFrame(result, index=zones.index)
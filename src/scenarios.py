@@ -0,0 +1,259 @@
+'''what-if scenarios: hypothetical store sets compared with the current one
+
+A scenario is a named diff over the base store tables: stores added (e.g. a
+hypothetical Migros) and stores removed (e.g. a competitor closing). It is
+never materialized as a full copy of the features of all the zones: adding or
+removing a store can only change
+
+- the distance to the nearest store of its kind in the zones that are nearer
+  to it than to their current nearest store (or whose nearest store it was),
+- the store counts of the zones within the count radius,
+
+so only these zones are recomputed (distances, counts, coverage and score);
+the other rows are the ones of the base tables. They are found with a
+BallTree of the changed stores, queried with the reach of every zone (count
+radius or distance to its nearest store). Scores of a scenario are scaled
+with the bounds of the base scorer so that they are comparable. The engine
+is shared between the sessions: the last ``RESULTS_SIZE`` evaluations are
+kept.
+
+Variables
+---------
+RESULTS_SIZE : evaluations kept by an engine
+
+Classes
+-------
+Scenario : named diff over the base store tables
+ScenarioEngine : base features of a region and incremental evaluation of scenarios
+
+Functions
+---------
+compare : metrics of several scenarios side by side, with deltas to the base
+'''
+
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from src.proximity import EARTH_RADIUS_KM, build_tree, proximity_features, zone_points
+from src.scoring import SuitabilityScorer, feature_table
+from src.stores import MIGROS_BRANDS
+
+# columns of the proximity features, per kind of store
+_DISTANCE = {'migros': 'dist_migros_km', 'comp': 'dist_comp_km'}
+RESULTS_SIZE = 64
+
+
+class Scenario(object):
+    """Named set of stores added to and removed from the base tables
+
+    Attributes
+    ----------
+    name : str
+    added : pandas.DataFrame
+        hypothetical stores: ``Place ID``, ``Name``, ``Latitude``,
+        ``Longitude`` and ``Brand``
+    removed : set of str
+        ``Place ID`` of the base stores removed
+    """
+
+    def __init__(self, name, added=None, removed=()):
+        self.name = name
+        self.added = pd.DataFrame(columns=['Place ID', 'Name', 'Latitude', 'Longitude', 'Brand']) if added is None \
+            else added.reset_index(drop=True)
+        self.removed = set(removed)
+        # never reused, also after a removal
+        matches = [re.fullmatch(re.escape(name) + r':(\d+)', str(place_id)) for place_id in self.added['Place ID']]
+        self._next = max([int(m.group(1)) for m in matches if m], default=0) + 1
+
+    def add_store(self, name, lat, lon, brand='Migros'):
+        '''Add a hypothetical store, returns its ``Place ID``'''
+        place_id = '%s:%d' % (self.name, self._next)
+        self._next += 1
+        row = pd.DataFrame([{'Place ID': place_id, 'Name': name, 'Latitude': float(lat), 'Longitude': float(lon),
+                             'Brand': brand}])
+        self.added = pd.concat([self.added, row], ignore_index=True) if len(self.added) else row
+        return place_id
+
+    def remove_store(self, place_id):
+        '''Remove a store, base or hypothetical'''
+        if place_id in set(self.added['Place ID']):
+            self.added = self.added[self.added['Place ID'] != place_id].reset_index(drop=True)
+        else:
+            self.removed.add(place_id)
+
+    def key(self):
+        '''hashable content of the diff, for caching the evaluations'''
+        added = tuple(self.added[['Place ID', 'Latitude', 'Longitude', 'Brand']].itertuples(index=False, name=None))
+        return added, tuple(sorted(self.removed))
+
+    def apply(self, migros, comp):
+        '''(pandas.DataFrame, pandas.DataFrame): Migros stores and competitors of the scenario'''
+        is_migros = self.added['Brand'].isin(MIGROS_BRANDS)
+        migros = pd.concat([migros[~migros['Place ID'].isin(self.removed)], self.added[is_migros]], ignore_index=True)
+        comp = pd.concat([comp[~comp['Place ID'].isin(self.removed)], self.added[~is_migros]], ignore_index=True)
+        return migros, comp
+
+    def changed_stores(self, migros, comp):
+        '''Stores added or removed, per kind
+
+        Returns
+        -------
+        dict
+            'migros' and 'comp': (n, 2) arrays of the (lat, lon) of the
+            changed stores of that kind
+        '''
+        is_migros = self.added['Brand'].isin(MIGROS_BRANDS)
+        changed = {}
+        for (kind, base, added) in [('migros', migros, self.added[is_migros]), ('comp', comp, self.added[~is_migros])]:
+            stores = pd.concat([base[base['Place ID'].isin(self.removed)], added])
+            changed[kind] = stores[['Latitude', 'Longitude']].to_numpy(dtype=np.float64).reshape(-1, 2)
+        return changed
+
+
+class ScenarioEngine(object):
+    """Base features of the zones of a region and incremental scenario evaluation
+
+    Attributes
+    ----------
+    points : numpy.ndarray
+        (n, 2) (lat, lon) of the zones, see ``src.proximity.zone_points``
+    features : pandas.DataFrame
+        proximity features of the base stores, indexed by zone
+    scorer : src.scoring.SuitabilityScorer
+        scorer of the base features
+    demand : pandas.Series
+        demand per zone (population), used for the coverage metrics
+    radius_km : float
+        radius of the store counts and of the coverage
+    """
+
+    def __init__(self, zones, migros, comp, radius_km=2.0, demand=None, features=None):
+        self.zones = zones
+        self.points = zone_points(zones)
+        self.migros = migros
+        self.comp = comp
+        self.radius_km = radius_km
+        self.features = proximity_features(self.points, migros, comp, radius_km, index=zones.index) \
+            if features is None else features
+        self.table = feature_table(zones, self.features)
+        self.scorer = SuitabilityScorer(self.table)
+        self.demand = pd.Series(1.0, index=zones.index) if demand is None else demand.reindex(zones.index).fillna(0.0)
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def affected(self, scenario):
+        '''Positions of the zones whose features can change in a scenario
+
+        A zone is affected by a changed store if the store is within the
+        count radius, or at most as far as the current nearest store of its
+        kind (a nearer new store, or the nearest store removed).
+
+        Returns
+        -------
+        numpy.ndarray
+            sorted positions into ``points``
+        '''
+        mask = np.zeros(len(self.points), dtype=bool)
+        for (kind, stores) in scenario.changed_stores(self.migros, self.comp).items():
+            if len(stores) == 0:
+                continue
+            nearest = self.features[_DISTANCE[kind]].to_numpy()
+            reach = np.minimum(np.maximum(self.radius_km, nearest * (1 + 1e-9)), np.pi * EARTH_RADIUS_KM)
+            mask |= build_tree(stores).query_radius(np.radians(self.points), r=reach / EARTH_RADIUS_KM, count_only=True) > 0
+        return np.flatnonzero(mask)
+
+    def evaluate(self, scenario, weights=None):
+        '''Features, scores and metrics of a scenario
+
+        Parameters
+        ----------
+        scenario : Scenario
+        weights : dict, optional
+            weights of the suitability index
+
+        Returns
+        -------
+        dict
+            ``features`` and ``score`` of all the zones, ``affected`` (zone
+            ids recomputed) and ``metrics`` (see ``metrics``)
+        '''
+        key = (scenario.key(), None if weights is None else tuple(sorted(weights.items())))
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+        score = self.scorer.score(weights)
+        features = self.features
+        rows = self.affected(scenario)
+        if len(rows):
+            (migros, comp) = scenario.apply(self.migros, self.comp)
+            ids = self.zones.index[rows]
+            update = proximity_features(self.points[rows], migros, comp, self.radius_km, index=ids)
+            features = features.copy()
+            features.loc[ids, update.columns] = update
+            table = self.table.copy()
+            table.loc[ids, update.columns.intersection(table.columns)] = update
+            score = score.copy()
+            score.loc[ids] = self.scorer.score_rows(table.loc[ids], weights)
+        result = {
+            'features': features,
+            'score': score,
+            'affected': self.zones.index[rows],
+            'metrics': self.metrics(features, score),
+        }
+        with self._lock:
+            self._results[key] = result
+            if len(self._results) > RESULTS_SIZE:
+                self._results.popitem(last=False)
+        return result
+
+    def metrics(self, features, score):
+        '''Summary of a set of features
+
+        Returns
+        -------
+        pandas.Series
+            ``covered_demand`` (demand within ``radius_km`` of a Migros),
+            ``covered_share``, ``mean_dist_migros_km`` (demand weighted),
+            ``mean_competitors`` (demand weighted) and ``mean_score``
+        '''
+        demand = self.demand.to_numpy()
+        total = demand.sum()
+        dist = features['dist_migros_km'].to_numpy()
+        finite = np.isfinite(dist)
+        covered = float(demand[dist <= self.radius_km].sum())
+        return pd.Series({
+            'covered_demand': covered,
+            'covered_share': covered / total if total > 0 else 0.0,
+            'mean_dist_migros_km': float(np.average(dist[finite], weights=demand[finite]))
+                if demand[finite].sum() > 0 else np.inf,
+            'mean_competitors': float(np.average(features['n_comp'], weights=demand)) if total > 0 else 0.0,
+            'mean_score': float(score.mean()),
+        })
+
+
+def compare(engine, scenarios, weights=None):
+    '''Metrics of the base and of scenarios, with their deltas to the base
+
+    Parameters
+    ----------
+    engine : ScenarioEngine
+    scenarios : iterable of Scenario
+    weights : dict, optional
+
+    Returns
+    -------
+    pandas.DataFrame
+        one row per scenario (the base first), the metrics and a
+        ``<metric>_delta`` column per metric
+    '''
+    base = engine.metrics(engine.features, engine.scorer.score(weights))
+    rows = {'base': base}
+    for scenario in scenarios:
+        rows[scenario.name] = engine.evaluate(scenario, weights)['metrics']
+    table = pd.DataFrame(rows).T
+    return table.join(table.subtract(base, axis=1).add_suffix('_delta'))
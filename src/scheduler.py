@@ -0,0 +1,156 @@
+'''concurrent loading of the data and building of the layers of a run
+
+The layers of the map depend on data sources (zones, stores, metadata, ...)
+which may depend on each other. A ``TaskGraph`` holds these tasks and their
+dependencies; running it submits every task to a thread pool as soon as its
+dependencies are done, so that independent sources are read and independent
+traces are built at the same time. Results are yielded in the order in which
+they finish, so that the caller can draw the layers as they come instead of
+waiting for the slowest one.
+
+A task taking longer than its timeout is reported as failed with a
+``TimeoutError`` (its thread cannot be stopped: it finishes in the
+background and its result, e.g. a cached trace, is used by a later run), and
+the tasks depending on a failed task are reported as failed without being
+run.
+
+Threads rather than processes: the tasks share the cached data of the
+process (memory-mapped zones, store tables, traces) and spend their time in
+code releasing the GIL (pyogrio, shapely, NumPy, plotly JSON encoding).
+
+Variables
+---------
+MAX_WORKERS : threads of the shared pool
+TIMEOUT : default time limit of a task, in seconds
+
+Classes
+-------
+TaskGraph : tasks with dependencies, run concurrently
+TaskFailed : error of a task whose dependency failed
+'''
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+MAX_WORKERS = 4
+TIMEOUT = 60.0
+
+
+class TaskFailed(Exception):
+    '''A dependency of the task failed or timed out, it was not run'''
+
+
+class TaskGraph(object):
+    """Tasks with dependencies, run concurrently in a thread pool
+
+    Attributes
+    ----------
+    executor : concurrent.futures.Executor
+        pool running the tasks, shared between the runs
+    timeout : float
+        default time limit of a task, counted from its submission
+    """
+
+    def __init__(self, executor=None, timeout=TIMEOUT, wrap=None):
+        '''
+        Parameters
+        ----------
+        executor : concurrent.futures.Executor, optional
+            a pool of ``MAX_WORKERS`` threads is created if not given
+        timeout : float, optional
+        wrap : callable, optional
+            applied to every task function before it is submitted (e.g. to
+            attach the streamlit context of the run to the worker thread)
+        '''
+        self.executor = executor or ThreadPoolExecutor(MAX_WORKERS, thread_name_prefix='layers')
+        self.timeout = timeout
+        self.wrap = wrap
+        self._tasks = {}
+
+    def add(self, name, func, depends=(), timeout=None):
+        '''Add a task
+
+        Parameters
+        ----------
+        name : str
+        func : callable
+            called without arguments, in a worker thread
+        depends : iterable of str
+            tasks which must be done before this one starts
+        timeout : float, optional
+            time limit of this task, ``timeout`` of the graph if not given
+        '''
+        self._tasks[name] = (func, tuple(depends), self.timeout if timeout is None else timeout)
+
+    def requirements(self, targets):
+        '''list of str: the targets and all their dependencies, dependencies first
+
+        Raises
+        ------
+        KeyError
+            if a task depends on an unknown task
+        ValueError
+            if the dependencies have a cycle
+        '''
+        (order, state) = ([], {})
+
+        def visit(name, path):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise ValueError('dependency cycle: ' + ' -> '.join(path + [name]))
+            state[name] = 'visiting'
+            for dep in self._tasks[name][1]:
+                visit(dep, path + [name])
+            state[name] = 'done'
+            order.append(name)
+
+        for name in targets:
+            visit(name, [])
+        return order
+
+    def run(self, targets):
+        '''Run the targets and their dependencies
+
+        Parameters
+        ----------
+        targets : iterable of str
+
+        Yields
+        ------
+        (str, object, Exception or None)
+            name, result and error of every task (dependencies included), in
+            the order in which they finish
+        '''
+        pending = self.requirements(targets)
+        (results, running) = ({}, {})
+        while pending or running:
+            for name in list(pending):
+                deps = self._tasks[name][1]
+                failed = [dep for dep in deps if dep in results and results[dep][1] is not None]
+                if failed:
+                    pending.remove(name)
+                    results[name] = (None, TaskFailed('%s: %s failed' % (name, ', '.join(failed))))
+                    yield (name, None, results[name][1])
+                elif all(dep in results for dep in deps):
+                    pending.remove(name)
+                    func = self._tasks[name][0] if self.wrap is None else self.wrap(self._tasks[name][0])
+                    running[self.executor.submit(func)] = (name, time.monotonic() + self._tasks[name][2])
+            if not running:
+                continue
+            now = time.monotonic()
+            (done, _) = wait(running, timeout=max(0.0, min(deadline for (_, deadline) in running.values()) - now),
+                             return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future in list(running):
+                (name, deadline) = running[future]
+                if future in done:
+                    error = future.exception()
+                    results[name] = (None if error else future.result(), error)
+                elif now >= deadline:
+                    future.cancel()
+                    results[name] = (None, TimeoutError('%s: no result after %g s' % (name, self._tasks[name][2])))
+                else:
+                    continue
+                del running[future]
+                yield (name,) + results[name]
@@ -0,0 +1,184 @@
+'''site-suitability index per zone
+
+The features of the zones (public transport accessibility, population, store
+proximity) are scaled once to [0, 1], oriented so that 1 is always the better
+value for a new Migros, and kept as a column-major matrix. The suitability
+index is the weighted mean of these columns. When weights change, only the
+columns whose weight changed are added to the previous (unnormalized) score,
+the features are never derived again. Every ``REFRESH_UPDATES`` updates the
+score is computed from all the columns, so that the rounding errors of the
+updates do not add up.
+
+Variables
+---------
+FEATURES : column and orientation of each feature of the index
+DEFAULT_WEIGHTS : weights used when none are given
+REFRESH_UPDATES : incremental updates of the score between two full computations
+
+Classes
+-------
+SuitabilityScorer : weighted index over a feature table, with top-k queries
+'''
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+# name: (column of the feature table, +1 if larger is better, -1 otherwise)
+FEATURES = {
+    'pt': ('OeV_Erreichb_EW', 1),
+    'population': ('population', 1),
+    'dist_migros': ('dist_migros_km', 1),    # far from an existing Migros: less cannibalization
+    'competition': ('n_comp', -1),           # few competitors around
+    'time_migros': ('time_migros_min', 1),   # travel time to the next Migros on the road network (src/routing.py)
+}
+
+DEFAULT_WEIGHTS = {'pt': 1.0, 'population': 1.0, 'dist_migros': 1.0, 'competition': 1.0}
+REFRESH_UPDATES = 64
+
+
+def feature_table(zones, *features):
+    '''Columns of ``FEATURES`` found in the zones and in further feature tables
+
+    Parameters
+    ----------
+    zones : pandas.DataFrame
+        zones (with ``OeV_Erreichb_EW``), indexed by zone id
+    *features : pandas.DataFrame
+        feature tables indexed like ``zones`` (e.g. ``src.proximity.zone_features``)
+
+    Returns
+    -------
+    pandas.DataFrame
+        one column per available feature column
+    '''
+    columns = [column for (column, _) in FEATURES.values()]
+    tables = [pd.DataFrame(zones).reindex(columns=[c for c in columns if c in zones.columns])]
+    tables += [f.reindex(columns=[c for c in columns if c in f.columns]) for f in features]
+    return pd.concat(tables, axis=1)
+
+
+def normalize(table, bounds=None):
+    '''Scale the features to [0, 1], 1 being the most suitable value
+
+    Infinite values (e.g. no store at all) are replaced by the largest finite
+    value, missing features by 0 and constant features by 0.5.
+
+    Parameters
+    ----------
+    table : pandas.DataFrame
+        see ``feature_table``
+    bounds : dict, optional
+        (min, max) per feature name, computed from ``table`` if not given;
+        pass the bounds of a reference table to scale other rows the same way
+
+    Returns
+    -------
+    (numpy.ndarray, list of str, dict)
+        (n, m) Fortran-ordered matrix, the names of its m columns and the
+        bounds used
+    '''
+    names, columns, used = [], [], {}
+    for (name, (column, sign)) in FEATURES.items():
+        if column not in table.columns or (bounds is not None and name not in bounds):
+            continue
+        x = table[column].to_numpy(dtype=np.float64)
+        finite = np.isfinite(x)
+        if bounds is None:
+            (lo, hi) = (np.nanmin(x[finite]), np.nanmax(x[finite])) if finite.any() else (0.0, 0.0)
+        else:
+            (lo, hi) = bounds[name]
+        x = np.where(np.isposinf(x), hi, np.where(np.isneginf(x), lo, x))
+        x = np.clip((x - lo) / (hi - lo), 0.0, 1.0) if hi > lo else np.full_like(x, 0.5)
+        x = np.nan_to_num(x if sign > 0 else 1 - x, nan=0.0)
+        names.append(name)
+        columns.append(x)
+        used[name] = (lo, hi)
+    return np.asfortranarray(np.column_stack(columns) if columns else np.empty((len(table), 0))), names, used
+
+
+class SuitabilityScorer(object):
+    """Weighted suitability index over a feature table
+
+    Attributes
+    ----------
+    index : pandas.Index
+        zone ids
+    names : list of str
+        features available in the table (keys of ``FEATURES``)
+    """
+
+    def __init__(self, table):
+        self.index = table.index
+        (self._x, self.names, self.bounds) = normalize(table)
+        self._weights = np.zeros(len(self.names))
+        self._raw = np.zeros(len(self.index))
+        self._updates = 0
+        self._lock = threading.Lock()
+
+    def _weight_vector(self, weights):
+        return np.array([float(weights.get(name, 0.0)) for name in self.names])
+
+    def score(self, weights=None):
+        '''Suitability index of every zone, in [0, 1]
+
+        Parameters
+        ----------
+        weights : dict, optional
+            weight per feature name, missing features have weight 0
+
+        Returns
+        -------
+        pandas.Series
+            index per zone
+        '''
+        w = self._weight_vector(DEFAULT_WEIGHTS if weights is None else weights)
+        with self._lock:
+            changed = np.flatnonzero(w != self._weights)
+            if len(changed):
+                self._updates += 1
+                if self._updates % REFRESH_UPDATES == 0:
+                    self._raw = self._x @ w
+                else:
+                    self._raw += self._x[:, changed] @ (w[changed] - self._weights[changed])
+                self._weights = w
+            raw = self._raw.copy()
+        total = w.sum()
+        return pd.Series(raw / total if total > 0 else np.zeros_like(raw), index=self.index, name='score')
+
+    def score_rows(self, table, weights=None):
+        '''Index of other rows (e.g. changed zones), scaled like the table of the scorer
+
+        Parameters
+        ----------
+        table : pandas.DataFrame
+            feature rows with the columns of the table of the scorer
+        weights : dict, optional
+
+        Returns
+        -------
+        pandas.Series
+            index per row, comparable with ``score``
+        '''
+        (x, names, _) = normalize(table, self.bounds)
+        w = self._weight_vector(DEFAULT_WEIGHTS if weights is None else weights)
+        total = w.sum()
+        return pd.Series(x @ w / total if total > 0 else np.zeros(len(table)), index=table.index, name='score')
+
+    def top_k(self, k, weights=None):
+        '''The ``k`` most suitable zones, best first
+
+        Returns
+        -------
+        pandas.Series
+            index of the ``k`` best zones
+        '''
+        s = self.score(weights)
+        k = min(k, len(s))
+        if k == 0:
+            return s.iloc[:0]
+        values = s.to_numpy()
+        best = np.argpartition(-values, k - 1)[:k]
+        best = best[np.argsort(-values[best], kind='stable')]
+        return s.iloc[best]
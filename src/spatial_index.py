@@ -0,0 +1,184 @@
+'''spatial index of the traffic zones for point-in-zone and nearest-zone queries
+
+An STRtree is built over the zone polygons in LV95 (so that distances are in
+meters) and answers bulk queries: the zone of millions of points, the zones
+in a bounding box, or the k nearest zones of points, in one call each. Points
+and boxes are given in WGS84 by default and reprojected with one vectorized
+transformation.
+
+The LV95 geometries of the index are stored next to the zone artifact of a
+region, so that loading an index is a WKB decode and a tree bulk-load, without
+reprojection.
+
+Classes
+-------
+ZoneIndex : STRtree over the zones of a region
+'''
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import shapely
+from pyproj import Transformer
+from scipy.spatial import cKDTree
+
+from src.preprocess import artifact_path
+
+INDEX_CRS = 'EPSG:2056'
+
+
+class ZoneIndex(object):
+    """STRtree over the zone polygons, with bulk queries
+
+    Attributes
+    ----------
+    ids : numpy.ndarray
+        zone id of each indexed polygon
+    geometries : numpy.ndarray
+        polygons in LV95
+    """
+
+    def __init__(self, ids, geometries):
+        self.ids = np.asarray(ids)
+        self.geometries = np.asarray(geometries, dtype=object)
+        self.tree = shapely.STRtree(self.geometries)
+        self._transformers = {}
+        self._surface = None
+
+    @classmethod
+    def from_zones(cls, zones):
+        '''Index a GeoDataFrame of zones (any CRS), ids are its index'''
+        zones = zones.to_crs(INDEX_CRS) if zones.crs != INDEX_CRS else zones
+        return cls(zones.index.to_numpy(), np.asarray(zones.geometry, dtype=object))
+
+    def save(self, path):
+        '''Write the ids and the LV95 geometries (WKB) to a Feather file'''
+        (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pd.DataFrame({'zone': self.ids, 'wkb': shapely.to_wkb(self.geometries)}).to_feather(f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        '''Read an index written by ``save``'''
+        table = pd.read_feather(path)
+        return cls(table['zone'].to_numpy(), shapely.from_wkb(table['wkb'].to_numpy()))
+
+    def _points(self, x, y, crs):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if crs != INDEX_CRS:
+            if crs not in self._transformers:
+                self._transformers[crs] = Transformer.from_crs(crs, INDEX_CRS, always_xy=True)
+            (x, y) = self._transformers[crs].transform(x, y)
+        return shapely.points(x, y)
+
+    def zone_of(self, x, y, crs='EPSG:4326'):
+        '''Zone containing each point
+
+        Parameters
+        ----------
+        x, y : array_like
+            coordinates of the points (longitude and latitude by default)
+        crs : str, optional
+            CRS of the coordinates
+
+        Returns
+        -------
+        numpy.ndarray
+            zone id per point, -1 for points outside all the zones; a point
+            on a border is given to one of the zones
+        '''
+        (point, zone) = self.tree.query(self._points(x, y, crs), predicate='intersects')
+        result = np.full(len(np.atleast_1d(x)), -1, dtype=np.int64)
+        result[point[::-1]] = self.ids[zone[::-1]]  # the first zone found wins
+        return result
+
+    def zones_within(self, bbox, crs='EPSG:4326'):
+        '''Ids of the zones intersecting a bounding box
+
+        Parameters
+        ----------
+        bbox : tuple of float
+            (xmin, ymin, xmax, ymax)
+        crs : str, optional
+            CRS of the box
+
+        Returns
+        -------
+        numpy.ndarray
+            zone ids, in the order of the index
+        '''
+        (xmin, ymin, xmax, ymax) = bbox
+        corners = self._points([xmin, xmax, xmax, xmin], [ymin, ymin, ymax, ymax], crs)
+        box = shapely.box(*shapely.total_bounds(corners))
+        return self.ids[np.sort(self.tree.query(box, predicate='intersects'))]
+
+    def nearest_zone(self, x, y, k=1, crs='EPSG:4326'):
+        '''The ``k`` nearest zones of each point
+
+        Parameters
+        ----------
+        x, y : array_like
+            coordinates of the points
+        k : int, optional
+        crs : str, optional
+            CRS of the coordinates
+
+        Returns
+        -------
+        (numpy.ndarray, numpy.ndarray)
+            (n, k) zone ids and distances in meters (0 inside a zone), nearest
+            first; -1 and ``inf`` if there are fewer than ``k`` zones
+        '''
+        points = self._points(x, y, crs)
+        n = len(points)
+        ids = np.full((n, k), -1, dtype=np.int64)
+        dist = np.full((n, k), np.inf)
+        if k == 1:
+            (pair, d) = self.tree.query_nearest(points, return_distance=True, all_matches=False)
+            ids[pair[0], 0] = self.ids[pair[1]]
+            dist[pair[0], 0] = d
+            return ids, dist
+        # a point of each zone (inside it, unlike the centroid of a concave zone) is at least as
+        # far as the zone, so the k nearest zones are all within the distance of the k-th nearest
+        # of these points
+        if self._surface is None:
+            self._surface = cKDTree(shapely.get_coordinates(shapely.point_on_surface(self.geometries)))
+        coords = shapely.get_coordinates(points)
+        (d_surface, _) = self._surface.query(coords, k=min(k, len(self.geometries)))
+        reach = d_surface.reshape(n, -1)[:, -1] * (1 + 1e-9) + 1e-6
+        (point, zone) = self.tree.query(points, predicate='dwithin', distance=reach)
+        d = shapely.distance(points[point], self.geometries[zone])
+        order = np.lexsort((d, point))
+        (point, zone, d) = (point[order], zone[order], d[order])
+        rank = np.arange(len(point)) - np.searchsorted(point, point, side='left')
+        keep = rank < k
+        ids[point[keep], rank[keep]] = self.ids[zone[keep]]
+        dist[point[keep], rank[keep]] = d[keep]
+        return ids, dist
+
+
+def load_index(region, zones, checksum):
+    '''Index of the zones of a region, stored next to its zone artifact
+
+    Parameters
+    ----------
+    region : str
+    zones : geopandas.GeoDataFrame
+        zones of the region, used only when the index is not stored yet
+    checksum : str
+        checksum of the source GeoPackage (see ``src.preprocess``)
+
+    Returns
+    -------
+    ZoneIndex
+    '''
+    path = artifact_path(region, checksum, 'index.feather')
+    if os.path.exists(path):
+        return ZoneIndex.load(path)
+    index = ZoneIndex.from_zones(zones)
+    index.save(path)
+    return index
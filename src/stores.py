@@ -0,0 +1,208 @@
+'''store catalog: ingestion of store dumps into one zone-indexed table
+
+National store dumps (CSV or JSON lines with the columns of the Google Places
+exports in ./data: ``Place ID``, ``Name``, ``Latitude``, ``Longitude``,
+``Address``) are read in chunks. Each chunk is deduplicated by ``Place ID``,
+the brand of every store is derived from its ``Name`` with one vectorized
+regular expression, and the stores are assigned to the traffic zone they lie
+in through the spatial index of the zones (``src.spatial_index``). The catalog is a Parquet file
+sorted by zone, so that the stores around a region are read with a filter on
+their coordinates (row groups of distant zones are skipped). The stores
+within ``BUFFER_KM`` of the bounding box of the region are read, so that the
+zones on its border see their nearest stores in the neighbouring regions.
+
+Ingesting a new dump only processes its rows: stores already in the catalog
+are replaced by the new version of the same ``Place ID``.
+
+Variables
+---------
+STORES_PATH : the catalog
+BRANDS : brand per keyword found in the store names
+MIGROS_BRANDS : brands counted as Migros, all the others are competitors
+BUFFER_KM : stores are read up to this distance around a region
+FALLBACK_REGION : region of the store CSVs of ./data, used without a catalog
+
+Examples
+--------
+    $ python -m src.stores ./data/stores_ch.csv ./data/new_stores.jsonl
+'''
+
+import argparse
+import math
+import os
+import tempfile
+
+import pandas as pd
+
+from src.preprocess import load_artifact, source_checksum
+from src.spatial_index import ZoneIndex, load_index
+
+STORES_PATH = './data/stores.parquet'
+STORE_COLUMNS = ['Place ID', 'Name', 'Latitude', 'Longitude', 'Address']
+
+# keyword (lower case, as found in the names) -> brand
+BRANDS = {
+    'migros': 'Migros',
+    'migrolino': 'Migrolino',
+    'coop': 'Coop',
+    'denner': 'Denner',
+    'spar': 'SPAR',
+    'volg': 'VOLG',
+    'lidl': 'Lidl',
+    'aldi': 'Aldi',
+    'manor': 'Manor',
+    'landi': 'Landi',
+    'mercato': 'Mercato',
+    'aligro': 'Aligro',
+    'topcc': 'TopCC',
+    'prodega': 'Prodega',
+}
+MIGROS_BRANDS = ['Migros']
+
+MIGROS_CSV = './data/Migros_Appenzell_Innerrhoden.csv'
+COMP_CSV = './data/Migros_Supermarket_Competitors_Appenzell_Innerrhoden_Filtered.csv'
+FALLBACK_REGION = 'AI'
+BUFFER_KM = 10.0  # largest radius of the store counts in the app
+
+_BRAND_PATTERN = r'\b(%s)\b' % '|'.join(sorted(BRANDS, key=len, reverse=True))
+
+
+def classify_brands(names):
+    '''Brand of each store from its name
+
+    Parameters
+    ----------
+    names : pandas.Series of str
+
+    Returns
+    -------
+    pandas.Series
+        brand (values of ``BRANDS``), 'Other' if no keyword is found
+    '''
+    keyword = names.fillna('').str.lower().str.extract(_BRAND_PATTERN, expand=False)
+    return keyword.map(BRANDS).fillna('Other')
+
+
+def read_dump(path, chunksize=100000):
+    '''Chunks of a store dump, CSV or JSON lines (.jsonl/.ndjson)
+
+    Yields
+    ------
+    pandas.DataFrame
+        chunk with the columns ``STORE_COLUMNS``
+    '''
+    if path.endswith(('.jsonl', '.ndjson', '.json')):
+        reader = pd.read_json(path, lines=True, chunksize=chunksize, dtype={'Place ID': str})
+    else:
+        reader = pd.read_csv(path, chunksize=chunksize, dtype={'Place ID': str})
+    for chunk in reader:
+        yield chunk.reindex(columns=STORE_COLUMNS)
+
+
+def prepare_chunk(chunk, index):
+    '''Deduplicate, classify and assign a chunk of a dump to the zones (``ZoneIndex``)'''
+    chunk = chunk.dropna(subset=['Place ID', 'Latitude', 'Longitude'])
+    chunk = chunk.drop_duplicates('Place ID', keep='last')
+    zone = index.zone_of(chunk['Longitude'].to_numpy(), chunk['Latitude'].to_numpy())
+    return chunk.assign(Brand=classify_brands(chunk['Name']), zone=zone)
+
+
+def ingest(paths, zones, path=STORES_PATH, chunksize=100000):
+    '''Add store dumps to the catalog
+
+    Parameters
+    ----------
+    paths : list of str
+        dumps, see ``read_dump``; later rows win over earlier ones
+    zones : geopandas.GeoDataFrame or ZoneIndex
+        zones (e.g. the national artifact of ``src.preprocess``) or their index
+    path : str, optional
+        the catalog, created if missing
+
+    Returns
+    -------
+    pandas.DataFrame
+        the updated catalog
+    '''
+    index = zones if isinstance(zones, ZoneIndex) else ZoneIndex.from_zones(zones)
+    parts = [pd.read_parquet(path)] if os.path.exists(path) else []
+    for dump in paths:
+        for chunk in read_dump(dump, chunksize):
+            parts.append(prepare_chunk(chunk, index))
+    catalog = pd.concat(parts, ignore_index=True)
+    catalog = catalog.drop_duplicates('Place ID', keep='last')
+    catalog = catalog.sort_values(['zone', 'Place ID'], kind='stable').reset_index(drop=True)
+    (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        catalog.to_parquet(f, index=False, row_group_size=10000)
+    os.replace(tmp, path)
+    return catalog
+
+
+def split_brands(stores):
+    '''(pandas.DataFrame, pandas.DataFrame): Migros stores and competitors'''
+    is_migros = stores['Brand'].isin(MIGROS_BRANDS)
+    return stores[is_migros].reset_index(drop=True), stores[~is_migros].reset_index(drop=True)
+
+
+def store_files(region, path=STORES_PATH):
+    '''list of str: the files ``load_stores`` reads the stores of a region from'''
+    return [path] if os.path.exists(path) or region != FALLBACK_REGION else [MIGROS_CSV, COMP_CSV]
+
+
+def load_stores(region, zones=None, path=STORES_PATH, buffer_km=BUFFER_KM):
+    '''Migros and competitor stores around a region
+
+    Reads the stores of the catalog within ``buffer_km`` of the bounding box
+    of the zones. Without a catalog, the CSVs of ./data are used for
+    ``FALLBACK_REGION`` only.
+
+    Parameters
+    ----------
+    region : str
+        name of the region, see ``src.regions``
+    zones : geopandas.GeoDataFrame, optional
+        zones of the region in EPSG:4326, all the stores if not given
+    buffer_km : float, optional
+
+    Returns
+    -------
+    (pandas.DataFrame, pandas.DataFrame)
+        Migros stores and competitors
+
+    Raises
+    ------
+    FileNotFoundError
+        if there is no catalog and ``region`` is not ``FALLBACK_REGION``
+    '''
+    if not os.path.exists(path):
+        if region != FALLBACK_REGION:
+            raise FileNotFoundError('no store catalog at %s (the CSVs of ./data only cover %s): '
+                                    'build it with python -m src.stores' % (path, FALLBACK_REGION))
+        (migros, comp) = (pd.read_csv(MIGROS_CSV), pd.read_csv(COMP_CSV))
+        return migros.assign(Brand='Migros'), comp.assign(Brand=classify_brands(comp['Name']))
+    filters = None
+    if zones is not None:
+        (lon0, lat0, lon1, lat1) = zones.total_bounds
+        dlat = buffer_km / 111.32
+        dlon = buffer_km / (111.32 * math.cos(math.radians(max(abs(lat0), abs(lat1)))))
+        filters = [('Latitude', '>=', lat0 - dlat), ('Latitude', '<=', lat1 + dlat),
+                   ('Longitude', '>=', lon0 - dlon), ('Longitude', '<=', lon1 + dlon)]
+    return split_brands(pd.read_parquet(path, filters=filters).reset_index(drop=True))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Add store dumps to the store catalog')
+    parser.add_argument('dumps', nargs='+', help='CSV or JSON lines files')
+    parser.add_argument('--catalog', default=STORES_PATH)
+    parser.add_argument('--region', default='CH', help='zones the stores are assigned to')
+    args = parser.parse_args(argv)
+
+    zones = load_artifact(args.region)
+    catalog = ingest(args.dumps, load_index(args.region, zones, source_checksum()), args.catalog)
+    print(catalog.groupby('Brand').size().sort_values(ascending=False).to_string())
+    print('%d stores, %d outside of the zones' % (len(catalog), (catalog['zone'] < 0).sum()))
+
+
+if __name__ == '__main__':
+    main()
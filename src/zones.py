@@ -0,0 +1,66 @@
+'''loading of the NPVM traffic zones (public transport accessibility)
+
+The national GeoPackage ``erreichbarkeit-oev_2056.gpkg`` holds every traffic
+zone of Switzerland in LV95 (EPSG:2056). Reading it entirely only to keep a
+handful of zones is what dominates the start of the app, so the loader below
+pushes a bounding box (or a polygon mask) and a column list down into the
+GeoPackage read. GDAL then uses the R-tree index of the file and only decodes
+the matching features and fields.
+
+Variables
+---------
+ZONES_PATH, ZONES_LAYER : path and layer of the national GeoPackage
+ZONES_CRS : CRS of the GeoPackage
+ZONE_COLUMNS : attributes used by the app
+'''
+
+import geopandas as gpd
+
+ZONES_PATH = './data/erreichbarkeit-oev_2056.gpkg'
+ZONES_LAYER = 'Reisezeit_Erreichbarkeit'
+ZONES_CRS = 'EPSG:2056'
+
+ZONE_COLUMNS = ['OeV_Erreichb_EW']
+
+def load_zones(path=ZONES_PATH, layer=ZONES_LAYER, bbox=None, mask=None, columns=ZONE_COLUMNS, fids=None):
+    '''Read the traffic zones intersecting a bounding box or a mask
+
+    The filter and the column selection are evaluated by GDAL (pyogrio engine)
+    while reading, using the spatial index of the GeoPackage: features outside
+    the box are never decoded. The index of the returned frame is the feature
+    id (``fid``) of the GeoPackage, so that it does not depend on the filter.
+
+    Parameters
+    ----------
+    path : str
+        path of the GeoPackage
+    layer : str
+        layer name
+    bbox : tuple of float, optional
+        (xmin, ymin, xmax, ymax) in the CRS of the file (EPSG:2056)
+    mask : shapely geometry or GeoSeries, optional
+        polygon mask, can not be combined with ``bbox``
+    columns : list of str, optional
+        attributes to read, ``None`` reads all of them
+    fids : array of int, optional
+        feature ids to read (e.g. from ``src.regions``), can not be combined
+        with ``bbox`` or ``mask``
+
+    Returns
+    -------
+    geopandas.GeoDataFrame
+        zones indexed by their GeoPackage feature id
+    '''
+    if sum(x is not None for x in (bbox, mask, fids)) > 1:
+        raise ValueError('only one of bbox, mask and fids can be used')
+    kwargs = {} if fids is None else {'fids': fids}
+    return gpd.read_file(
+        path,
+        layer=layer,
+        bbox=bbox,
+        mask=mask,
+        columns=columns,
+        engine='pyogrio',
+        fid_as_index=True,
+        **kwargs
+    )
@@ -0,0 +1,35 @@
+import json
+
+from src.cache import LayerCache
+
+JSON = (lambda value: json.dumps(value).encode(), lambda data: json.loads(data))
+
+
+def test_memory_and_disk_tiers(tmp_path):
+    builds = []
+
+    def build():
+        builds.append(1)
+        return {'rows': len(builds)}
+
+    cache = LayerCache(str(tmp_path))
+    assert cache.get('v1', 'AI', 'PT', {'bucket': 8}, build, JSON) == {'rows': 1}
+    assert cache.get('v1', 'AI', 'PT', {'bucket': 8}, build, JSON) == {'rows': 1}
+    assert (cache.stats()['misses'], cache.stats()['memory_hits']) == (1, 1)
+
+    other = LayerCache(str(tmp_path))  # another process sharing the directory
+    assert other.get('v1', 'AI', 'PT', {'bucket': 8}, build, JSON) == {'rows': 1}
+    assert other.stats()['disk_hits'] == 1
+    assert other.get('v2', 'AI', 'PT', {'bucket': 8}, build, JSON) == {'rows': 2}  # new dataset version
+    assert other.get('v1', 'AI', 'PT', {'bucket': 9}, build, JSON) == {'rows': 3}
+    assert len(builds) == 3
+
+
+def test_budgets(tmp_path):
+    cache = LayerCache(str(tmp_path), memory_bytes=100, disk_bytes=16 * 100)
+    for i in range(40):
+        cache.get('v', 'AI', 'layer', {'i': i}, lambda: 'x' * 40, JSON)
+    stats = cache.stats()
+    assert stats['memory_bytes'] <= 100 and stats['evictions'] > 0
+    cache.prune()
+    assert sum(f.stat().st_size for f in tmp_path.rglob('*.bin')) <= 16 * 100
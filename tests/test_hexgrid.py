@@ -0,0 +1,31 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from src.hexgrid import hex_features, interpolate, overlay_table, roll_up
+
+
+def zones():
+    return gpd.GeoDataFrame({'OeV_Erreichb_EW': [100.0, 300.0], 'population': [50.0, 80.0]},
+                            geometry=[shapely.box(9.40, 47.30, 9.43, 47.33), shapely.box(9.43, 47.30, 9.46, 47.33)],
+                            index=[11, 12], crs='EPSG:4326')
+
+
+def test_interpolation_and_roll_up_keep_totals():
+    grid = interpolate(overlay_table(zones(), 9), zones())
+    assert np.isclose(grid['population'].sum(), 130.0)
+    coarse = roll_up(grid, 7)
+    assert np.isclose(coarse['population'].sum(), 130.0)
+    assert np.isclose(coarse['area'].sum(), grid['area'].sum())
+    mean = (coarse['OeV_Erreichb_EW'] * coarse['area']).sum() / coarse['area'].sum()
+    assert np.isclose(mean, (grid['OeV_Erreichb_EW'] * grid['area']).sum() / grid['area'].sum())
+
+
+def test_store_proximity_on_the_cells():
+    grid = interpolate(overlay_table(zones(), 8), zones())
+    stores = pd.DataFrame({'Latitude': [47.31], 'Longitude': [9.41]})
+    features = hex_features(grid, stores, stores.iloc[:0], radius_km=1.0)
+    assert features.index.equals(grid.index)
+    assert (features['dist_migros_km'] < 6).all() and np.isinf(features['dist_comp_km']).all()
+    assert features['n_migros'].sum() >= 1
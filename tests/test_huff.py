@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.huff import HuffModel
+
+
+def stores(n, seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'Place ID': ['P%d' % i for i in range(n)],
+                         'Name': np.where(np.arange(n) % 2 == 0, 'Migros', 'Coop'),
+                         'Latitude': rng.uniform(47.3, 47.5, n), 'Longitude': rng.uniform(8.4, 8.7, n)})
+
+
+def model(table, k=5, seed=0):
+    rng = np.random.default_rng(seed)
+    points = np.column_stack([rng.uniform(47.3, 47.5, 200), rng.uniform(8.4, 8.7, 200)])
+    return HuffModel(points, table, rng.gamma(2.0, 100.0, 200), k=k)
+
+
+def assert_same(incremental, full):
+    pd.testing.assert_series_equal(incremental.captured_demand().sort_index(), full.captured_demand().sort_index())
+    pd.testing.assert_series_equal(incremental.brand_share(), full.brand_share())
+
+
+def test_add_store_equals_full_recompute():
+    table = stores(21, seed=1)
+    huff = model(table.iloc[:20])
+    rows = huff.add_store(table.iloc[20])
+    assert 0 < len(rows) < 200
+    assert_same(huff, model(table))
+
+
+def test_remove_store_equals_full_recompute():
+    table = stores(20, seed=2)
+    huff = model(table)
+    huff.remove_store('P3')
+    assert_same(huff, model(table[table['Place ID'] != 'P3']))
+    with pytest.raises(KeyError):
+        huff.remove_store('P3')
+
+
+def test_fewer_stores_than_k():
+    table = stores(4, seed=3)
+    huff = model(table.iloc[:3])
+    huff.add_store(table.iloc[3])
+    assert_same(huff, model(table))
+    assert huff.probabilities().sum(axis=1) == pytest.approx(1.0)
@@ -0,0 +1,75 @@
+import datetime
+import os
+
+import numpy as np
+import pytest
+
+from src.isochrones import ConnectionTable, feed_files, feed_signature, prune_cache, service_date
+
+MONDAY = datetime.date(2024, 3, 4)
+
+# one trip A -> B -> C, A and C 2.2 km apart, B a detour to the east
+FEED = {
+    'stops.txt': 'stop_id,stop_name,stop_lat,stop_lon\nA,A,47.00,9.0\nB,B,47.01,9.2\nC,C,47.02,9.0\n',
+    'trips.txt': 'route_id,service_id,trip_id\nR,WD,T1\n',
+    'stop_times.txt': ('trip_id,arrival_time,departure_time,stop_id,stop_sequence\n'
+                       'T1,08:00:00,08:00:00,A,1\nT1,08:03:00,08:03:00,B,2\nT1,08:06:00,08:06:00,C,3\n'),
+    'calendar.txt': ('service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date\n'
+                     'WD,1,1,1,1,1,0,0,20240101,20241231\n'),
+}
+
+
+@pytest.fixture
+def feed(tmp_path):
+    for (name, text) in FEED.items():
+        (tmp_path / name).write_text(text)
+    return str(tmp_path)
+
+
+def test_days_without_service_are_an_error(feed):
+    assert service_date(feed, MONDAY) == MONDAY
+    with pytest.raises(LookupError, match='2024-01-01 to 2024-12-31'):
+        service_date(feed, datetime.date(2025, 3, 3))
+    with pytest.raises(LookupError):
+        ConnectionTable.from_gtfs(feed, datetime.date(2024, 3, 9))  # a Saturday
+
+
+def test_trips_through_stops_outside_the_box_are_kept(feed):
+    table = ConnectionTable.from_gtfs(feed, MONDAY)
+    assert [tuple(table.stop_ids[[a, b]]) for (a, b) in zip(table.dep_stop, table.arr_stop)] == [('A', 'B'), ('B', 'C')]
+    table = ConnectionTable.from_gtfs(feed, MONDAY, bbox=(8.9, 46.99, 9.1, 47.03))
+    assert list(table.stop_ids) == ['A', 'C']
+    assert (list(table.dep_stop), list(table.arr_stop)) == ([0], [1])
+    assert (list(table.dep_time), list(table.arr_time)) == ([8 * 3600], [8 * 3600 + 360])
+
+
+def test_feed_signature_follows_the_files(feed, tmp_path):
+    before = feed_signature(feed)
+    (tmp_path / 'stop_times.txt').write_text(FEED['stop_times.txt'] + 'T1,08:09:00,08:09:00,A,4\n')
+    assert feed_signature(feed) != before
+
+
+def test_earliest_arrival(feed):
+    table = ConnectionTable.from_gtfs(feed, MONDAY)
+    sources = np.array([[47.00, 9.0], [47.02, 9.0]])
+    arrival = table.earliest_arrival(sources, 7 * 3600 + 59 * 60, max_minutes=15)
+    assert arrival[:, 0] == pytest.approx([7 * 3600 + 59 * 60, 8 * 3600 + 180, 8 * 3600 + 360])
+    assert np.isinf(arrival[:2, 1]).all()  # the trip only goes north
+    # batched over the sources, or one at a time: the same arrivals
+    assert (table.earliest_arrival(sources[1:], 7 * 3600 + 59 * 60, 15) == arrival[:, 1:]).all()
+    # the trip has left, or its arrival is beyond the limit
+    assert np.isinf(table.earliest_arrival(sources[:1], 8 * 3600 + 60, 15)[1:]).all()
+    assert np.isinf(table.earliest_arrival(sources[:1], 7 * 3600 + 59 * 60, 5)[2]).all()
+
+
+def test_prune_cache(tmp_path):
+    for (i, name) in enumerate(['isochrones_new_k_20240304_28800.feather', 'connections_new_k_20240304.npz',
+                                'isochrones_new_k_20240305_28800.feather', 'isochrones_old_k_20240304_28800.feather',
+                                'connections_old_k_20240304.npz', 'AI_v1_0123456789ab_zones.feather']):
+        (tmp_path / name).write_bytes(b'')
+        os.utime(tmp_path / name, (i, i))
+    removed = prune_cache('new', keep=2, directory=str(tmp_path))
+    assert sorted(os.path.basename(path) for path in removed) == [
+        'connections_old_k_20240304.npz', 'isochrones_new_k_20240304_28800.feather',
+        'isochrones_old_k_20240304_28800.feather']
+    assert feed_files(str(tmp_path / 'missing')) == []
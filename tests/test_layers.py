@@ -0,0 +1,22 @@
+from src.layers import LayerCompositor
+
+
+class Store(object):
+    def __init__(self):
+        self.keys = []
+
+    def get(self, version, region, layer, params, build, codec):
+        self.keys.append((layer, params))
+        return build()
+
+
+def test_viewport_traces_are_not_persisted():
+    store = Store()
+    compositor = LayerCompositor(store=store, version='v', region='AI')
+    compositor.register('PT', lambda **params: ('PT', params))
+    compositor.register('TOP', lambda **params: ('TOP', params))
+    compositor.trace('PT', bucket=10, tiles=((1, 2),))
+    compositor.trace('PT', bucket=10, tiles=((1, 3),))
+    compositor.trace('TOP', k=5)
+    assert store.keys == [('TOP', {'k': 5})]
+    assert compositor.cached('PT', bucket=10, tiles=((1, 2),))
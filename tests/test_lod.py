@@ -0,0 +1,43 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.lod import TileCache
+
+
+def test_tile_cache_builds_each_tile_once_across_threads():
+    cache = TileCache(maxsize=16)
+    calls = []
+    lock = threading.Lock()
+
+    def build(bounds):
+        with lock:
+            calls.append(bounds)
+        time.sleep(0.01)
+        return np.array([int(bounds[0] * 1000) % 7])
+
+    tiles = [(x, y) for x in range(3) for y in range(3)]
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: cache.collect('zones', 10, tiles, build), range(16)))
+    assert all(np.array_equal(r, results[0]) for r in results)
+    assert len(calls) == len(tiles)
+    assert not cache._building
+
+
+def test_tile_cache_failed_build_is_retried():
+    cache = TileCache()
+    attempts = []
+
+    def build():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError('no data')
+        return 'ok'
+
+    try:
+        cache.get('k', build)
+    except RuntimeError:
+        pass
+    assert cache.get('k', build) == 'ok' and len(attempts) == 2
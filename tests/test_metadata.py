@@ -0,0 +1,53 @@
+import math
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+from pyproj import Transformer
+
+from src.metadata import MAP_SIZE_PX, fit_zoom, read_metadata, region_metadata, save_metadata
+
+
+@pytest.fixture
+def zones():
+    # a 2 x 2 km and a 1 x 1 km zone in LV95, 3 km apart
+    return gpd.GeoDataFrame({'OeV_Erreichb_EW': [10.0, 30.0], 'name': ['a', 'b'], 'empty': [np.nan, np.nan]},
+                            geometry=[shapely.box(2600000, 1200000, 2602000, 1202000),
+                                      shapely.box(2605000, 1200000, 2606000, 1201000)], crs=2056)
+
+
+def test_region_metadata(zones):
+    meta = region_metadata(zones)
+    # centroid weighted by area: (4 * 2601000 + 1 * 2605500) / 5
+    (x, y) = Transformer.from_crs(4326, 2056, always_xy=True).transform(meta['center']['lon'], meta['center']['lat'])
+    assert (x, y) == (pytest.approx(2601900, abs=0.01), pytest.approx(1200900, abs=0.01))
+    assert meta['bounds_lv95'] == [2600000, 1200000, 2606000, 1202000]
+    (lon0, lat0, lon1, lat1) = meta['bounds']
+    assert lon0 < meta['center']['lon'] < lon1 and lat0 < meta['center']['lat'] < lat1
+    assert meta['n_zones'] == 2
+    assert meta['ranges'] == {'OeV_Erreichb_EW': [10.0, 30.0]}   # numeric columns with values only
+    assert meta['zoom'] == fit_zoom(meta['bounds'])
+
+
+def test_fitted_zoom_shows_the_bounds():
+    bounds = (8.0, 46.5, 9.0, 47.0)
+    zoom = fit_zoom(bounds)
+    assert zoom * 4 == int(zoom * 4)
+
+    def pixels(zoom):
+        merc = [math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)) for lat in (bounds[1], bounds[3])]
+        scale = 256.0 * 2 ** zoom
+        return ((bounds[2] - bounds[0]) / 360.0 * scale, (merc[1] - merc[0]) / (2 * math.pi) * scale)
+
+    (width, height) = pixels(zoom)
+    assert width <= MAP_SIZE_PX[0] and height <= MAP_SIZE_PX[1]
+    (width, height) = pixels(zoom + 0.5)
+    assert width > MAP_SIZE_PX[0] or height > MAP_SIZE_PX[1]
+    assert fit_zoom((8.0, 46.0, 10.0, 48.0)) < zoom < fit_zoom((8.0, 46.5, 8.1, 46.6))
+
+
+def test_metadata_is_stored_as_json(zones, tmp_path):
+    meta = region_metadata(zones)
+    save_metadata(meta, str(tmp_path / 'meta.json'))
+    assert read_metadata(str(tmp_path / 'meta.json')) == meta
@@ -0,0 +1,28 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import geopandas as gpd
+import shapely
+
+from src.payloads import payload_zoom, to_geojson, write_payload
+
+
+def zones():
+    circles = [shapely.Point(9.40 + 0.02 * i, 47.33).buffer(0.005, quad_segs=32) for i in range(3)]
+    return gpd.GeoDataFrame(geometry=circles, index=[11, 12, 13], crs='EPSG:4326')
+
+
+def test_simplified_with_the_zone_ids():
+    (coarse, fine) = (json.loads(to_geojson(zones(), 6)), json.loads(to_geojson(zones(), 12)))
+    assert [f['id'] for f in coarse['features']] == [11, 12, 13]
+    assert len(coarse['features'][0]['geometry']['coordinates'][0]) < len(fine['features'][0]['geometry']['coordinates'][0])
+    assert (payload_zoom(5), payload_zoom(9.5), payload_zoom(16)) == (6, 10, 12)
+
+
+def test_concurrent_writers(tmp_path):
+    path = str(tmp_path / 'AI.geojson')
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda _: write_payload(path, zones(), 10), range(32)))
+    assert json.loads(open(path).read())['type'] == 'FeatureCollection'
+    assert os.listdir(tmp_path) == ['AI.geojson']
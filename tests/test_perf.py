@@ -0,0 +1,67 @@
+import threading
+
+import geopandas as gpd
+import shapely
+
+from src.payloads import to_geojson
+from src.perf import RECORDER, Recorder
+
+
+def test_memory_of_top_level_spans_only():
+    recorder = Recorder()
+    recorder.set_memory_tracing(True)
+    try:
+        with recorder.span('outer') as outer:
+            with recorder.span('inner') as inner:
+                block = bytearray(4 << 20)
+            del block
+    finally:
+        recorder.set_memory_tracing(False)
+    assert 'memory_bytes' not in inner
+    assert outer['memory_bytes'] >= 4 << 20
+
+
+def test_one_span_at_a_time_owns_the_peak():
+    recorder = Recorder()
+    recorder.set_memory_tracing(True)
+    (started, done, other) = (threading.Event(), threading.Event(), {})
+
+    def worker():
+        with recorder.span('worker') as counts:
+            started.set()
+            done.wait(5)
+        other.update(counts)
+
+    thread = threading.Thread(target=worker)
+    try:
+        thread.start()
+        started.wait(5)
+        with recorder.span('main') as counts:
+            pass
+        done.set()
+        thread.join()
+    finally:
+        recorder.set_memory_tracing(False)
+    assert 'memory_bytes' in other
+    assert 'memory_bytes' not in counts
+
+
+def test_geojson_vertices_are_recorded():
+    RECORDER.reset()
+    zones = gpd.GeoDataFrame(geometry=[shapely.box(9.0, 47.0, 9.01, 47.01)], index=[1], crs='EPSG:4326')
+    text = to_geojson(zones, 10)
+    (row,) = [row for row in RECORDER.summary() if row['stage'] == 'serialize.geojson']
+    assert (row['features'], row['vertices'], row['bytes']) == (1, 5, len(text))
+
+
+def test_concurrent_writes(tmp_path):
+    recorder = Recorder()
+    recorder.record('run', 0.1)
+    path = str(tmp_path / 'metrics.prom')
+    threads = [threading.Thread(target=recorder.write, args=(path,)) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert open(path).read() == recorder.to_prometheus()
+    assert [p.name for p in tmp_path.iterdir()] == ['metrics.prom']
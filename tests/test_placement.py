@@ -0,0 +1,63 @@
+from itertools import combinations
+
+import numpy as np
+import pytest
+from scipy import sparse
+
+from src.placement import coverage_matrix, greedy_placement, milp_placement, place_stores
+
+
+def instance(m=12, n=30, seed=0):
+    rng = np.random.default_rng(seed)
+    coverage = sparse.csr_matrix(rng.random((m, n)) < 0.2)
+    return coverage, rng.gamma(2.0, 100.0, n), rng.random(n) < 0.1
+
+
+def covered_demand(coverage, demand, covered, chosen):
+    hit = np.asarray(coverage[chosen].sum(axis=0)).ravel() > 0 if len(chosen) else np.zeros(len(demand), bool)
+    return demand[hit & ~covered].sum()
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_milp_is_optimal_and_greedy_within_its_bound(seed):
+    (coverage, demand, covered) = instance(seed=seed)
+    k = 3
+    best = max(covered_demand(coverage, demand, covered, list(c)) for c in combinations(range(coverage.shape[0]), k))
+    (exact, marginal) = milp_placement(coverage, demand, k, covered)
+    assert covered_demand(coverage, demand, covered, exact) == pytest.approx(best)
+    assert sum(marginal) == pytest.approx(best)
+    (greedy, marginal) = greedy_placement(coverage, demand, k, covered)
+    assert sum(marginal) == pytest.approx(covered_demand(coverage, demand, covered, greedy))
+    assert sum(marginal) >= (1 - 1 / np.e) * best - 1e-9
+    assert list(marginal) == sorted(marginal, reverse=True)
+
+
+def test_greedy_equals_milp_on_disjoint_sites():
+    # disjoint coverage: the greedy choice is optimal
+    coverage = sparse.csr_matrix(np.kron(np.eye(4, dtype=bool), np.ones((1, 3), dtype=bool)))
+    demand = np.arange(12, dtype=float)
+    assert sorted(greedy_placement(coverage, demand, 2)[0]) == sorted(milp_placement(coverage, demand, 2)[0]) == [2, 3]
+
+
+def test_existing_stores_cover_their_zones():
+    points = np.array([[47.0, 9.0], [47.0, 9.001], [47.5, 9.5]])
+    table = place_stores(points, [10.0, 10.0, 1.0], existing=points[:1], k=1, radius_km=1.0)
+    assert list(table['zone']) == [2]
+    assert coverage_matrix(points, points, 1.0).sum() == 5
+
+
+@pytest.mark.parametrize('solver', [greedy_placement, milp_placement])
+def test_placement_stops_when_the_demand_is_covered(solver):
+    coverage = sparse.csr_matrix(np.kron(np.eye(4, dtype=bool), np.ones((1, 3), dtype=bool)))
+    demand = np.arange(12, dtype=float)
+    covered = np.arange(12) < 6            # sites 0 and 1 add nothing
+    (chosen, marginal) = solver(coverage, demand, 3, covered)
+    assert (chosen, marginal) == ([3, 2], [30.0, 21.0])
+    assert solver(coverage, demand, 3, np.ones(12, dtype=bool)) == ([], [])
+
+
+def test_no_zero_gain_stores_are_proposed():
+    points = np.array([[47.0, 9.0], [47.0, 9.001], [47.5, 9.5]])
+    for mode in ['greedy', 'milp']:
+        table = place_stores(points, [10.0, 10.0, 1.0], existing=points[:1], k=3, radius_km=1.0, mode=mode)
+        assert list(table['zone']) == [2] and list(table['cumulative_coverage']) == [1.0]
@@ -0,0 +1,91 @@
+import os
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+from src import preprocess
+from src.population import load_population, read_hectares, zone_population
+
+# hectares (south-west corners, LV95): 3 in zone 10, 2 in zone 20, 1 between the zones, 1 far away
+STATPOP = '''E_KOORD;N_KOORD;BBTOT;B21BTOT
+2600000;1200000;5;1
+2600100;1200000;7;1
+2600200;1200200;1;1
+2600400;1200000;11;1
+2600500;1200100;13;1
+2600300;1200000;100;1
+2700000;1300000;1000;1
+'''
+
+
+@pytest.fixture
+def zones():
+    return gpd.GeoDataFrame(index=[10, 20], geometry=[shapely.box(2600000, 1200000, 2600300, 1200300),
+                                                     shapely.box(2600400, 1200000, 2600700, 1200300)], crs=2056)
+
+
+@pytest.fixture
+def hectares(tmp_path):
+    path = tmp_path / 'STATPOP_hectare.csv'
+    path.write_text(STATPOP)
+    return str(path)
+
+
+def test_hectares_are_read_in_chunks_within_the_box(hectares):
+    cells = read_hectares(hectares, (2600000, 1200000, 2600700, 1200300), chunksize=2)
+    assert list(cells['population']) == [5, 7, 1, 11, 13, 100]
+    assert (cells['x'].iloc[0], cells['y'].iloc[0]) == (2600050, 1200050)   # centre of the hectare
+    assert len(read_hectares(hectares, (0, 0, 1, 1))) == 0
+
+
+def test_zonal_sum_of_the_hectares(zones, hectares, tmp_path):
+    missing = str(tmp_path / 'population.tif')
+    population = zone_population(zones, hectares, missing)
+    assert population.to_dict() == {10: 13.0, 20: 24.0}
+    # zones in WGS84, as in the artifacts
+    assert zone_population(zones.to_crs(4326), hectares, missing).to_dict() == {10: 13.0, 20: 24.0}
+    assert zone_population(zones, str(tmp_path / 'missing.csv'), missing) is None
+
+
+def test_the_hectare_grid_is_used_before_the_raster(zones, hectares, tmp_path, monkeypatch):
+    tif = tmp_path / 'population.tif'
+    tif.write_bytes(b'not read')
+    monkeypatch.setattr('src.population.raster_per_zone', lambda path, zones: pytest.fail('raster read'))
+    assert zone_population(zones, hectares, str(tif)).sum() == 37.0
+    monkeypatch.setattr('src.population.raster_per_zone', lambda path, zones: 'raster')
+    assert zone_population(zones, str(tmp_path / 'missing.csv'), str(tif)) == 'raster'
+
+
+def test_raster_zonal_sum(zones, tmp_path):
+    rasterio = pytest.importorskip('rasterio')
+    from rasterio.transform import from_origin
+    from src.population import raster_per_zone
+    path = str(tmp_path / 'population.tif')
+    data = np.arange(8 * 8, dtype=np.float32).reshape(8, 8)   # 100 m pixels from (2599900, 1200400)
+    with rasterio.open(path, 'w', driver='GTiff', height=8, width=8, count=1, dtype='float32', crs='EPSG:2056',
+                       transform=from_origin(2599900, 1200400, 100, 100)) as dst:
+        dst.write(data, 1)
+    population = raster_per_zone(path, zones)
+    # rows 1-3 (y 1200300 down to 1200000), columns 1-3 and 5-7
+    assert population.to_dict() == {10: data[1:4, 1:4].sum(), 20: data[1:4, 5:8].sum()}
+
+
+def test_population_is_cached_per_source_version(zones, hectares, tmp_path, monkeypatch):
+    monkeypatch.setattr(preprocess, 'ARTIFACT_DIR', str(tmp_path))
+    missing = str(tmp_path / 'population.tif')
+    checksum = 'c' * 64
+    assert load_population('AI', zones, checksum, str(tmp_path / 'missing.csv'), missing) is None
+    assert load_population('AI', zones, checksum, hectares, missing).to_dict() == {10: 13.0, 20: 24.0}
+    cached = list(tmp_path.glob('AI_*_population_*.feather'))
+    assert len(cached) == 1
+    # read back from the cache, even with other zones
+    assert load_population('AI', zones.iloc[:0], checksum, hectares, missing).to_dict() == {10: 13.0, 20: 24.0}
+    # a new hectare grid replaces the cached column
+    with open(hectares, 'a') as f:
+        f.write('2600000;1200100;2;1\n')
+    os.utime(hectares, (os.path.getmtime(hectares) + 10,) * 2)
+    assert load_population('AI', zones, checksum, hectares, missing).to_dict() == {10: 15.0, 20: 24.0}
+    assert [p.name for p in tmp_path.glob('AI_*_population_*.feather')] != [p.name for p in cached]
+    assert len(list(tmp_path.glob('AI_*_population_*.feather'))) == 1
@@ -0,0 +1,16 @@
+import os
+
+from src import preprocess
+from src.preprocess import artifact_path, remove_stale_artifacts
+
+
+def test_remove_stale_artifacts(tmp_path, monkeypatch):
+    monkeypatch.setattr(preprocess, 'ARTIFACT_DIR', str(tmp_path))
+    (old, new) = ('a' * 64, 'b' * 64)
+    suffixes = ['zones.feather', 'meta.json', 'index.feather', 'population_1700000000.feather']
+    stale = [artifact_path('AI', old, suffix) for suffix in suffixes]
+    kept = [artifact_path('AI', new, suffix) for suffix in suffixes] + [artifact_path('AI v2', old), artifact_path('AR', old)]
+    for path in stale + kept:
+        open(path, 'w').close()
+    assert sorted(remove_stale_artifacts('AI', new)) == sorted(stale)
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for path in kept)
@@ -0,0 +1,54 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+from src.proximity import (EARTH_RADIUS_KM, build_tree, haversine, nearest_km, proximity_features, zone_features,
+                           zone_points)
+
+
+def stores(n, seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'Latitude': 47.3 + rng.random(n) * 0.2, 'Longitude': 8.4 + rng.random(n) * 0.3})
+
+
+def test_haversine():
+    assert haversine(47.0, 8.0, 48.0, 8.0) == pytest.approx(np.pi * EARTH_RADIUS_KM / 180)
+    assert haversine(np.array([47.0, 47.5])[:, None], 8.0, np.array([47.0, 47.5])[None, :], 8.0).shape == (2, 2)
+
+
+def test_features_match_the_full_distance_matrix():
+    points = stores(200, 0).to_numpy()
+    (migros, comp) = (stores(30, 1), stores(50, 2))
+    features = proximity_features(points, migros, comp, radius_km=3.0, index=np.arange(200) + 100)
+    to_migros = haversine(points[:, :1], points[:, 1:], migros['Latitude'].to_numpy()[None, :],
+                          migros['Longitude'].to_numpy()[None, :])
+    to_comp = haversine(points[:, :1], points[:, 1:], comp['Latitude'].to_numpy()[None, :],
+                        comp['Longitude'].to_numpy()[None, :])
+    np.testing.assert_allclose(features['dist_migros_km'], to_migros.min(axis=1))
+    np.testing.assert_allclose(features['dist_comp_km'], to_comp.min(axis=1))
+    assert (features['n_migros'] == (to_migros <= 3.0).sum(axis=1)).all()
+    assert (features['n_comp'] == (to_comp <= 3.0).sum(axis=1)).all()
+    assert (features['n_stores'] == features['n_migros'] + features['n_comp']).all()
+    assert list(features.index[:2]) == [100, 101]
+
+
+def test_without_stores():
+    points = stores(5, 0).to_numpy()
+    features = proximity_features(points, stores(0, 1), stores(3, 2))
+    assert np.isinf(features['dist_migros_km']).all() and (features['n_migros'] == 0).all()
+    assert np.isfinite(features['dist_comp_km']).all()
+    (dist, ind) = nearest_km(build_tree(stores(2, 3).to_numpy()), points, k=3)
+    assert np.isinf(dist[:, 2]).all() and (ind[:, 2] == -1).all() and np.isfinite(dist[:, :2]).all()
+
+
+def test_zone_features_are_indexed_like_the_zones():
+    zones = gpd.GeoDataFrame(index=[7, 3], geometry=[shapely.box(8.40, 47.30, 8.42, 47.32),
+                                                     shapely.box(8.60, 47.40, 8.62, 47.42)], crs=4326)
+    points = zone_points(zones)
+    assert all(zones.geometry.iloc[i].contains(shapely.Point(lon, lat)) for (i, (lat, lon)) in enumerate(points))
+    migros = pd.DataFrame({'Latitude': [47.31], 'Longitude': [8.41]})
+    features = zone_features(zones, migros, migros.iloc[:0], radius_km=1.0)
+    assert list(features.index) == [7, 3]
+    assert list(features['n_migros']) == [1, 0]
@@ -0,0 +1,61 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+from src.regions import BOUNDARY_LAYERS, RegionRegistry, registry_path
+
+
+def square(x, y, size):
+    return shapely.box(x, y, x + size, y + size)
+
+
+@pytest.fixture
+def sources(tmp_path):
+    '''four 1 km zones in LV95, two per canton, the cantons split in one district and two municipalities'''
+    zones = gpd.GeoDataFrame({'ID_Zone': [1, 2, 3, 4]},
+                             geometry=[square(2750000 + 1000 * i, 1240000, 1000) for i in range(4)], crs=2056)
+    zones_path = str(tmp_path / 'zones.gpkg')
+    zones.to_file(zones_path, layer='zones', engine='pyogrio')
+    boundaries_path = str(tmp_path / 'boundaries.gpkg')
+    west = square(2749000, 1239000, 3000)   # zones 1 and 2
+    east = square(2752000, 1239000, 3000)
+    layers = {
+        'canton': gpd.GeoDataFrame({'name': ['Appenzell Ausserrhoden', 'Appenzell Innerrhoden'],
+                                    'kantonsnummer': [15, 16]}, geometry=[west, east], crs=2056),
+        'district': gpd.GeoDataFrame({'name': ['Hinterland']}, geometry=[west], crs=2056),
+        'municipality': gpd.GeoDataFrame({'name': ['Appenzell', 'Schwende']},
+                                         geometry=[shapely.box(2752000, 1239000, 2753200, 1242000),
+                                                   shapely.box(2753200, 1239000, 2755000, 1242000)],
+                                         crs=2056),
+    }
+    for (level, frame) in layers.items():
+        frame.to_file(boundaries_path, layer=BOUNDARY_LAYERS[level], engine='pyogrio')
+    return zones_path, boundaries_path
+
+
+def test_zones_per_region(sources):
+    (zones_path, boundaries_path) = sources
+    registry = RegionRegistry(zones_path, 'zones', boundaries_path)
+    assert registry.cantons() == ['AR', 'AI']
+    assert registry.names('canton') == ['Appenzell Ausserrhoden', 'Appenzell Innerrhoden']
+    assert registry.name('ai') == 'Appenzell Innerrhoden' and registry.name('CH') == 'Switzerland'
+    # by abbreviation or name, searched by level
+    assert list(registry.zone_ids('AI')) == list(registry.zone_ids('Appenzell Innerrhoden')) == [3, 4]
+    assert list(registry.zone_ids('Hinterland')) == [1, 2]
+    assert list(registry.zone_ids('Schwende', level='municipality')) == [4]
+    assert list(registry.zone_ids('CH')) == [1, 2, 3, 4]
+    np.testing.assert_allclose(registry.bounds('AR'), (2750000, 1240000, 2752000, 1241000))
+    assert list(registry.load('Appenzell').index) == [3]
+    with pytest.raises(KeyError, match='Zug'):
+        registry.zone_ids('Zug')
+
+
+def test_boundaries_are_only_needed_to_build_the_index(sources, tmp_path):
+    (zones_path, boundaries_path) = sources
+    missing = str(tmp_path / 'swissBOUNDARIES3D.gpkg')
+    with pytest.raises(FileNotFoundError, match='swissBOUNDARIES3D.gpkg'):
+        RegionRegistry(zones_path, 'zones', missing)
+    RegionRegistry(zones_path, 'zones', boundaries_path)
+    assert list(RegionRegistry(zones_path, 'zones', missing).zone_ids('AI')) == [3, 4]
+    assert registry_path(zones_path) == str(tmp_path / 'zones.regions.npz')
@@ -0,0 +1,50 @@
+import pytest
+
+from src.batch import read_manifest, write_manifest
+from src.report import input_key, stale_regions
+
+PARAMS = {'radius_km': 2.0, 'top_k': 10, 'formats': ['pdf', 'png']}
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    paths = {name: tmp_path / name for name in ['zones.gpkg', 'stores.parquet', 'population.csv']}
+    for (name, path) in paths.items():
+        path.write_bytes(name.encode())
+    return {name: str(path) for (name, path) in paths.items()}
+
+
+def key(inputs, region='AI', params=PARAMS):
+    return input_key(region, params, inputs['zones.gpkg'], inputs['stores.parquet'], [inputs['population.csv']])
+
+
+def test_input_key_follows_the_inputs(inputs, tmp_path):
+    before = key(inputs)
+    assert key(inputs) == before
+    assert key(inputs, 'AR') != before
+    assert key(inputs, params=dict(PARAMS, top_k=20)) != before
+    with open(inputs['stores.parquet'], 'ab') as f:
+        f.write(b'new stores')
+    assert key(inputs) != before
+    # a missing optional input is skipped, and its arrival changes the key
+    without = input_key('AI', PARAMS, inputs['zones.gpkg'], inputs['stores.parquet'], [str(tmp_path / 'pop.tif')])
+    (tmp_path / 'pop.tif').write_bytes(b'raster')
+    assert input_key('AI', PARAMS, inputs['zones.gpkg'], inputs['stores.parquet'], [str(tmp_path / 'pop.tif')]) != without
+
+
+def test_only_changed_failed_or_missing_regions_are_rendered(tmp_path):
+    files = [tmp_path / 'ai_ranking.csv', tmp_path / 'ar_ranking.csv', tmp_path / 'sg_ranking.csv']
+    for path in files[:2]:
+        path.write_text('zone,score\n')
+    write_manifest({
+        'AI': {'key': 'k1', 'files': [str(files[0])], 'time': 0},
+        'AR': {'key': 'k2', 'files': [str(files[1])], 'time': 0},
+        'SG': {'key': 'k3', 'files': [str(files[2])], 'time': 0},   # deleted since
+        'ZG': {'error': 'Traceback ...', 'time': 0},
+    }, str(tmp_path))
+    manifest = read_manifest(str(tmp_path))
+    keys = {'AI': 'k1', 'AR': 'new', 'SG': 'k3', 'ZG': 'k4', 'ZH': 'k5'}
+    regions = ['ZH', 'AI', 'AR', 'SG', 'ZG']
+    assert stale_regions(regions, manifest, keys) == ['ZH', 'AR', 'SG', 'ZG']
+    assert stale_regions(regions, manifest, keys, force=True) == regions
+    assert stale_regions(['AI'], manifest, keys) == []
@@ -0,0 +1,115 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from scipy.sparse import csgraph
+
+import src.routing
+from src.routing import RoadGraph, _csr, _lower_bounds, landmark_times, travel_time_matrix
+
+
+def grid_graph(n=30, spacing_km=0.5, speed_kmh=30.0):
+    '''n x n street grid around Zurich, both directions'''
+    (lat, lon) = np.meshgrid(47.37 + np.arange(n) * spacing_km / 111.0,
+                             8.54 + np.arange(n) * spacing_km / 75.0, indexing='ij')
+    points = np.column_stack([lat.ravel(), lon.ravel()])
+    ids = np.arange(n * n).reshape(n, n)
+    (a, b) = (np.concatenate([ids[:, :-1].ravel(), ids[:-1, :].ravel()]),
+              np.concatenate([ids[:, 1:].ravel(), ids[1:, :].ravel()]))
+    seconds = np.full(len(a), spacing_km / speed_kmh * 3600.0)
+    graph = _csr(np.concatenate([a, b]), np.concatenate([b, a]), np.concatenate([seconds, seconds]), n * n)
+    return RoadGraph(points, {'drive': graph})
+
+
+def test_bounded_search_matches_full_dijkstra():
+    road = grid_graph()
+    rng = np.random.default_rng(0)
+    sources = road.points[rng.choice(len(road.points), 40, replace=False)]
+    targets = road.points[rng.choice(len(road.points), 7, replace=False)]
+    times = road.travel_times(sources, targets, 'drive', max_minutes=5.0, group=8)
+
+    (src, _) = road.snap(sources, 'drive')
+    (dst, _) = road.snap(targets, 'drive')
+    full = csgraph.dijkstra(road.graphs['drive'], indices=src)[:, dst] / 60.0
+    full[full > 5.0] = np.inf
+    assert np.isfinite(times).any() and not np.isfinite(times).all()
+    np.testing.assert_allclose(times, full)
+    # searched from the targets on the reversed graph
+    np.testing.assert_allclose(road.travel_times(targets, sources, 'drive', 5.0), full.T)
+
+
+def test_landmark_prune_is_exact_on_a_directed_graph():
+    # one-way streets alternating by row, and a fast one-way highway along the first row
+    road = grid_graph()
+    graph = road.graphs['drive'].tolil()
+    n = 30
+    for i in range(0, n, 2):
+        for j in range(n - 1):
+            graph[i * n + j + 1, i * n + j] = 0
+    for j in range(n - 1):
+        graph[j, j + 1] = 20.0   # 90 km/h
+    road = RoadGraph(road.points, {'drive': graph.tocsr()})
+    (times_from, times_to) = road.landmark_times('drive')
+    assert times_from.shape == (8, n * n) and times_to is not times_from
+    sources = road.points[[0, 5, 31, 450, 899]]
+    targets = road.points[::37]
+    (src, _) = road.snap(sources, 'drive')
+    (dst, _) = road.snap(targets, 'drive')
+    full = csgraph.dijkstra(road.graphs['drive'], indices=src)
+    # the bounds are below the travel times, and rule out part of the grid
+    bounds = _lower_bounds(times_from, times_to, src, np.arange(n * n))
+    assert (bounds <= full.min(axis=0) + 1e-3).all()
+    assert (bounds > 300.0).sum() > n * n / 2
+    full = full[:, dst] / 60.0
+    full[full > 5.0] = np.inf
+    np.testing.assert_allclose(road.travel_times(sources, targets, 'drive', 5.0, group=2), full)
+    # more origins than targets: searched on the reversed graph, with the landmark times swapped
+    back = csgraph.dijkstra(road.graphs['drive'], indices=dst)[:, src] / 60.0
+    back[back > 5.0] = np.inf
+    assert np.isfinite(back).any()
+    np.testing.assert_allclose(road.travel_times(targets, sources, 'drive', 5.0), back)
+    # along the highway to its end, which is far back against the one-way streets
+    times = road.travel_times(road.points[:20], road.points[[29]], 'drive', 10.0)
+    np.testing.assert_allclose(times[:, 0], (29 - np.arange(20)) * 20.0 / 60.0, rtol=1e-6)
+
+
+def test_landmarks_are_saved_with_the_graph(tmp_path):
+    road = grid_graph(n=10)
+    (times_from, times_to) = landmark_times(road.graphs['drive'], count=4)
+    assert times_to is times_from  # undirected
+    road.save(str(tmp_path / 'grid.graph.npz'))
+    loaded = RoadGraph.load(str(tmp_path / 'grid.graph.npz'))
+    np.testing.assert_array_equal(loaded.landmarks['drive'][0], road.landmark_times('drive')[0])
+    np.testing.assert_array_equal(loaded.landmarks['drive'][1], road.landmark_times('drive')[1])
+
+
+def test_travel_time_matrices_are_bounded_per_region(tmp_path, monkeypatch):
+    monkeypatch.setattr('src.preprocess.ARTIFACT_DIR', str(tmp_path))
+    monkeypatch.setattr(src.routing, 'MAX_CACHED', 2)
+    road = grid_graph(n=10)
+    osm = tmp_path / 'roads.osm.pbf'
+    osm.write_bytes(b'roads')
+    zones = gpd.GeoDataFrame(geometry=shapely.buffer(shapely.points(road.points[:3, ::-1]), 1e-4), crs=4326)
+    for i in range(4):
+        stores = pd.DataFrame(road.points[[10 + i, 50 + i]], columns=['Latitude', 'Longitude'])
+        times = travel_time_matrix('Zug', zones, stores, 'drive', 'ab' * 32, road, 5.0, str(osm))
+        assert times.shape == (3, 2)
+    assert len(list(tmp_path.glob('*times_drive_*.npy'))) == 2
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_from_osm_contracts_degree_two_nodes(monkeypatch):
+    # way 0: 1-2-3 (2 is a bend), way 1: 3-4 oneway, residential and footway
+    ids = np.array([1, 2, 3, 3, 4])
+    coords = np.array([[47.0, 8.0], [47.001, 8.0], [47.002, 8.0], [47.002, 8.0], [47.002, 8.001]])
+    highways = ['footway', 'residential']
+    monkeypatch.setattr('src.routing.read_ways', lambda path: (
+        ids, coords, np.array([0, 3, 5]), np.array([0, 1], dtype=np.int8), np.array([1, 0]), highways))
+    road = RoadGraph.from_osm('unused.pbf')
+    assert len(road.points) == 3                      # junctions 1, 3, 4
+    drive = road.graphs['drive'].toarray()
+    assert drive[0, 1] > 0 and drive[1, 0] > 0        # 1 <-> 3, bend summed in
+    assert drive[1, 2] == 0 and drive[2, 1] == 0      # footway: no car
+    walk = road.graphs['walk'].toarray()
+    assert walk[1, 2] > 0 and walk[2, 1] > 0          # oneway does not apply on foot
+    np.testing.assert_allclose(walk[0, 1], 0.2224 / 4.8 * 3600.0, rtol=1e-3)
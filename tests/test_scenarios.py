@@ -0,0 +1,58 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from src.proximity import haversine, proximity_features
+from src.scenarios import Scenario, ScenarioEngine
+
+
+def region(n=400, stores=30, seed=0):
+    rng = np.random.default_rng(seed)
+    (lon, lat) = (rng.uniform(8.4, 8.7, n), rng.uniform(47.3, 47.5, n))
+    zones = gpd.GeoDataFrame({'OeV_Erreichb_EW': rng.gamma(2.0, 1000.0, n)},
+                             geometry=shapely.buffer(shapely.points(lon, lat), 0.002), crs='EPSG:4326')
+    table = pd.DataFrame({'Place ID': ['P%d' % i for i in range(stores)], 'Name': 'store',
+                          'Latitude': rng.uniform(47.3, 47.5, stores), 'Longitude': rng.uniform(8.4, 8.7, stores),
+                          'Brand': np.where(np.arange(stores) % 3 == 0, 'Migros', 'Coop')})
+    return zones, table[table['Brand'] == 'Migros'].reset_index(drop=True), table[table['Brand'] != 'Migros'].reset_index(drop=True)
+
+
+def test_place_ids_are_not_reused():
+    scenario = Scenario('A')
+    (first, second) = (scenario.add_store('x', 47.0, 8.0), scenario.add_store('y', 47.0, 8.1))
+    scenario.remove_store(first)
+    third = scenario.add_store('z', 47.0, 8.2)
+    assert third not in (first, second)
+    scenario.remove_store(third)
+    assert list(scenario.added['Place ID']) == [second]
+    assert Scenario('A', added=scenario.added).add_store('w', 47.0, 8.3) == 'A:3'
+
+
+def test_incremental_evaluation_matches_full_recompute():
+    (zones, migros, comp) = region()
+    engine = ScenarioEngine(zones, migros, comp, radius_km=2.0)
+    scenario = Scenario('S')
+    scenario.add_store('new', 47.4, 8.55)
+    scenario.add_store('rival', 47.35, 8.45, brand='Coop')
+    scenario.remove_store(migros['Place ID'][0])
+    scenario.remove_store(comp['Place ID'][1])
+    result = engine.evaluate(scenario)
+
+    (m, c) = scenario.apply(migros, comp)
+    full = proximity_features(engine.points, m, c, 2.0, index=zones.index)
+    pd.testing.assert_frame_equal(result['features'][full.columns], full, check_dtype=False)
+    # zones outside the affected set keep their base features
+    changed = (full != engine.features[full.columns]).any(axis=1)
+    assert set(zones.index[changed]) <= set(result['affected'])
+
+    # affected: the dense definition
+    changed_stores = scenario.changed_stores(migros, comp)
+    expected = np.zeros(len(zones), dtype=bool)
+    for (kind, column) in [('migros', 'dist_migros_km'), ('comp', 'dist_comp_km')]:
+        points = changed_stores[kind]
+        d = haversine(engine.points[:, [0]], engine.points[:, [1]], points[:, 0], points[:, 1])
+        nearest = engine.features[column].to_numpy()[:, None]
+        expected |= ((d <= 2.0) | (d <= nearest * (1 + 1e-9))).any(axis=1)
+    np.testing.assert_array_equal(engine.affected(scenario), np.flatnonzero(expected))
+    assert engine.evaluate(scenario) is result
@@ -0,0 +1,52 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.scheduler import TaskFailed, TaskGraph
+
+
+def test_dependencies_run_first_and_independent_tasks_together():
+    graph = TaskGraph(ThreadPoolExecutor(4))
+    barrier = threading.Barrier(2, timeout=5)
+    (order, lock) = ([], threading.Lock())
+
+    def task(name, wait=False):
+        def run():
+            if wait:
+                barrier.wait()  # only passes if both sources run at the same time
+            with lock:
+                order.append(name)
+            return name
+        return run
+
+    graph.add('zones', task('zones', True))
+    graph.add('stores', task('stores', True))
+    graph.add('layer', task('layer'), depends=['zones', 'stores'])
+    graph.add('unused', task('unused'))
+    results = {name: (value, error) for (name, value, error) in graph.run(['layer'])}
+    assert results == {'zones': ('zones', None), 'stores': ('stores', None), 'layer': ('layer', None)}
+    assert order[-1] == 'layer'
+
+
+def test_failures_and_timeouts_propagate():
+    graph = TaskGraph(ThreadPoolExecutor(2), timeout=0.2)
+    graph.add('broken', lambda: 1 / 0)
+    graph.add('slow', lambda: time.sleep(1.0))
+    graph.add('a', lambda: 'a', depends=['broken'])
+    graph.add('b', lambda: 'b', depends=['slow'])
+    errors = {name: error for (name, _, error) in graph.run(['a', 'b'])}
+    assert isinstance(errors['broken'], ZeroDivisionError)
+    assert isinstance(errors['slow'], TimeoutError)
+    assert isinstance(errors['a'], TaskFailed) and isinstance(errors['b'], TaskFailed)
+
+
+def test_requirements():
+    graph = TaskGraph(ThreadPoolExecutor(1))
+    graph.add('a', None, depends=['b'])
+    graph.add('b', None)
+    assert graph.requirements(['a']) == ['b', 'a']
+    graph.add('b', None, depends=['a'])
+    with pytest.raises(ValueError, match='cycle'):
+        graph.requirements(['a'])
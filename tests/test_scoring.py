@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import pytest
+
+from src.scoring import FEATURES, REFRESH_UPDATES, SuitabilityScorer, normalize
+
+
+def table(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({column: rng.gamma(2.0, 10.0, n) for (column, _) in FEATURES.values()},
+                         index=pd.Index(np.arange(n) * 3 + 7, name='zone'))
+    frame.iloc[::50, 2] = np.inf      # no Migros at all
+    frame.iloc[::70, 1] = np.nan      # no population
+    return frame
+
+
+def full_score(features, weights):
+    (x, names, _) = normalize(features)
+    w = np.array([weights.get(name, 0.0) for name in names])
+    return x @ w / w.sum()
+
+
+def test_incremental_scores_match_a_full_computation():
+    features = table()
+    scorer = SuitabilityScorer(features)
+    rng = np.random.default_rng(1)
+    weights = {name: 1.0 for name in FEATURES}
+    for step in range(3 * REFRESH_UPDATES):
+        name = list(FEATURES)[rng.integers(len(FEATURES))]   # one slider moved at a time, as in the app
+        weights[name] = float(rng.random())
+        score = scorer.score(weights)
+        np.testing.assert_allclose(score.to_numpy(), full_score(features, weights), rtol=0, atol=1e-12)
+    assert (score.index == features.index).all() and score.between(0, 1).all()
+    # rows scaled with the bounds of the table score the same
+    np.testing.assert_allclose(scorer.score_rows(features.iloc[::7], weights), score.iloc[::7], atol=1e-12)
+    assert (scorer.score({}) == 0).all()
+
+
+def test_top_k_is_the_best_zones_best_first():
+    features = table()
+    scorer = SuitabilityScorer(features)
+    weights = {'pt': 0.2, 'population': 1.0, 'competition': 0.5}
+    top = scorer.top_k(10, weights)
+    expected = scorer.score(weights).sort_values(ascending=False, kind='stable').iloc[:10]
+    assert list(top.index) == list(expected.index)
+    assert (np.diff(top.to_numpy()) <= 0).all()
+    assert len(scorer.top_k(10_000, weights)) == len(features) and len(scorer.top_k(0, weights)) == 0
+    # the table of the app: scores next to the features of the same zones
+    candidates = pd.concat([top, features.loc[top.index]], axis=1)
+    assert list(candidates.columns[:2]) == ['score', 'OeV_Erreichb_EW'] and candidates.index.equals(top.index)
+
+
+@pytest.mark.skipif(not hasattr(go, 'Scattermapbox'), reason='plotly without mapbox traces')
+def test_top_layer_ranks_the_zones():
+    from src.maps import TOP_trace
+    top = pd.Series([0.9, 0.8], index=pd.Index([12, 5], name='zone'), name='score')
+    trace = TOP_trace(np.array([[47.0, 8.0], [47.1, 8.1]]), top)
+    assert list(trace.text) == ['1', '2']
+    assert list(trace.hovertext) == ['#1 zone 12: score 0.90', '#2 zone 5: score 0.80']
@@ -0,0 +1,31 @@
+import numpy as np
+import shapely
+
+from src.spatial_index import ZoneIndex
+
+
+def test_nearest_zone_concave():
+    # C-shaped zone whose centroid lies outside of it, and a small square
+    c_shape = shapely.Polygon([(0, 0), (1000, 0), (1000, 200), (200, 200), (200, 800), (1000, 800),
+                               (1000, 1000), (0, 1000)])
+    square = shapely.box(420, 480, 460, 520)
+    index = ZoneIndex([1, 2], [c_shape, square])
+    (x, y) = shapely.get_coordinates(c_shape.centroid)[0]
+    (ids, dist) = index.nearest_zone([x], [y], k=2, crs='EPSG:2056')
+    assert sorted(ids[0]) == [1, 2]
+    assert np.isfinite(dist).all()
+
+
+def test_nearest_zone_matches_brute_force():
+    rng = np.random.default_rng(1)
+    centres = rng.uniform(0, 10000, (60, 2))
+    zones = shapely.buffer(shapely.points(centres), rng.uniform(50, 400, 60))
+    index = ZoneIndex(np.arange(60) + 100, zones)
+    (x, y) = rng.uniform(-1000, 11000, (2, 200))
+    (ids, dist) = index.nearest_zone(x, y, k=4, crs='EPSG:2056')
+    brute = shapely.distance(shapely.points(x, y)[:, None], zones[None, :])
+    np.testing.assert_allclose(dist, np.sort(brute, axis=1)[:, :4])
+    np.testing.assert_array_equal(ids - 100, np.argsort(brute, axis=1, kind='stable')[:, :4])
+    # fewer zones than k
+    (ids, dist) = ZoneIndex([7], zones[:1]).nearest_zone(x[:3], y[:3], k=2, crs='EPSG:2056')
+    assert (ids[:, 1] == -1).all() and np.isinf(dist[:, 1]).all()
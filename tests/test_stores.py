@@ -0,0 +1,32 @@
+import geopandas as gpd
+import pandas as pd
+import pytest
+import shapely
+
+from src.stores import COMP_CSV, MIGROS_CSV, load_stores, store_files
+
+
+def test_no_catalog_only_for_the_fallback_region(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_stores('ZH', path=str(tmp_path / 'missing.parquet'))
+
+
+def test_store_files(tmp_path):
+    path = str(tmp_path / 'stores.parquet')
+    assert store_files('AI', path) == [MIGROS_CSV, COMP_CSV]
+    assert store_files('ZH', path) == [path]
+    open(path, 'wb').close()
+    assert store_files('AI', path) == [path]
+
+
+def test_stores_around_the_region(tmp_path):
+    path = str(tmp_path / 'stores.parquet')
+    pd.DataFrame({
+        'Place ID': ['in', 'border', 'far'], 'Name': ['Migros A', 'Coop B', 'Coop C'],
+        'Latitude': [47.40, 47.40, 47.40], 'Longitude': [8.50, 8.62, 9.50],
+        'Address': '', 'Brand': ['Migros', 'Coop', 'Coop'], 'zone': [1, 2, 3],
+    }).to_parquet(path)
+    zones = gpd.GeoDataFrame(geometry=[shapely.box(8.45, 47.35, 8.55, 47.45)], index=[1], crs='EPSG:4326')
+    (migros, comp) = load_stores('ZH', zones, path, buffer_km=10.0)
+    assert list(migros['Place ID']) == ['in']
+    assert list(comp['Place ID']) == ['border']